@@ -19,7 +19,70 @@ import os
 import traceback
 
 from container_crawler import ContainerCrawler
-from .daemon_utils import load_swift, setup_context, setup_logger
+from .daemon_utils import (load_swift, setup_context, setup_logger,
+                           get_process_count, Supervisor)
+
+
+METRICS_FILE = 'metrics'
+
+
+def shard_conf(conf, index, processes):
+    '''Returns the configuration of the worker process with the given index.
+
+    The sync mappings are distributed round-robin between the processes, so
+    that every container is handled by exactly one of them.
+    '''
+    shard = dict(conf)
+    shard['containers'] = [
+        mapping for i, mapping in enumerate(conf.get('containers', []))
+        if i % processes == index]
+    return shard
+
+
+def get_metrics_file(conf, index=None):
+    '''Returns the location of the Prometheus metrics file of the process,
+    if the metrics file is enabled.'''
+    if not conf.get('prometheus_metrics'):
+        return None
+    if index is None:
+        name = METRICS_FILE
+    else:
+        name = '%s.%d' % (METRICS_FILE, index)
+    return os.path.join(conf['status_dir'], name + '.prom')
+
+
+def remove_stale_metrics_files(conf, processes):
+    '''Removes the metrics files that the current processes do not write
+    (e.g. after lowering the number of processes), so that their metrics are
+    no longer scraped.'''
+    if not conf.get('prometheus_metrics'):
+        return
+    if processes == 1:
+        current = set([get_metrics_file(conf)])
+    else:
+        current = set(get_metrics_file(conf, index)
+                      for index in range(processes))
+    prefix = METRICS_FILE + '.'
+    for entry in os.listdir(conf['status_dir']):
+        if not entry.startswith(prefix) or not entry.endswith('.prom'):
+            continue
+        index = entry[len(prefix):-len('.prom')]
+        location = os.path.join(conf['status_dir'], entry)
+        if (not index or index.isdigit()) and location not in current:
+            os.unlink(location)
+
+
+def run_crawler(conf, handler_class, logger, once):
+    try:
+        crawler = ContainerCrawler(conf, handler_class, logger)
+        if once:
+            crawler.run_once()
+        else:
+            crawler.run_always()
+    except Exception as e:
+        logger.error("S3Sync failed: %s" % repr(e))
+        logger.error(traceback.format_exc(e))
+        exit(1)
 
 
 def main():
@@ -31,6 +94,8 @@ def main():
     setup_logger(logger_name, conf)
     load_swift(logger_name, args.once)
 
+    from .bandwidth import set_process_limiter
+    from .stats import SYNC_METRICS
     from .sync_container import SyncContainer
     logger = logging.getLogger(logger_name)
     logger.debug('Starting S3Sync')
@@ -42,15 +107,26 @@ def main():
         logger.debug('Using HTTPS proxy %r', conf['https_proxy'])
         os.environ['https_proxy'] = conf['https_proxy']
 
-    try:
-        crawler = ContainerCrawler(conf, SyncContainer, logger)
-        if args.once:
-            crawler.run_once()
-        else:
-            crawler.run_always()
-    except Exception as e:
-        logger.error("S3Sync failed: %s" % repr(e))
-        logger.error(traceback.format_exc(e))
+    set_process_limiter(conf)
+
+    processes = 1
+    if args.processes:
+        processes = get_process_count(args.processes)
+    remove_stale_metrics_files(conf, processes)
+    if processes == 1:
+        SYNC_METRICS.configure(conf, get_metrics_file(conf))
+        run_crawler(conf, SyncContainer, logger, args.once)
+        SYNC_METRICS.write()
+        return
+
+    def _run_worker(index):
+        SYNC_METRICS.configure(conf, get_metrics_file(conf, index))
+        run_crawler(shard_conf(conf, index, processes), SyncContainer,
+                    logger, args.once)
+        SYNC_METRICS.write()
+
+    logger.info('Starting %d S3Sync processes' % processes)
+    if Supervisor(processes, _run_worker, logger).run(args.once):
         exit(1)
 
 
@@ -0,0 +1,185 @@
+"""
+Copyright 2018 SwiftStack
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import collections
+import eventlet
+import json
+import os
+import random
+import socket
+import time
+
+from swift.common.swob import Request
+from swift.common.utils import close_if_possible
+
+from .utils import get_internal_account
+
+# The accesses of the objects of a container are recorded in
+# <container>+access in the internal account, with an object per proxy server
+# process
+ACCESS_CONTAINER_SUFFIX = '+access'
+DEFAULT_SAMPLE_RATE = 1.0
+# How often (in seconds) the accesses of a container are written out
+DEFAULT_FLUSH_INTERVAL = 60
+# Maximum number of objects tracked per container; the least recently
+# accessed ones are dropped first
+MAX_TRACKED_OBJECTS = 10000
+
+
+def get_access_container(container):
+    return container + ACCESS_CONTAINER_SUFFIX
+
+
+class ContainerAccesses(object):
+    def __init__(self, window):
+        self.window = window
+        # object name -> [sampled access count, time of the last access]
+        self.objects = collections.OrderedDict()
+        self.dirty = False
+
+    def record(self, obj, now):
+        entry = self.objects.pop(obj, [0, 0])
+        entry[0] += 1
+        entry[1] = now
+        self.objects[obj] = entry
+        if len(self.objects) > MAX_TRACKED_OBJECTS:
+            self.objects.popitem(last=False)
+        self.dirty = True
+
+    def expire(self, now):
+        '''Drops the objects that were not accessed within the window.'''
+        while self.objects:
+            obj, (_, last_access) = next(self.objects.iteritems())
+            if last_access >= now - self.window:
+                break
+            del self.objects[obj]
+
+
+class AccessTracker(object):
+    '''Tracks the reads of the objects in the containers whose profiles set
+    access_window (in seconds), so that the sync process does not archive
+    the objects that were read within the window.
+
+    The reads are sampled and kept in memory. Every flush_interval seconds,
+    a background greenthread writes the new accesses of each container to an
+    object in the <container>+access container of the internal (hidden)
+    account, which expires once its entries fall out of the window.
+    '''
+    def __init__(self, app, logger, sample_rate=DEFAULT_SAMPLE_RATE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.app = app
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+        self.containers = {}
+        # The tracker is created before the proxy forks, so the writer name
+        # and the flushing greenthread are set up on the first read
+        self._writer = None
+        self._flusher = None
+
+    @property
+    def writer(self):
+        if self._writer is None:
+            self._writer = '%s-%d' % (socket.gethostname(), os.getpid())
+        return self._writer
+
+    def record(self, sync_profile, version, account, container, obj):
+        '''Records a read of the object, if the profile tracks accesses.
+
+        :param version, account, container, obj: the (UTF-8 encoded) parts of
+                                                 the path of the object.
+        '''
+        window = int(sync_profile.get('access_window', 0))
+        if not window or random.random() >= self.sample_rate:
+            return
+        key = (version, account, container)
+        accesses = self.containers.get(key)
+        if accesses is None:
+            accesses = self.containers[key] = ContainerAccesses(window)
+        accesses.record(obj.decode('utf-8'), time.time())
+        if self._flusher is None:
+            self._flusher = eventlet.spawn(self._run_flusher)
+
+    def _run_flusher(self):
+        while True:
+            eventlet.sleep(self.flush_interval)
+            self._flush_all()
+
+    def _flush_all(self):
+        '''Writes out the accesses of the containers that were read since
+        their last flush.'''
+        for key, accesses in self.containers.items():
+            self._flush(key, accesses)
+
+    def _flush(self, key, accesses):
+        version, account, container = key
+        container_path = '/'.join(
+            ['', version, get_internal_account(account),
+             get_access_container(container)])
+        try:
+            now = time.time()
+            accesses.expire(now)
+            if not accesses.dirty:
+                return
+            accesses.dirty = False
+            body = json.dumps(accesses.objects)
+            # Once all of the entries are out of the window, the object is
+            # no longer needed
+            headers = {'X-Delete-After': str(
+                accesses.window + self.flush_interval),
+                'Content-Type': 'application/json'}
+            for attempt in range(2):
+                resp = Request.blank(
+                    '/'.join([container_path, self.writer]), method='PUT',
+                    headers=headers, body=body).get_response(self.app)
+                close_if_possible(resp.app_iter)
+                if resp.status_int != 404 or attempt:
+                    break
+                resp = Request.blank(container_path, method='PUT'
+                                     ).get_response(self.app)
+                close_if_possible(resp.app_iter)
+            if not resp.is_success:
+                accesses.dirty = True
+                self.logger.warning('Failed to record the accesses in %s: %s'
+                                    % (container_path, resp.status))
+        except Exception:
+            accesses.dirty = True
+            self.logger.exception('Failed to record the accesses in %s' %
+                                  container_path)
+
+
+def load_access_times(swift_client, account, container):
+    '''Returns the time of the last recorded read of each object in the
+    container (object name -> timestamp), merged across the proxies.'''
+    internal_account = get_internal_account(account)
+    access_container = get_access_container(container)
+    access_times = {}
+    for entry in swift_client.iter_objects(internal_account, access_container):
+        _, _, body = swift_client.get_object(
+            internal_account, access_container, entry['name'], {},
+            acceptable_statuses=(2, 404))
+        try:
+            data = ''.join(body)
+        finally:
+            close_if_possible(body)
+        try:
+            objects = json.loads(data)
+        except ValueError:
+            continue
+        for obj, (_, last_access) in objects.items():
+            if last_access > access_times.get(obj, 0):
+                access_times[obj] = last_access
+    return access_times
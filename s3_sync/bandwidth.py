@@ -0,0 +1,166 @@
+"""
+Copyright 2018 SwiftStack
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import eventlet
+import json
+import time
+
+from swift.common.utils import close_if_possible
+
+
+# The settings of a bandwidth limit, which may be set for a sync or migration
+# profile (applies to its destination) or for the process as a whole:
+#   bandwidth_limit -- bytes per second; 0 (default) means no limit
+#   bandwidth_burst -- bytes that may be sent above the limit after a period
+#                      of inactivity; defaults to one second worth of data
+#   bandwidth_schedule -- list of {"start": "HH:MM", "end": "HH:MM",
+#                         "limit": <bytes per second>} entries, which override
+#                         the limit during that (local) time of the day
+BANDWIDTH_SETTINGS = ('bandwidth_limit', 'bandwidth_burst',
+                      'bandwidth_schedule')
+
+_process_limiter = None
+_endpoint_limiters = {}
+
+
+class TokenBucket(object):
+    '''Allows rate units per second on average, with bursts of up to burst
+    units.
+
+    A consumer that takes more than what is in the bucket goes into debt and
+    sleeps until the debt is repaid.
+    '''
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.last_update = time.time()
+
+    def _refill(self, now):
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.last_update) * self.rate)
+        self.last_update = now
+
+    def set_rate(self, rate, burst=None):
+        self._refill(time.time())
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = min(self.tokens, self.burst)
+
+    def consume(self, amount):
+        self._refill(time.time())
+        self.tokens -= amount
+        if self.tokens < 0:
+            eventlet.sleep(-self.tokens / float(self.rate))
+
+
+def _parse_time_of_day(value):
+    hours, minutes = value.split(':')
+    hours = int(hours)
+    minutes = int(minutes)
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError('Invalid time of day: %s' % value)
+    return hours * 60 + minutes
+
+
+class BandwidthLimiter(object):
+    def __init__(self, limit=0, burst=None, schedule=None):
+        self.limit = int(limit or 0)
+        self.burst = int(burst) if burst else None
+        self.schedule = [
+            (_parse_time_of_day(entry['start']),
+             _parse_time_of_day(entry['end']),
+             int(entry['limit']))
+            for entry in schedule or []]
+        self.bucket = None
+
+    def get_limit(self, now=None):
+        local_time = time.localtime(now)
+        minute = local_time.tm_hour * 60 + local_time.tm_min
+        for start, end, limit in self.schedule:
+            if start <= end:
+                in_window = start <= minute < end
+            else:
+                # The window spans midnight
+                in_window = minute >= start or minute < end
+            if in_window:
+                return limit
+        return self.limit
+
+    def consume(self, amount):
+        limit = self.get_limit()
+        if not limit:
+            return
+        if self.bucket is None:
+            self.bucket = TokenBucket(limit, self.burst)
+        elif self.bucket.rate != limit:
+            self.bucket.set_rate(limit, self.burst)
+        self.bucket.consume(amount)
+
+
+def create_limiter(conf):
+    '''Returns the BandwidthLimiter for the bandwidth settings in the
+    dictionary, or None if there are none.'''
+    if not any(conf.get(setting) for setting in BANDWIDTH_SETTINGS):
+        return None
+    return BandwidthLimiter(conf.get('bandwidth_limit'),
+                            conf.get('bandwidth_burst'),
+                            conf.get('bandwidth_schedule'))
+
+
+def set_process_limiter(conf):
+    '''Sets the limit shared by all of the transfers in this process.'''
+    global _process_limiter
+    _process_limiter = create_limiter(conf)
+
+
+def get_limiters(settings):
+    '''Returns the limiters that apply to the transfers of a profile: the
+    limit of its endpoint (shared by the profiles with the same endpoint and
+    limits) and the process-wide limit.'''
+    limiters = []
+    limit_conf = dict((setting, settings[setting])
+                      for setting in BANDWIDTH_SETTINGS
+                      if settings.get(setting))
+    if limit_conf:
+        key = (settings.get('aws_endpoint'),
+               json.dumps(limit_conf, sort_keys=True))
+        if key not in _endpoint_limiters:
+            _endpoint_limiters[key] = create_limiter(limit_conf)
+        limiters.append(_endpoint_limiters[key])
+    if _process_limiter:
+        limiters.append(_process_limiter)
+    return limiters
+
+
+class RateLimitedIter(object):
+    '''Iterates over the chunks of a body within the bandwidth limits.'''
+    def __init__(self, iterable, limiters):
+        self.iterable = iterable
+        self.iterator = iter(iterable)
+        self.limiters = limiters
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        chunk = next(self.iterator)
+        for limiter in self.limiters:
+            limiter.consume(len(chunk))
+        return chunk
+
+    def close(self):
+        close_if_possible(self.iterable)
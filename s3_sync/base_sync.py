@@ -17,9 +17,12 @@ limitations under the License.
 import eventlet
 import logging
 
+from s3_sync import bandwidth
+from s3_sync.stats import SYNC_METRICS
 from s3_sync.utils import filter_hop_by_hop_headers
 
 from swift.common import swob
+from swift.common.internal_client import UnexpectedResponse
 
 
 def match_item(metadata, matchdict):
@@ -90,6 +93,38 @@ class ProviderResponse(object):
         raise ValueError('reraise had no prior exception for %s' % me_as_a_str)
 
 
+class ClientPoolRegistry(object):
+    """Shares the HTTP client pools between the providers that use the same
+    destination and credentials.
+
+    The pool of a destination caps the number of concurrent requests to it,
+    regardless of how many providers (e.g. one per synced container) use it.
+    The cap is the "destination_max_conns" setting, if set. Otherwise, every
+    mapping that uses the destination adds its max_conns to the cap.
+    """
+
+    def __init__(self):
+        self.pools = {}
+        # Pool key -> the mappings that contributed to the pool size; None
+        # for the pools with a fixed size.
+        self.mappings = {}
+
+    def get(self, key, mapping, create, max_conns,
+            destination_max_conns=None):
+        if key not in self.pools:
+            if destination_max_conns is None:
+                self.pools[key] = create(max_conns)
+                self.mappings[key] = set([mapping])
+            else:
+                self.pools[key] = create(int(destination_max_conns))
+                self.mappings[key] = None
+        elif self.mappings[key] is not None and \
+                mapping not in self.mappings[key]:
+            self.mappings[key].add(mapping)
+            self.pools[key].grow(max_conns)
+        return self.pools[key]
+
+
 class BaseSync(object):
     """Generic base class that each provider must implement.
 
@@ -99,6 +134,10 @@ class BaseSync(object):
     """
 
     HTTP_CONN_POOL_SIZE = 1
+    # The settings that determine how the clients are created; providers
+    # with the same values can share clients.
+    CLIENT_SETTINGS = ('aws_endpoint', 'aws_identity', 'aws_secret',
+                       'aws_bucket')
     SLO_WORKERS = 10
     SLO_QUEUE_SIZE = 100
     MB = 1024 * 1024
@@ -133,16 +172,26 @@ class BaseSync(object):
             self.get_semaphore = eventlet.semaphore.Semaphore(max_conns)
             self.client_pool = self._create_pool(client_factory, max_conns)
 
-        def _create_pool(self, client_factory, max_conns):
+        @staticmethod
+        def _get_client_count(max_conns):
             clients = max_conns / BaseSync.HTTP_CONN_POOL_SIZE
             if max_conns % BaseSync.HTTP_CONN_POOL_SIZE:
                 clients += 1
-            self.pool_size = clients
+            return clients
+
+        def _create_pool(self, client_factory, max_conns):
+            self.pool_size = self._get_client_count(max_conns)
             self.client_factory = client_factory
             # The pool is lazy-populated on every get request, up to the
             # calculated pool_size
             return []
 
+        def grow(self, max_conns):
+            '''Allows max_conns more concurrent connections.'''
+            self.pool_size += self._get_client_count(max_conns)
+            for _ in range(max_conns):
+                self.get_semaphore.release()
+
         def get_client(self):
             # SLO uploads may exhaust the client pool and we will need to wait
             # for connections
@@ -167,7 +216,7 @@ class BaseSync(object):
             return self.get_semaphore.balance
 
     def __init__(self, settings, max_conns=10, per_account=False, logger=None,
-                 extra_headers=None):
+                 extra_headers=None, client_pools=None):
         """Base class that every Cloud Sync provider implementation should
         derive from. Sets up the client pool for the provider and the common
         settings.
@@ -186,6 +235,11 @@ class BaseSync(object):
         extra_headers -- optional extra headers to send with every request; not
                          meant to be used outside of specific applications,
                          like cloud-connector's usage of providers.
+        client_pools -- optional ClientPoolRegistry to share the client pool
+                        with other providers for the same destination. The
+                        shared pool allows the "destination_max_conns"
+                        setting concurrent requests or, if it is not set,
+                        the sum of max_conns of the mappings that share it.
         """
 
         self.settings = settings
@@ -213,8 +267,42 @@ class BaseSync(object):
         else:
             self.use_custom_prefix = True
             self.custom_prefix = self.custom_prefix.strip('/')
-        self.client_pool = self.HttpClientPool(
-            self._get_client_factory(), max_conns)
+        self._shared_pool = client_pools is not None
+        if client_pools is None:
+            self.client_pool = self.HttpClientPool(
+                self._get_client_factory(), max_conns)
+        else:
+            self.client_pool = client_pools.get(
+                self.client_pool_key, self._get_mapping_key(),
+                lambda pool_size: self.HttpClientPool(
+                    self._get_client_factory(), pool_size),
+                max_conns, settings.get('destination_max_conns'))
+
+    @property
+    def client_pool_key(self):
+        '''Identifies the destination (endpoint and credentials) of the
+        provider. The providers with the same key share a client pool.'''
+        return (self.__class__.__name__,
+                tuple(self.settings.get(field)
+                      for field in self.CLIENT_SETTINGS),
+                tuple(sorted(self.extra_headers.items())))
+
+    def _get_mapping_key(self):
+        # All of the containers of a per-account mapping are one mapping
+        container = '/*' if self._per_account else self.container
+        return (self.account, container, self.aws_bucket)
+
+    def _timed(self, op, is_expected=None):
+        '''Records the latency of a request in the sync metrics.'''
+        return SYNC_METRICS.timer(op, is_expected)
+
+    @staticmethod
+    def _is_internal_not_found(error):
+        return isinstance(error, UnexpectedResponse) and \
+            '404 Not Found' in error.message
+
+    def _get_bandwidth_limiters(self):
+        return bandwidth.get_limiters(self.settings)
 
     def __repr__(self):
         return '<%s: %s/%s>' % (
@@ -261,6 +349,11 @@ class BaseSync(object):
     def shunt_post(self, request, swift_key):
         raise NotImplementedError()
 
+    def presign_object(self, swift_key, expires):
+        '''Returns a URL that allows anyone to GET the remote object for the
+        given number of seconds.'''
+        raise NotImplementedError()
+
     def shunt_delete(self, request, swift_key):
         raise NotImplementedError()
 
@@ -280,6 +373,9 @@ class BaseSync(object):
         raise NotImplementedError()
 
     def close(self):
+        if self._shared_pool:
+            # Shared clients are kept for the lifetime of the process
+            return
         for client in self.client_pool.client_pool:
             client.acquire()
             self._close_conn(client.client)
@@ -19,13 +19,18 @@ from distutils.version import LooseVersion
 import json
 import logging
 import logging.handlers
+import multiprocessing
 import os
+import signal
 import sys
 import time
+import traceback
 
 
 MAX_LOG_SIZE = 100 * 1024 * 1024
 MIN_SWIFT_VERSION = LooseVersion('2.13')
+# A worker process is not restarted more often than this (in seconds)
+MIN_RESTART_INTERVAL = 10
 
 
 def setup_logger(logger_name, config):
@@ -51,6 +56,16 @@ def setup_logger(logger_name, config):
         logger.addHandler(handler)
 
 
+def _get_log_handlers(handler_type):
+    '''Returns the (logger, handler) pairs of all of the loggers.'''
+    loggers = [logging.getLogger()] + [
+        logger for logger in logging.Logger.manager.loggerDict.values()
+        if isinstance(logger, logging.Logger)]
+    return [(logger, handler) for logger in loggers
+            for handler in logger.handlers
+            if isinstance(handler, handler_type)]
+
+
 def load_swift(logger_name, once=False):
     logger = logging.getLogger(logger_name)
 
@@ -85,6 +100,9 @@ def parse_args(args, description):
                         help='logging level; defaults to info')
     parser.add_argument('--console', action='store_true',
                         help='log messages to console')
+    parser.add_argument('--processes', metavar='N', type=str,
+                        help='number of worker processes to fork ("auto" '
+                        'for the CPU count); defaults to a single process')
     return parser.parse_args(args)
 
 
@@ -96,3 +114,166 @@ def setup_context(description='Swift-S3 synchronization daemon'):
 
     conf = load_config(args.config)
     return args, conf
+
+
+def get_process_count(value):
+    '''Parses a number of processes setting; "auto" is the CPU count.'''
+    if value == 'auto':
+        return multiprocessing.cpu_count()
+    count = int(value)
+    if count < 1:
+        raise ValueError('Number of processes must be positive: %r' % value)
+    return count
+
+
+class Supervisor(object):
+    '''Forks a number of worker processes and keeps them running.
+
+    Every worker calls target(index), with its index in [0, processes). A
+    worker that exits is restarted, unless we are running once, in which
+    case the supervisor returns once all of the workers are done.
+
+    The log files are rotated by the supervisor: the workers re-open them
+    once they are rotated.
+    '''
+    def __init__(self, processes, target, logger, interval=1,
+                 restart_interval=MIN_RESTART_INTERVAL):
+        self.processes = processes
+        self.target = target
+        self.logger = logger
+        self.interval = interval
+        self.restart_interval = restart_interval
+        self.children = {}
+        self.start_times = {}
+        self.stopping = False
+
+    def _spawn(self, index):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                self._reset_eventlet()
+                self._reopen_log_files()
+                self.target(index)
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else 1
+            except BaseException:
+                self.logger.error('Worker %d failed: %s' % (
+                    index, traceback.format_exc()))
+                status = 1
+            finally:
+                os._exit(status)
+        self.logger.debug('Started worker %d (pid %d)' % (index, pid))
+        self.children[pid] = index
+        self.start_times[index] = time.time()
+
+    @staticmethod
+    def _reset_eventlet():
+        # The child must not share the parent's hub (and its poll file
+        # descriptors).
+        if 'eventlet.hubs' in sys.modules:
+            import eventlet.hubs
+            eventlet.hubs.use_hub()
+
+    @staticmethod
+    def _reopen_log_files():
+        # Multiple processes must not rotate the same log file. The workers
+        # replace the handlers they inherited with ones that follow the
+        # rotations done by the supervisor.
+        replaced = {}
+        for logger, handler in _get_log_handlers(
+                logging.handlers.RotatingFileHandler):
+            if handler not in replaced:
+                new_handler = logging.handlers.WatchedFileHandler(
+                    handler.baseFilename)
+                new_handler.setFormatter(handler.formatter)
+                new_handler.setLevel(handler.level)
+                handler.close()
+                replaced[handler] = new_handler
+            logger.removeHandler(handler)
+            logger.addHandler(replaced[handler])
+
+    @staticmethod
+    def _rotate_log_files():
+        handlers = set(handler for _, handler in _get_log_handlers(
+            logging.handlers.RotatingFileHandler))
+        for handler in handlers:
+            try:
+                size = os.path.getsize(handler.baseFilename)
+            except OSError:
+                continue
+            if not handler.maxBytes or size < handler.maxBytes:
+                continue
+            handler.acquire()
+            try:
+                handler.doRollover()
+            finally:
+                handler.release()
+
+    def _reap(self):
+        exited = []
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError:
+                break
+            if not pid:
+                break
+            if pid not in self.children:
+                continue
+            index = self.children.pop(pid)
+            if os.WIFSIGNALED(status):
+                code = -os.WTERMSIG(status)
+            else:
+                code = os.WEXITSTATUS(status)
+            exited.append((index, pid, code))
+        return exited
+
+    def stop(self, signum=signal.SIGTERM, *args):
+        self.stopping = True
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    def run(self, once=False, callback=None):
+        '''Runs the workers; returns 0 if all of them exited cleanly.
+
+        :param callback: called periodically in the supervisor, e.g. to
+                         aggregate the status of the workers.
+        '''
+        old_handlers = dict(
+            (signum, signal.signal(signum, self.stop))
+            for signum in (signal.SIGTERM, signal.SIGINT))
+        failed = False
+        restarts = {}
+        try:
+            for index in range(self.processes):
+                self._spawn(index)
+            while self.children or (restarts and not self.stopping):
+                for index, pid, code in self._reap():
+                    if code:
+                        failed = True
+                        self.logger.error(
+                            'Worker %d (pid %d) exited with status %d' % (
+                                index, pid, code))
+                    if not once and not self.stopping:
+                        restarts[index] = \
+                            self.start_times[index] + self.restart_interval
+                now = time.time()
+                for index, start_time in restarts.items():
+                    if start_time <= now and not self.stopping:
+                        del restarts[index]
+                        self._spawn(index)
+                if callback:
+                    callback()
+                self._rotate_log_files()
+                time.sleep(self.interval)
+        finally:
+            self.stop()
+            for signum, handler in old_handlers.items():
+                signal.signal(signum, handler)
+        return 1 if failed else 0
@@ -19,26 +19,33 @@ import eventlet.corolocal
 import eventlet.pools
 eventlet.patcher.monkey_patch(all=True)
 
-from collections import namedtuple
+from collections import deque, namedtuple
 import datetime
 import errno
+import hashlib
 import json
 import logging
 import os
+import re
+import shutil
 import sys
 import tempfile
 import time
 import traceback
 
 from container_crawler.utils import create_internal_client
-from .daemon_utils import load_swift, setup_context, setup_logger
+from .bandwidth import (BANDWIDTH_SETTINGS, RateLimitedIter, get_limiters,
+                        set_process_limiter)
+from .daemon_utils import (load_swift, setup_context, setup_logger,
+                           get_process_count, Supervisor)
 from .provider_factory import create_provider
-from .stats import MigratorPassStats
+from .stats import MIGRATOR_METRICS, MigratorPassStats
 from .utils import (convert_to_local_headers, convert_to_swift_headers,
                     get_container_headers, iter_listing, RemoteHTTPError,
-                    SWIFT_TIME_FMT, diff_container_headers,
-                    get_sys_migrator_header, MigrationContainerStates,
-                    diff_account_headers)
+                    diff_container_headers, get_sys_migrator_header,
+                    MigrationContainerStates, diff_account_headers,
+                    diff_listings, parse_list_time, ListingDiffActions, EPOCH,
+                    get_slo_etag, SLO_HEADER)
 from swift.common.http import HTTP_NOT_FOUND, HTTP_CONFLICT
 from swift.common import swob
 from swift.common.internal_client import UnexpectedResponse
@@ -49,10 +56,42 @@ EQUAL = 0
 ETAG_DIFF = 1
 TIME_DIFF = 2
 LAST_MODIFIED_FMT = '%a, %d %b %Y %H:%M:%S %Z'
-EPOCH = datetime.datetime.utcfromtimestamp(0)
 LOGGER_NAME = 'swift-s3-migrator'
 
-IGNORE_KEYS = set(('status', 'aws_secret', 'all_buckets', 'custom_prefix'))
+IGNORE_KEYS = set(('status', 'aws_secret', 'all_buckets', 'custom_prefix',
+                   'large_object_threshold', 'segment_size',
+                   'segment_workers', 'align_segments', 'checkpoint_keys',
+                   'checkpoint_interval', 'progress_interval', 'weight') +
+                  BANDWIDTH_SETTINGS)
+
+# How often the marker is persisted during a pass
+DEFAULT_CHECKPOINT_KEYS = 10000
+DEFAULT_CHECKPOINT_INTERVAL = 60
+
+# How often the progress of a pass is reported in the status and the metrics
+DEFAULT_PROGRESS_INTERVAL = 30
+# The number of finished passes kept in the status of a migration
+PASS_HISTORY_LENGTH = 10
+
+# Backoff (in seconds) for retrying the objects that failed to migrate
+DEFAULT_RETRY_INTERVAL = 60
+DEFAULT_MAX_RETRY_INTERVAL = 24 * 60 * 60
+DEFAULT_MAX_RETRY_ATTEMPTS = 10
+RETRY_JOURNAL_SUFFIX = 'retry'
+METRICS_SUFFIX = 'prom'
+
+# Settings for converting large source objects into SLOs
+DEFAULT_SEGMENT_SIZE = 1024 * 1024 * 1024
+MAX_SEGMENT_SIZE = 5 * 1024 * 1024 * 1024
+DEFAULT_SEGMENT_WORKERS = 5
+SEGMENT_RETRIES = 3
+SLO_SYSMETA_ETAG = 'x-object-sysmeta-slo-etag'
+SLO_SYSMETA_SIZE = 'x-object-sysmeta-slo-size'
+# The ETag and size of a source object that was migrated as an SLO, used to
+# check the object on subsequent passes
+SOURCE_SYSMETA_ETAG = 'x-object-sysmeta-multi-cloud-source-etag'
+SOURCE_SYSMETA_SIZE = 'x-object-sysmeta-multi-cloud-source-size'
+MPU_ETAG_RE = re.compile('^[0-9a-f]+-(\d+)$')
 
 MigrateObjectWork = namedtuple('MigrateObjectWork', 'aws_bucket container key')
 UploadObjectWork = namedtuple('UploadObjectWork', 'container key object '
@@ -63,6 +102,10 @@ class MigrationError(Exception):
     pass
 
 
+class ObjectNotFound(MigrationError):
+    pass
+
+
 class ContainerNotFound(Exception):
     def __init__(self, account, container, *args, **kwargs):
         self.account = account
@@ -92,10 +135,8 @@ def equal_migration(left, right):
 
 
 def cmp_object_entries(left, right):
-    local_time = datetime.datetime.strptime(
-        left['last_modified'], SWIFT_TIME_FMT)
-    remote_time = datetime.datetime.strptime(
-        right['last_modified'], SWIFT_TIME_FMT)
+    local_time = parse_list_time(left['last_modified'])
+    remote_time = parse_list_time(right['last_modified'])
     if local_time == remote_time:
         if left['hash'] == right['hash']:
             return 0
@@ -112,10 +153,11 @@ def cmp_meta(dest, source):
 
 
 def _update_status_counts(status, moved_count, scanned_count, bytes_count,
-                          reset):
+                          reset, pass_finished=True):
     """
     Update counts and finished keys in status. On reset copy existing counts
-    to last_ counts if they've changed.
+    to last_ counts if they've changed. The finished key is only updated at the
+    end of a pass (and not for the checkpoints taken during the pass).
     """
     now = time.time()
     if reset:
@@ -146,8 +188,9 @@ def _update_status_counts(status, moved_count, scanned_count, bytes_count,
         status['scanned_count'] = status.get('scanned_count', 0) + \
             scanned_count
         status['bytes_count'] = status.get('bytes_count', 0) + bytes_count
-    # this is the end of this current pass
-    status['finished'] = now
+    if pass_finished:
+        # this is the end of this current pass
+        status['finished'] = now
 
 
 def _create_x_timestamp_from_hdrs(hdrs, use_x_timestamp=True):
@@ -160,6 +203,42 @@ def _create_x_timestamp_from_hdrs(hdrs, use_x_timestamp=True):
     return None
 
 
+def _write_json_file(location, content):
+    def _writeout():
+        # TODO: if we are killed while writing out the file, we may litter
+        # these temp files. We should add a cleanup step at some point.
+        with tempfile.NamedTemporaryFile(
+                dir=os.path.dirname(location), delete=False) as tmp_fh:
+            json.dump(content, tmp_fh)
+        os.rename(tmp_fh.name, location)
+
+    try:
+        _writeout()
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            os.mkdir(os.path.dirname(location), 0755)
+            _writeout()
+        else:
+            raise
+
+
+def aggregate_status(status_file, worker_status_files):
+    '''Combines the status files of the worker processes into one.
+
+    The workers handle disjoint sets of migrations and containers, so their
+    status lists are concatenated.
+    '''
+    status_list = []
+    for location in worker_status_files:
+        try:
+            with open(location) as fh:
+                status_list += json.load(fh)
+        except (IOError, ValueError):
+            # The worker has not saved its status yet
+            continue
+    _write_json_file(status_file, status_list)
+
+
 class Status(object):
     CORRUPTED_SUFFIX = 'corrupted'
 
@@ -210,31 +289,9 @@ class Status(object):
         return {}
 
     def save_status_list(self):
-        def _writeout_status_list():
-            # TODO: if we are killed while writing out the file, we may litter
-            # these temp files. We should add a cleanup step at some point.
-            with tempfile.NamedTemporaryFile(
-                    dir=os.path.dirname(self.status_location),
-                    delete=False) as tmp_fh:
-                json.dump(self.status_list, tmp_fh)
-            os.rename(tmp_fh.name, self.status_location)
-
-        try:
-            _writeout_status_list()
-        except OSError as e:
-            if e.errno == errno.ENOENT:
-                os.mkdir(os.path.dirname(self.status_location), 0755)
-                _writeout_status_list()
-            else:
-                raise
+        _write_json_file(self.status_location, self.status_list)
 
-    def save_migration(self, migration, marker, moved_count, scanned_count,
-                       bytes_count, stats_reset=False):
-        if not isinstance(stats_reset, bool):
-            raise ValueError('stats_reset must be a boolean')
-        if not all(map(lambda k: type(k) is int,
-                       [moved_count, scanned_count, bytes_count])):
-            raise ValueError('counts must be integers')
+    def _get_status(self, migration):
         for entry in self.status_list:
             if equal_migration(entry, migration):
                 if 'status' not in entry:
@@ -249,10 +306,35 @@ class Status(object):
             entry['status'] = {}
             self.status_list.append(entry)
             status = entry['status']
+        return status
 
+    def save_migration(self, migration, marker, moved_count, scanned_count,
+                       bytes_count, stats_reset=False, failed_count=None,
+                       retried_count=None, pass_finished=True):
+        if not isinstance(stats_reset, bool):
+            raise ValueError('stats_reset must be a boolean')
+        if not all(map(lambda k: type(k) is int,
+                       [moved_count, scanned_count, bytes_count])):
+            raise ValueError('counts must be integers')
+        status = self._get_status(migration)
         status['marker'] = marker
         _update_status_counts(
-            status, moved_count, scanned_count, bytes_count, stats_reset)
+            status, moved_count, scanned_count, bytes_count, stats_reset,
+            pass_finished)
+        if failed_count is not None:
+            status['failed_count'] = failed_count
+        if retried_count is not None:
+            status['retried_count'] = retried_count
+        self.save_status_list()
+
+    def save_progress(self, migration, progress, pass_finished=False):
+        '''Records the progress of the current pass. The progress of a
+        finished pass is added to the pass history of the migration.'''
+        status = self._get_status(migration)
+        status['progress'] = progress
+        if pass_finished:
+            history = status.get('pass_history', []) + [progress]
+            status['pass_history'] = history[-PASS_HISTORY_LENGTH:]
         self.save_status_list()
 
     def prune(self, migrations):
@@ -267,11 +349,174 @@ class Status(object):
         self.save_status_list()
 
 
+class RetryJournal(object):
+    '''Records the objects that failed to migrate.
+
+    The journal is kept next to the status file. Failed objects are retried
+    at the start of the following passes, backing off exponentially, without
+    having to scan the listing again. Objects that fail max_attempts times are
+    dropped from the journal.
+    '''
+    def __init__(self, location, retry_interval=DEFAULT_RETRY_INTERVAL,
+                 max_retry_interval=DEFAULT_MAX_RETRY_INTERVAL,
+                 max_attempts=DEFAULT_MAX_RETRY_ATTEMPTS):
+        self.location = location
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.max_attempts = max_attempts
+        self.journal = None
+        self.logger = logging.getLogger(LOGGER_NAME)
+
+    def load(self):
+        self.journal = []
+        try:
+            with open(self.location) as fh:
+                self.journal = json.load(fh)
+        except ValueError:
+            self.logger.warning(
+                'Ignoring corrupted retry journal: %s' % self.location)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def save(self):
+        _write_json_file(self.location, self.journal)
+
+    def _get_entry(self, migration, create=False):
+        if self.journal is None:
+            self.load()
+        for entry in self.journal:
+            if equal_migration(entry['migration'], migration):
+                return entry
+        if not create:
+            return None
+        entry = {'migration': dict(migration), 'failures': []}
+        entry['migration'].pop('aws_secret', None)
+        self.journal.append(entry)
+        return entry
+
+    def get_failures(self, migration, now=None):
+        '''Returns the failed objects, limited to the ones due for a retry
+        if now is specified.'''
+        entry = self._get_entry(migration)
+        if not entry:
+            return []
+        return [MigrateObjectWork(
+                failure['aws_bucket'], failure['container'], failure['key'])
+                for failure in entry['failures']
+                if now is None or failure['retry_at'] <= now]
+
+    def update(self, migration, failed, recovered, now):
+        '''Record the outcome of a pass.
+
+        :param failed: list of (MigrateObjectWork, error message) tuples.
+        :param recovered: previously failed MigrateObjectWork that succeeded.
+        :returns: the number of objects in the journal for the migration.
+        '''
+        entry = self._get_entry(migration, create=bool(failed))
+        if not entry:
+            return 0
+        failures = dict(((failure['container'], failure['key']), failure)
+                        for failure in entry['failures'])
+        count = len(failures)
+        for work in recovered:
+            failures.pop((work.container, work.key), None)
+        if not failed and len(failures) == count:
+            return count
+        for work, error in failed:
+            failure = failures.setdefault((work.container, work.key), {
+                'aws_bucket': work.aws_bucket,
+                'container': work.container,
+                'key': work.key,
+                'attempts': 0})
+            failure['attempts'] += 1
+            failure['error'] = error
+            if failure['attempts'] >= self.max_attempts:
+                self.logger.warning(
+                    'Giving up on "%s/%s" after %d attempts: %s' % (
+                        work.aws_bucket, work.key, failure['attempts'],
+                        error))
+                del failures[(work.container, work.key)]
+                continue
+            failure['retry_at'] = now + min(
+                self.retry_interval * 2 ** (failure['attempts'] - 1),
+                self.max_retry_interval)
+        entry['failures'] = [failures[name] for name in sorted(failures)]
+        if not entry['failures']:
+            self.journal.remove(entry)
+        self.save()
+        return len(failures)
+
+    def prune(self, migrations):
+        self.load()
+        keep_journal = [
+            entry for entry in self.journal
+            if any(equal_migration(entry['migration'], migration)
+                   for migration in migrations)]
+        if len(keep_journal) != len(self.journal):
+            self.journal = keep_journal
+            self.save()
+
+
+class ProviderCache(object):
+    '''Keeps the providers of the configured migrations across passes, so
+    that their connection pools are not recreated on every cycle.'''
+    def __init__(self):
+        self.providers = {}
+
+    @staticmethod
+    def _get_key(migration):
+        return json.dumps(migration, sort_keys=True)
+
+    def get(self, migration, create):
+        key = self._get_key(migration)
+        if key not in self.providers:
+            self.providers[key] = create()
+        return self.providers[key]
+
+    def prune(self, migrations):
+        keep_keys = set(map(self._get_key, migrations))
+        for key in self.providers.keys():
+            if key not in keep_keys:
+                self.providers.pop(key).close()
+
+    def close(self):
+        self.prune([])
+
+
+class CheckpointTracker(object):
+    '''Tracks the keys scanned in a container listing during a pass.
+
+    Keys are added in listing order. Keys that were enqueued for migration
+    remain pending until a worker is done with them. The checkpoint is the
+    highest key such that it and all of the keys before it are done.
+    '''
+    def __init__(self, container):
+        self.container = container
+        self.keys = deque()
+        self.pending = set()
+        self.marker = None
+
+    def add(self, key, pending=False):
+        self.keys.append(key)
+        if pending:
+            self.pending.add(key)
+
+    def done(self, key):
+        self.pending.discard(key)
+
+    def checkpoint(self):
+        while self.keys and self.keys[0] not in self.pending:
+            self.marker = self.keys.popleft()
+        return self.marker
+
+
 class Migrator(object):
     '''List and move objects from a remote store into the Swift cluster'''
     def __init__(self, config, status, work_chunk, workers, swift_pool, logger,
-                 node_id, nodes):
+                 node_id, nodes, retry_journal=None, provider_cache=None):
         self.config = dict(config)
+        self.migration = dict(config)
         if 'container' not in self.config:
             # NOTE: in the future this may no longer be true, as we may allow
             # remapping buckets/containers during migrations.
@@ -293,18 +538,40 @@ class Migrator(object):
         self.nodes = nodes
         self.provider = None
         self.gthread_local = eventlet.corolocal.local()
+        self.checkpoint_keys = int(self.config.get(
+            'checkpoint_keys', DEFAULT_CHECKPOINT_KEYS))
+        self.checkpoint_interval = float(self.config.get(
+            'checkpoint_interval', DEFAULT_CHECKPOINT_INTERVAL))
+        self._checkpoints = None
+        self.progress_interval = float(self.config.get(
+            'progress_interval', DEFAULT_PROGRESS_INTERVAL))
+        self._last_progress = 0
+        self._remaining = None
+        self.retry_journal = retry_journal
+        self.provider_cache = provider_cache
+        self._journaled = set()
+        self._recovered = set()
+        self._failed_work = []
+        self._pending_manifests = {}
+        self._retried = 0
+
+    def _get_provider(self):
+        def _create():
+            return create_provider(self.config, self.max_conns, False)
+
+        if self.provider_cache is None:
+            return _create()
+        return self.provider_cache.get(self.migration, _create)
 
     def next_pass(self):
         if self.config['aws_bucket'] != '/*':
-            self.provider = create_provider(
-                self.config, self.max_conns, False)
+            self.provider = self._get_provider()
             self._next_pass()
             return [dict(self.config)]
 
         self.config['all_buckets'] = True
         self.config['container'] = '.'
-        self.provider = create_provider(
-            self.config, self.max_conns, False)
+        self.provider = self._get_provider()
         try:
             return self._reconcile_containers()
         except Exception:
@@ -392,13 +659,22 @@ class Migrator(object):
         worker_pool = eventlet.GreenPool(self.workers)
         for _ in xrange(self.workers):
             worker_pool.spawn_n(self._upload_worker)
-        is_reset = False
         self._manifests = set()
+        self._pending_manifests = {}
+        self._saved_stats = (0, 0, 0)
+        self._stats_reset = False
+        self._journaled = set()
+        self._recovered = set()
+        self._failed_work = []
+        self._retried = 0
+        self._remaining = None
+        self._last_progress = self.stats.started
         marker = self.status.get_migration(self.config).get('marker', '')
         try:
+            self._retry_failed_objects()
             marker = self._process_container(marker=marker)
             if self.stats.scanned == 0:
-                is_reset = True
+                self._stats_reset = True
                 if marker:
                     marker = self._process_container(marker='')
         except ContainerNotFound as e:
@@ -442,10 +718,138 @@ class Migrator(object):
         self._stop_workers(self.object_queue)
 
         self.check_errors()
-        # TODO: record the number of errors, as well
+        counts = {}
+        if self.retry_journal:
+            try:
+                counts['failed_count'] = self.retry_journal.update(
+                    self.config, self._failed_work, self._recovered,
+                    time.time())
+                counts['retried_count'] = self._retried
+            except Exception:
+                self.logger.error('Failed to update the retry journal')
+                self.logger.error(''.join(traceback.format_exc()))
+        self._save_progress(marker, **counts)
+        self._report_progress(pass_finished=True)
+
+    def _retry_failed_objects(self):
+        if not self.retry_journal:
+            return
+        self._journaled = set(self.retry_journal.get_failures(self.config))
+        due = self.retry_journal.get_failures(self.config, time.time())
+        if due:
+            self.logger.info('Retrying %d failed objects for "%s"' % (
+                len(due), self.config['aws_bucket']))
+        for work in due:
+            self.object_queue.put(work)
+        self._retried = len(due)
+
+    def _save_progress(self, marker, **counts):
+        '''Persist the marker and the counts accumulated since the last save.
+
+        The first save of a pass that started over from the beginning of the
+        listing resets the counts.
+        '''
+        stats = (self.stats.copied, self.stats.scanned,
+                 self.stats.bytes_copied)
+        deltas = [current - saved
+                  for current, saved in zip(stats, self._saved_stats)]
         self.status.save_migration(
-            self.config, marker, self.stats.copied, self.stats.scanned,
-            self.stats.bytes_copied, is_reset)
+            self.config, marker, deltas[0], deltas[1], deltas[2],
+            self._stats_reset, **counts)
+        self._saved_stats = stats
+        self._stats_reset = False
+
+    def _set_remaining(self, remote_headers, local_headers):
+        '''Estimates the objects and bytes left to copy from the source and
+        destination container stats (only available for Swift sources).'''
+        try:
+            remote_count = int(remote_headers['x-container-object-count'])
+            remote_bytes = int(remote_headers['x-container-bytes-used'])
+            local_count = int((local_headers or {}).get(
+                'x-container-object-count', 0))
+            local_bytes = int((local_headers or {}).get(
+                'x-container-bytes-used', 0))
+        except (KeyError, ValueError):
+            self._remaining = None
+            return
+        # The objects copied from here on count against the estimate
+        self._remaining = (max(0, remote_count - local_count),
+                           max(0, remote_bytes - local_bytes),
+                           self.stats.copied, self.stats.bytes_copied)
+
+    def _get_progress(self):
+        now = time.time()
+        elapsed = max(now - self.stats.started, 0.001)
+        progress = {
+            'started': self.stats.started,
+            'updated': now,
+            'copied_count': self.stats.copied,
+            'scanned_count': self.stats.scanned,
+            'bytes_count': self.stats.bytes_copied,
+            'error_count': self.stats.errors,
+            'objects_per_second': round(self.stats.copied / elapsed, 2),
+            'bytes_per_second': round(self.stats.bytes_copied / elapsed, 2),
+            'object_queue': self.object_queue.qsize(),
+            'container_queue': self.container_queue.qsize(),
+        }
+        if self._remaining is None:
+            return progress
+        count, size, copied, bytes_copied = self._remaining
+        remaining_count = max(0, count - (self.stats.copied - copied))
+        remaining_bytes = max(
+            0, size - (self.stats.bytes_copied - bytes_copied))
+        progress['remaining_count'] = remaining_count
+        progress['remaining_bytes'] = remaining_bytes
+        if not remaining_count:
+            progress['eta'] = 0
+        elif remaining_bytes and progress['bytes_per_second']:
+            progress['eta'] = int(
+                remaining_bytes / progress['bytes_per_second'])
+        elif progress['objects_per_second']:
+            progress['eta'] = int(
+                remaining_count / progress['objects_per_second'])
+        return progress
+
+    def _report_progress(self, pass_finished=False):
+        '''Saves the progress of the pass in the status file and exports it
+        in the migrator metrics.'''
+        try:
+            progress = self._get_progress()
+            self._last_progress = progress['updated']
+            labels = {'account': self.config['account'],
+                      'container': self.config['container']}
+            for name in ('copied_count', 'bytes_count', 'error_count',
+                         'objects_per_second', 'bytes_per_second',
+                         'object_queue', 'container_queue',
+                         'remaining_count', 'remaining_bytes', 'eta'):
+                if name in progress:
+                    MIGRATOR_METRICS.set_gauge(
+                        'pass_' + name, progress[name], **labels)
+            if pass_finished:
+                MIGRATOR_METRICS.set_gauge(
+                    'last_pass_finished', progress['updated'], **labels)
+            MIGRATOR_METRICS.maybe_write()
+            self.status.save_progress(self.config, progress, pass_finished)
+        except Exception:
+            self.logger.error('Failed to report the progress of "%s"' %
+                              self.config['aws_bucket'])
+            self.logger.error(''.join(traceback.format_exc()))
+
+    def _maybe_report_progress(self):
+        if time.time() - self._last_progress >= self.progress_interval:
+            self._report_progress()
+
+    def _record_error(self, container, key, err):
+        self.stats.update(errors=1)
+        self.errors.put((container, key, err))
+
+    def _checkpoint(self):
+        marker = self._checkpoints.checkpoint()
+        if marker is None:
+            return
+        self.logger.debug('Checkpoint for "%s" at "%s"' % (
+            self.config['aws_bucket'], marker))
+        self._save_progress(marker, pass_finished=False)
 
     def check_errors(self):
         while not self.errors.empty():
@@ -700,11 +1104,11 @@ class Migrator(object):
                 'x-object-manifest' in local_meta:
             if remote_resp.headers['x-object-manifest'] !=\
                     local_meta['x-object-manifest']:
-                self.errors.put((
+                self._record_error(
                     container, key,
                     'Dynamic Large objects with differing manifests: '
                     '%s %s' % (remote_resp.headers['x-object-manifest'],
-                               local_meta['x-object-manifest'])))
+                               local_meta['x-object-manifest']))
             # TODO: once swiftclient supports query_string on HEAD requests, we
             # would be able to compare the ETag of the manifest object itself.
             return
@@ -719,14 +1123,26 @@ class Migrator(object):
             remote_manifest = self.provider.get_manifest(key,
                                                          bucket=aws_bucket)
             if json.load(FileLikeIter(local_manifest)) != remote_manifest:
-                self.errors.put((
+                self._record_error(
                     aws_bucket, key,
-                    'Matching date, but differing SLO manifests'))
+                    'Matching date, but differing SLO manifests')
             return
 
-        self.errors.put((
+        if 'x-static-large-object' not in remote_resp.headers and\
+                SOURCE_SYSMETA_ETAG in local_meta:
+            # The object was segmented when it was migrated: compare the
+            # source ETag and size that were recorded at the time.
+            remote_headers = dict((k.lower(), v) for k, v in
+                                  remote_resp.headers.items())
+            if remote_headers.get('etag', '').strip('"') ==\
+                    local_meta[SOURCE_SYSMETA_ETAG] and\
+                    remote_headers.get('content-length') ==\
+                    local_meta.get(SOURCE_SYSMETA_SIZE):
+                return
+
+        self._record_error(
             aws_bucket, key,
-            'Mismatching ETag for regular objects with the same date'))
+            'Mismatching ETag for regular objects with the same date')
 
     def _process_container(
             self, container=None, aws_bucket=None, marker=None, prefix=None,
@@ -782,6 +1198,8 @@ class Migrator(object):
                         self._create_container(container, ic, aws_bucket)
                     else:
                         raise
+                if not list_all:
+                    self._set_remaining(resp.headers, local_headers)
                 if resp.headers and local_headers:
                     local_ts = _create_x_timestamp_from_hdrs(
                         local_headers, use_x_timestamp=False)
@@ -811,16 +1229,6 @@ class Migrator(object):
         return self._find_missing_objects(container, aws_bucket, marker,
                                           prefix, list_all)
 
-    def _old_enough(self, remote):
-        older_than = self.config.get('older_than')
-        if older_than is None:
-            return True
-        older_than = datetime.timedelta(seconds=older_than)
-        now = datetime.datetime.utcnow()
-        remote_time = datetime.datetime.strptime(
-            remote['last_modified'], SWIFT_TIME_FMT)
-        return remote_time < now - older_than
-
     def _find_missing_objects(
             self, container, aws_bucket, marker, prefix, list_all):
 
@@ -831,53 +1239,58 @@ class Migrator(object):
             source_iter = iter([])
 
         scanned = 0
+        # Only the listing of the migrated container itself is checkpointed.
+        # Referenced containers are always listed in full.
+        if not list_all:
+            self._checkpoints = CheckpointTracker(container)
+        unsaved = 0
+        last_checkpoint = time.time()
         local_iter = self._iterate_internal_listing(container, marker, prefix)
-        local = next(local_iter)
-        remote = next(source_iter)
-        if remote:
-            marker = remote['name']
-        while remote:
-            # NOTE: the listing from the given marker may return fewer than
-            # the number of items we should process. We will process all of
-            # the keys that were returned in the listing and restart on the
-            # following iteration.
-            if not local or local['name'] > remote['name']:
-                if self._old_enough(remote):
-                    work = MigrateObjectWork(aws_bucket, container,
-                                             remote['name'])
-                    self.object_queue.put(work)
+        # NOTE: the listing from the given marker may return fewer than the
+        # number of items we should process. We will process all of the keys
+        # that were returned in the listing and restart on the following
+        # iteration.
+        try:
+            for action, entry in diff_listings(
+                    local_iter, source_iter, marker,
+                    self.config.get('older_than')):
+                if action == ListingDiffActions.RECONCILE:
+                    self._reconcile_deleted_objects(container, entry['name'])
+                    continue
+
                 scanned += 1
-                remote = next(source_iter)
-                if remote:
-                    marker = remote['name']
-            elif local['name'] < remote['name']:
-                self._reconcile_deleted_objects(container, local['name'])
-                local = next(local_iter)
-            else:
-                try:
-                    cmp_ret = cmp_object_entries(local, remote)
-                except MigrationError:
-                    # This should only happen if we are comparing large
-                    # objects: there will be an ETag mismatch.
-                    with self.ic_pool.item() as ic:
-                        self._check_large_objects(
-                            aws_bucket, container, remote['name'], ic)
+                marker = entry['name']
+                if action == ListingDiffActions.MIGRATE:
+                    if not list_all:
+                        self._checkpoints.add(entry['name'], pending=True)
+                    self.object_queue.put(MigrateObjectWork(
+                        aws_bucket, container, entry['name']))
                 else:
-                    if cmp_ret < 0 and self._old_enough(remote):
-                        work = MigrateObjectWork(aws_bucket, container,
-                                                 remote['name'])
-                        self.object_queue.put(work)
-                remote = next(source_iter)
-                local = next(local_iter)
-                scanned += 1
-                if remote:
-                    marker = remote['name']
-
+                    if action == ListingDiffActions.CHECK_ETAG:
+                        # This should only happen if we are comparing large
+                        # objects: there will be an ETag mismatch.
+                        with self.ic_pool.item() as ic:
+                            self._check_large_objects(
+                                aws_bucket, container, entry['name'], ic)
+                    if not list_all:
+                        self._checkpoints.add(entry['name'])
+
+                if list_all:
+                    continue
+                unsaved += 1
+                if unsaved >= self.checkpoint_keys or \
+                        time.time() - last_checkpoint >= \
+                        self.checkpoint_interval:
+                    self.stats.update(scanned=unsaved)
+                    scanned -= unsaved
+                    unsaved = 0
+                    last_checkpoint = time.time()
+                    self._checkpoint()
+                self._maybe_report_progress()
+        finally:
+            if not list_all:
+                self._checkpoints = None
         self.stats.update(scanned=scanned)
-        while local and (not marker or local['name'] < marker or scanned == 0):
-            # We may have objects left behind that need to be removed
-            self._reconcile_deleted_objects(container, local['name'])
-            local = next(local_iter)
         return marker
 
     def _migrate_object(self, aws_bucket, container, key):
@@ -889,7 +1302,8 @@ class Migrator(object):
         resp = self.provider.get_object(key, **args)
         if resp.status != 200:
             resp.body.close()
-            raise MigrationError('Failed to GET "%s/%s": %s' % (
+            error = ObjectNotFound if resp.status == 404 else MigrationError
+            raise error('Failed to GET "%s/%s": %s' % (
                 aws_bucket, key, resp.body))
 
         if (aws_bucket, container, key) in self._manifests:
@@ -900,7 +1314,7 @@ class Migrator(object):
                 resp.body.close()
                 return
             self._upload_object(UploadObjectWork(
-                container, key, FileLikeIter(resp.body),
+                container, key, FileLikeIter(self._limit_bandwidth(resp.body)),
                 convert_to_local_headers(resp.headers.items(),
                                          remove_timestamp=False),
                 aws_bucket))
@@ -918,14 +1332,187 @@ class Migrator(object):
         elif 'x-static-large-object' in resp.headers:
             # We have to move the segments and then move the manifest file
             self._migrate_slo(aws_bucket, container, key, resp)
+        elif self._should_segment(resp.headers):
+            # We only needed the headers; the segments are fetched with
+            # ranged requests.
+            resp.body.close()
+            self._migrate_as_slo(aws_bucket, container, key, resp.headers)
         else:
             put_headers = convert_to_local_headers(
                 resp.headers.items(), remove_timestamp=False)
             work = UploadObjectWork(
-                container, key, FileLikeIter(resp.body), put_headers,
-                aws_bucket)
+                container, key, FileLikeIter(self._limit_bandwidth(resp.body)),
+                put_headers, aws_bucket)
             self._upload_object(work)
 
+    def _limit_bandwidth(self, body):
+        limiters = get_limiters(self.config)
+        if not limiters:
+            return body
+        return RateLimitedIter(body, limiters)
+
+    def _should_segment(self, headers):
+        threshold = self.config.get('large_object_threshold')
+        if threshold is None or 'Content-Length' not in headers:
+            return False
+        return int(headers['Content-Length']) > int(threshold)
+
+    def _get_segment_size(self, aws_bucket, key, headers):
+        segment_size = min(
+            int(self.config.get('segment_size', DEFAULT_SEGMENT_SIZE)),
+            MAX_SEGMENT_SIZE)
+        if not self.config.get('align_segments') or\
+                self.config.get('protocol', 's3') == 'swift':
+            return segment_size
+        if not MPU_ETAG_RE.match(headers.get('etag', '')):
+            return segment_size
+        # Aligning the segments with the source parts means that the SLO ETag
+        # is the same as the S3 multipart upload ETag.
+        resp = self.provider.head_object(key, bucket=aws_bucket, PartNumber=1)
+        if resp.status not in (200, 206) or\
+                'Content-Length' not in resp.headers:
+            self.logger.warning(
+                'Failed to determine the part size of "%s/%s" (%d); using '
+                'segments of %d bytes' % (
+                    aws_bucket, key, resp.status, segment_size))
+            return segment_size
+        return int(resp.headers['Content-Length'])
+
+    def _get_object_range(self, aws_bucket, key, offset, length):
+        byte_range = 'bytes=%d-%d' % (offset, offset + length - 1)
+        if self.config.get('protocol', 's3') == 'swift':
+            return self.provider.get_object(
+                key, bucket=aws_bucket, resp_chunk_size=65536,
+                headers={'Range': byte_range})
+        return self.provider.get_object(key, bucket=aws_bucket,
+                                        Range=byte_range)
+
+    def _ensure_segments_container(self, container):
+        # NOTE: the segments container is not tagged with the migrator
+        # header, as it does not exist in the source and must not be removed
+        # when reconciling the containers.
+        with self.ic_pool.item() as ic:
+            if not ic.container_exists(self.config['account'], container):
+                ic.create_container(self.config['account'], container)
+                self.logger.info('Created segments container "%s"' %
+                                 container)
+
+    def _copy_segment(self, aws_bucket, key, segment):
+        container, segment_key = segment['name'][1:].split('/', 1)
+        with self.ic_pool.item() as ic:
+            try:
+                meta = ic.get_object_metadata(
+                    self.config['account'], container, segment_key)
+                if int(meta['content-length']) == segment['bytes']:
+                    # Copied on a prior attempt
+                    return meta['etag'], 0
+            except UnexpectedResponse as e:
+                if e.resp.status_int != HTTP_NOT_FOUND:
+                    raise
+
+        resp = self._get_object_range(
+            aws_bucket, key, segment['offset'], segment['bytes'])
+        if resp.status != 206 or\
+                int(resp.headers['Content-Length']) != segment['bytes']:
+            resp.body.close()
+            raise MigrationError(
+                'Failed to GET range %d-%d of "%s/%s": %d' % (
+                    segment['offset'],
+                    segment['offset'] + segment['bytes'] - 1,
+                    aws_bucket, key, resp.status))
+
+        md5 = hashlib.md5()
+
+        def _hashing_iter():
+            for chunk in self._limit_bandwidth(resp.body):
+                md5.update(chunk)
+                yield chunk
+
+        with self.ic_pool.item() as ic:
+            ic.upload_object(
+                FileLikeIter(_hashing_iter()), self.config['account'],
+                container, segment_key,
+                {'Content-Length': str(segment['bytes']),
+                 'Content-Type': 'application/octet-stream'})
+        return md5.hexdigest(), segment['bytes']
+
+    def _copy_segment_with_retries(self, args):
+        aws_bucket, key, segment = args
+        for attempt in range(1, SEGMENT_RETRIES + 1):
+            try:
+                return self._copy_segment(aws_bucket, key, segment)
+            except Exception:
+                if attempt == SEGMENT_RETRIES:
+                    raise
+                self.logger.warning(
+                    'Failed to copy segment %s (attempt %d): %s' % (
+                        segment['name'], attempt, traceback.format_exc()))
+
+    def _migrate_as_slo(self, aws_bucket, container, key, headers):
+        size = int(headers['Content-Length'])
+        segment_size = self._get_segment_size(aws_bucket, key, headers)
+        put_headers = convert_to_local_headers(
+            headers.items(), remove_timestamp=False)
+        x_timestamp = Timestamp(
+            _create_x_timestamp_from_hdrs(put_headers)).internal
+        segments_container = u'%s_segments' % container
+        if not isinstance(key, unicode):
+            key = key.decode('utf-8')
+        # The segment names include the source object timestamp and size, so
+        # that we can resume copying the segments of the same object.
+        segment_prefix = u'%s/slo/%s/%d/%d' % (
+            key, x_timestamp, size, segment_size)
+
+        segments = []
+        for index, offset in enumerate(xrange(0, size, segment_size)):
+            segments.append({
+                'name': u'/%s/%s/%08d' % (
+                    segments_container, segment_prefix, index),
+                'offset': offset,
+                'bytes': min(segment_size, size - offset)})
+
+        self._ensure_segments_container(segments_container)
+        self.logger.info('Migrating "%s/%s" as an SLO with %d segments' % (
+            aws_bucket, key, len(segments)))
+        pool = eventlet.GreenPool(int(self.config.get(
+            'segment_workers', DEFAULT_SEGMENT_WORKERS)))
+        copied_bytes = 0
+        for segment, result in zip(segments, pool.imap(
+                self._copy_segment_with_retries,
+                [(aws_bucket, key, segment) for segment in segments])):
+            etag, copied = result
+            segment['hash'] = etag
+            copied_bytes += copied
+
+        manifest = [{'name': segment['name'],
+                     'hash': segment['hash'],
+                     'bytes': segment['bytes'],
+                     'content_type': 'application/octet-stream'}
+                    for segment in segments]
+        source_etag = put_headers.pop('etag', None)
+        if self.config.get('align_segments') and source_etag and\
+                MPU_ETAG_RE.match(source_etag):
+            slo_etag = get_slo_etag(manifest)
+            if slo_etag != source_etag:
+                self.logger.warning(
+                    'SLO ETag for "%s/%s" does not match the source: %s != '
+                    '%s' % (aws_bucket, key, slo_etag, source_etag))
+
+        manifest_blob = json.dumps(manifest)
+        put_headers[SLO_HEADER] = 'True'
+        # Swift's SLO ETag is the MD5 of the concatenated segment ETags
+        put_headers[SLO_SYSMETA_ETAG] = hashlib.md5(
+            ''.join([segment['hash'] for segment in manifest])).hexdigest()
+        put_headers[SLO_SYSMETA_SIZE] = str(size)
+        if source_etag:
+            put_headers[SOURCE_SYSMETA_ETAG] = source_etag
+        put_headers[SOURCE_SYSMETA_SIZE] = str(size)
+        put_headers['Content-Length'] = str(len(manifest_blob))
+        self._upload_object(UploadObjectWork(
+            container, key, FileLikeIter([manifest_blob]), put_headers,
+            aws_bucket))
+        self.gthread_local.bytes_copied += copied_bytes
+
     def _migrate_dlo(self, aws_bucket, container, key, resp):
         put_headers = convert_to_local_headers(
             resp.headers.items(), remove_timestamp=False)
@@ -954,8 +1541,8 @@ class Migrator(object):
                         self.config['account'], container, segment_key)
                 except UnexpectedResponse as e:
                     if e.resp.status_int != 404:
-                        self.errors.put((container, segment_key,
-                                         sys.exc_info()))
+                        self._record_error(container, segment_key,
+                                           sys.exc_info())
                         continue
             if meta:
                 resp = self.provider.head_object(
@@ -983,9 +1570,13 @@ class Migrator(object):
         work = UploadObjectWork(slo_container, key,
                                 FileLikeIter(manifest_blob), put_headers,
                                 slo_container)
+        # The object is not done until its manifest is uploaded
+        self._pending_manifests[(slo_container, key)] = MigrateObjectWork(
+            aws_bucket, slo_container, key)
         try:
             self.object_queue.put(work, block=False)
         except eventlet.queue.Full:
+            del self._pending_manifests[(slo_container, key)]
             self._upload_object(work)
 
     def _upload_object(self, work):
@@ -1012,11 +1603,28 @@ class Migrator(object):
         self.gthread_local.uploaded_objects += 1
         self.gthread_local.bytes_copied += size
 
+    def _work_done(self, work):
+        if isinstance(work, UploadObjectWork):
+            work = self._pending_manifests.pop((work.container, work.key),
+                                               None)
+        elif work and (work.container, work.key) in self._pending_manifests:
+            # The SLO manifest is still queued for upload
+            return
+        if not isinstance(work, MigrateObjectWork):
+            return
+        checkpoints = self._checkpoints
+        if not checkpoints or checkpoints.container != work.container:
+            return
+        if work in self._manifests:
+            # DLO manifests are uploaded at the end of the pass
+            return
+        checkpoints.done(work.key)
+
     def _upload_worker(self):
-        self.gthread_local.uploaded_objects = 0
-        self.gthread_local.bytes_copied = 0
         while True:
             work = self.object_queue.get()
+            self.gthread_local.uploaded_objects = 0
+            self.gthread_local.bytes_copied = 0
             try:
                 if not work:
                     break
@@ -1025,6 +1633,8 @@ class Migrator(object):
                 key = work.key
                 if isinstance(work, MigrateObjectWork):
                     self._migrate_object(aws_bucket, container, key)
+                    if work in self._journaled:
+                        self._recovered.add(work)
                 else:
                     size = int(work.headers['Content-Length'])
                     self._upload_object(work)
@@ -1034,54 +1644,109 @@ class Migrator(object):
                 # Avoid killing the worker, as it should only quit explicitly
                 # when we initiate it. Otherwise, we might deadlock if all
                 # workers quit, but the queue has not been drained.
-                self.errors.put((aws_bucket, key, sys.exc_info()))
+                err = sys.exc_info()
+                self._record_error(aws_bucket, key, err)
+                failed = work
+                if isinstance(work, UploadObjectWork):
+                    # A failed SLO manifest upload fails the object
+                    failed = self._pending_manifests.get((container, key))
+                    self._recovered.discard(failed)
+                if isinstance(err[1], ObjectNotFound):
+                    # The object was removed from the source and there is
+                    # nothing left to retry
+                    if work in self._journaled:
+                        self._recovered.add(work)
+                elif isinstance(failed, MigrateObjectWork):
+                    self._failed_work.append((failed, ''.join(
+                        traceback.format_exception_only(*err[:2])).strip()))
             finally:
+                # Counts are updated as work completes so that checkpoints
+                # taken during the pass include them.
+                self.stats.update(
+                    copied=self.gthread_local.uploaded_objects,
+                    bytes_copied=self.gthread_local.bytes_copied)
+                self._work_done(work)
                 self.object_queue.task_done()
-        self.stats.update(
-            copied=self.gthread_local.uploaded_objects,
-            bytes_copied=self.gthread_local.bytes_copied)
+                if work:
+                    self._maybe_report_progress()
 
     def close(self):
         if not self.provider:
             return
-        self.provider.close()
+        # Cached providers are closed once the migration is removed
+        if self.provider_cache is None:
+            self.provider.close()
         self.provider = None
 
 
+def _get_worker_shares(migrations, workers, concurrency):
+    '''Splits the workers between the migrations that run concurrently.
+
+    Each migration pass gets a number of workers proportional to its weight
+    (1, by default). All of the passes share the same internal client pool,
+    which limits the total number of concurrent uploads.
+    '''
+    if not migrations:
+        return []
+    weights = [float(migration.get('weight', 1)) for migration in migrations]
+    running = min(concurrency, len(migrations))
+    average_weight = sum(weights) / len(weights)
+    return [max(1, min(workers, int(
+            workers * weight / (average_weight * running))))
+            for weight in weights]
+
+
 def process_migrations(migrations, migration_status, internal_pool, logger,
-                       items_chunk, workers, node_id, nodes):
+                       items_chunk, workers, node_id, nodes,
+                       retry_journal=None, concurrency=1,
+                       provider_cache=None):
+    def _process_migration(args):
+        migration, migration_workers = args
+        if migration.get('remote_account'):
+            src_account = migration.get('remote_account')
+        else:
+            src_account = migration['aws_identity']
+        logger.info('Processing "%s"' % (
+            ':'.join([migration.get('aws_endpoint', ''),
+                      src_account, migration['aws_bucket']])))
+        migrator = Migrator(migration, migration_status,
+                            items_chunk, migration_workers,
+                            internal_pool, logger,
+                            node_id, nodes, retry_journal, provider_cache)
+        pass_containers = migrator.next_pass()
+        migrator.close()
+        if pass_containers is None:
+            # Happens if there is an error listing containers.
+            # Inserting the migration we attempted to process will ensure
+            # we don't prune it (or the related containers).
+            return [migration]
+        return pass_containers
+
+    node_migrations = [
+        migration for index, migration in enumerate(migrations)
+        if migration['aws_bucket'] == '/*' or index % nodes == node_id]
+    shares = _get_worker_shares(node_migrations, workers, concurrency)
+    pool = eventlet.GreenPool(concurrency)
     handled_containers = []
-    for index, migration in enumerate(migrations):
-        if migration['aws_bucket'] == '/*' or index % nodes == node_id:
-            if migration.get('remote_account'):
-                src_account = migration.get('remote_account')
-            else:
-                src_account = migration['aws_identity']
-            logger.info('Processing "%s"' % (
-                ':'.join([migration.get('aws_endpoint', ''),
-                          src_account, migration['aws_bucket']])))
-            migrator = Migrator(migration, migration_status,
-                                items_chunk, workers,
-                                internal_pool, logger,
-                                node_id, nodes)
-            pass_containers = migrator.next_pass()
-            if pass_containers is None:
-                # Happens if there is an error listing containers.
-                # Inserting the migration we attempted to process will ensure
-                # we don't prune it (or the related containers).
-                handled_containers.append(migration)
-            else:
-                handled_containers += pass_containers
-            migrator.close()
+    for pass_containers in pool.imap(
+            _process_migration, zip(node_migrations, shares)):
+        handled_containers += pass_containers
     migration_status.prune(handled_containers)
+    if retry_journal:
+        retry_journal.prune(handled_containers)
+    if provider_cache:
+        provider_cache.prune(node_migrations)
 
 
 def run(migrations, migration_status, internal_pool, logger, items_chunk,
-        workers, node_id, nodes, poll_interval, once):
+        workers, node_id, nodes, poll_interval, once, retry_journal=None,
+        concurrency=1):
+    provider_cache = ProviderCache()
     while True:
         cycle_start = time.time()
         process_migrations(migrations, migration_status, internal_pool, logger,
-                           items_chunk, workers, node_id, nodes)
+                           items_chunk, workers, node_id, nodes,
+                           retry_journal, concurrency, provider_cache)
         elapsed = time.time() - cycle_start
         naptime = max(0, poll_interval - elapsed)
         msg = 'Finished cycle in %0.2fs' % elapsed
@@ -1093,11 +1758,107 @@ def run(migrations, migration_status, internal_pool, logger, items_chunk,
         time.sleep(naptime)
 
 
-def create_ic_pool(config, swift_dir, workers):
+def create_ic_pool(config, swift_dir, workers, concurrency=1):
+    # The enumerating thread of each concurrent migration uses a client as
+    # well.
     return eventlet.pools.Pool(
         create=lambda: create_internal_client(config, swift_dir),
         min_size=0,
-        max_size=workers + 1)  # Our enumerating thread uses a client as well.
+        max_size=workers + concurrency)
+
+
+def _run_migrations(conf, migrator_conf, logger, once, node_id, nodes,
+                    status_file):
+    workers = migrator_conf.get('workers', 10)
+    set_process_limiter(migrator_conf)
+    metrics_file = None
+    if migrator_conf.get('prometheus_metrics'):
+        metrics_file = '.'.join([status_file, METRICS_SUFFIX])
+    MIGRATOR_METRICS.configure(migrator_conf, metrics_file)
+    concurrency = int(migrator_conf.get('concurrent_migrations', 1))
+    swift_dir = conf.get('swift_dir', '/etc/swift')
+    internal_pool = create_ic_pool(conf, swift_dir, workers, concurrency)
+
+    items_chunk = migrator_conf['items_chunk']
+    poll_interval = float(migrator_conf.get('poll_interval', 5))
+
+    migrations = conf.get('migrations', [])
+    migration_status = Status(status_file)
+    retry_journal = RetryJournal(
+        '.'.join([status_file, RETRY_JOURNAL_SUFFIX]),
+        float(migrator_conf.get('retry_interval', DEFAULT_RETRY_INTERVAL)),
+        float(migrator_conf.get('max_retry_interval',
+                                DEFAULT_MAX_RETRY_INTERVAL)),
+        int(migrator_conf.get('max_retry_attempts',
+                              DEFAULT_MAX_RETRY_ATTEMPTS)))
+
+    run(migrations, migration_status, internal_pool, logger, items_chunk,
+        workers, node_id, nodes, poll_interval, once, retry_journal,
+        concurrency)
+    MIGRATOR_METRICS.write()
+
+
+def _remove_stale_worker_files(status_file, processes):
+    # The files of the workers that are no longer used (if the number of
+    # worker processes was lowered) are out of date and must not be picked
+    # up if the number of processes is raised again (or, for the metrics,
+    # scraped in the meantime).
+    directory, name = os.path.split(status_file)
+    for entry in os.listdir(directory or '.'):
+        if not entry.startswith(name + '.'):
+            continue
+        parts = entry[len(name) + 1:].split('.', 1)
+        if not parts[0].isdigit() or int(parts[0]) < processes:
+            continue
+        if len(parts) == 1 or parts[1] in (RETRY_JOURNAL_SUFFIX,
+                                           METRICS_SUFFIX):
+            os.unlink(os.path.join(directory, entry))
+
+
+def _seed_worker_files(status_file, worker_status_files):
+    # When switching to multiple worker processes, every worker starts from
+    # the existing status (and retry journal) and prunes the entries that
+    # are not its own.
+    _remove_stale_worker_files(status_file, len(worker_status_files))
+    for location in worker_status_files:
+        for suffix in ('', '.' + RETRY_JOURNAL_SUFFIX):
+            if os.path.exists(status_file + suffix) and \
+                    not os.path.exists(location + suffix):
+                shutil.copyfile(status_file + suffix, location + suffix)
+
+
+def _supervise_migrations(conf, migrator_conf, logger, once, node_id, nodes,
+                          processes):
+    '''Runs the migrator in multiple processes.
+
+    Each worker process handles its own shard of the migrations: the
+    configured "process" and "processes" are subdivided between the workers.
+    The supervisor restarts the workers that exit and periodically combines
+    their status files into the configured status file.
+    '''
+    status_file = migrator_conf['status_file']
+    worker_status_files = ['%s.%d' % (status_file, index)
+                           for index in range(processes)]
+    _seed_worker_files(status_file, worker_status_files)
+    poll_interval = float(migrator_conf.get('poll_interval', 5))
+    last_aggregated = [0]
+
+    def _run_worker(index):
+        _run_migrations(conf, migrator_conf, logger, once,
+                        node_id * processes + index, nodes * processes,
+                        worker_status_files[index])
+
+    def _aggregate():
+        if time.time() - last_aggregated[0] < poll_interval:
+            return
+        aggregate_status(status_file, worker_status_files)
+        last_aggregated[0] = time.time()
+
+    logger.info('Starting %d migrator processes' % processes)
+    supervisor = Supervisor(processes, _run_worker, logger)
+    result = supervisor.run(once, _aggregate)
+    aggregate_status(status_file, worker_status_files)
+    return result
 
 
 def main():
@@ -1124,24 +1885,22 @@ def main():
 
     logger = logging.getLogger(LOGGER_NAME)
 
-    workers = migrator_conf.get('workers', 10)
-    swift_dir = conf.get('swift_dir', '/etc/swift')
-    internal_pool = create_ic_pool(conf, swift_dir, workers)
-
     if 'process' not in migrator_conf or 'processes' not in migrator_conf:
         print 'Missing "process" or "processes" settings in the config file'
         exit(-1)
 
-    items_chunk = migrator_conf['items_chunk']
     node_id = int(migrator_conf['process'])
     nodes = int(migrator_conf['processes'])
-    poll_interval = float(migrator_conf.get('poll_interval', 5))
-
-    migrations = conf.get('migrations', [])
-    migration_status = Status(migrator_conf['status_file'])
-
-    run(migrations, migration_status, internal_pool, logger, items_chunk,
-        workers, node_id, nodes, poll_interval, args.once)
+    processes = get_process_count(
+        args.processes or migrator_conf.get('worker_processes', 1))
+
+    if processes == 1:
+        _run_migrations(conf, migrator_conf, logger, args.once, node_id,
+                        nodes, migrator_conf['status_file'])
+        return
+    if _supervise_migrations(conf, migrator_conf, logger, args.once, node_id,
+                             nodes, processes):
+        exit(1)
 
 
 if __name__ == '__main__':
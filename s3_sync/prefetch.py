@@ -0,0 +1,85 @@
+"""
+Copyright 2018 SwiftStack
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import json
+import sys
+import urllib
+
+import requests
+import swiftclient.client
+
+from .restore import DEFAULT_PREFETCH_WORKERS
+
+
+PROGRESS_FORMAT = ('scanned: %(scanned)d, restored: %(restored)d, '
+                   'present: %(present)d, failed: %(failed)d')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Restore the archived objects under a prefix into Swift '
+                    'through the cloud sync shunt')
+    parser.add_argument('--auth', help='auth (v1) URL')
+    parser.add_argument('--user')
+    parser.add_argument('--key')
+    parser.add_argument('--url', help='storage URL; required with --token')
+    parser.add_argument('--token')
+    parser.add_argument('--container', required=True)
+    parser.add_argument('--prefix', default='')
+    parser.add_argument('--workers', type=int,
+                        default=DEFAULT_PREFETCH_WORKERS,
+                        help='number of objects to restore concurrently; '
+                        'limited by the max_prefetch_workers setting of the '
+                        'shunt')
+    args = parser.parse_args(args)
+
+    if args.token:
+        if not args.url:
+            return 'argument --url is required with --token'
+        url, token = args.url, args.token
+    else:
+        if not (args.auth and args.user and args.key):
+            return 'arguments --auth, --user, and --key are required ' \
+                'without --token'
+        url, token = swiftclient.client.get_auth(
+            args.auth, args.user, args.key)
+
+    resp = requests.post(
+        '%s/%s' % (url.rstrip('/'), urllib.quote(args.container)),
+        params={'restore': '', 'prefix': args.prefix,
+                'workers': args.workers},
+        headers={'X-Auth-Token': token}, stream=True)
+    if resp.status_code != 200:
+        return 'Failed to restore the objects: %d %s' % (
+            resp.status_code, resp.text)
+
+    progress = None
+    for line in resp.iter_lines():
+        if not line:
+            continue
+        progress = json.loads(line)
+        print PROGRESS_FORMAT % progress
+        sys.stdout.flush()
+    if progress is None or not progress['finished']:
+        return 'The restore did not finish'
+    if progress['failed']:
+        return 'Failed to restore %d objects' % progress['failed']
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
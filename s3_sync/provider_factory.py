@@ -14,18 +14,26 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+from .base_sync import ClientPoolRegistry
 from .sync_s3 import SyncS3
 from .sync_swift import SyncSwift
 
 
+# Client pools shared by all of the providers in this process that are
+# created with shared_pool=True.
+SHARED_CLIENT_POOLS = ClientPoolRegistry()
+
+
 def create_provider(sync_settings, max_conns, per_account=False, logger=None,
-                    extra_headers=None):
+                    extra_headers=None, shared_pool=False):
+    kwargs = {'extra_headers': extra_headers}
+    if shared_pool:
+        kwargs['client_pools'] = SHARED_CLIENT_POOLS
     provider_type = sync_settings.get('protocol', None)
     if not provider_type or provider_type == 's3':
-        return SyncS3(sync_settings, max_conns, per_account, logger,
-                      extra_headers=extra_headers)
+        return SyncS3(sync_settings, max_conns, per_account, logger, **kwargs)
     elif provider_type == 'swift':
         return SyncSwift(sync_settings, max_conns, per_account, logger,
-                         extra_headers=extra_headers)
+                         **kwargs)
     else:
         raise NotImplementedError()
@@ -0,0 +1,469 @@
+"""
+Copyright 2018 SwiftStack
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import eventlet
+import hashlib
+import json
+import time
+import urllib
+
+from swift.common.swob import Range, Request
+from swift.common.utils import close_if_possible
+
+from .provider_factory import create_provider
+from .utils import (check_slo, convert_to_local_headers, get_internal_account,
+                    get_metric_name, iter_listing, response_is_complete,
+                    SwiftPutWrapper, SwiftSloPutWrapper)
+
+
+DEFAULT_RESTORE_QUEUE_SIZE = 1000
+DEFAULT_PREFETCH_WORKERS = 10
+PREFETCH_LISTING_LIMIT = 1000
+# How often (in seconds) the progress of a prefix restore is reported
+PROGRESS_INTERVAL = 10
+# The blocks of partially restored objects are kept in <container>+blocks, in
+# the internal account
+BLOCKS_CONTAINER_SUFFIX = '+blocks'
+
+
+def restore_object(provider, obj, path, app, logger, trans_id=''):
+    '''Copies an object from the remote store into Swift.
+
+    Objects that were uploaded as SLOs are restored as SLOs, with the segments
+    described by the remote manifest.
+
+    :param provider: the provider of the profile that the object belongs to.
+    :param obj: the (unicode) name of the object in the profile.
+    :param path: the quoted Swift path of the object
+                 (/<version>/<account>/...), as it is parsed as a URL.
+    :param app: the WSGI application to upload the object through.
+    :returns: True if the object was restored; False otherwise.
+    '''
+    req = Request.blank(path, environ={'REQUEST_METHOD': 'GET',
+                                       'swift.trans_id': trans_id})
+    status, headers, body = provider.shunt_object(req, obj)
+    try:
+        if not response_is_complete(int(status.split()[0]), headers):
+            logger.warning('Failed to fetch %s to restore it: %s' % (
+                path, status))
+            return False
+        put_headers = convert_to_local_headers(headers)
+        if check_slo(put_headers):
+            manifest = provider.get_manifest(obj)
+            if not manifest:
+                logger.error('Failed to restore slo object due to missing '
+                             'manifest: %s' % obj)
+                return False
+            wrapper = SwiftSloPutWrapper(
+                body, put_headers, path, app, manifest, logger)
+        else:
+            wrapper = SwiftPutWrapper(body, put_headers, path, app, logger)
+        for _ in wrapper:
+            pass
+        return not wrapper.failed
+    finally:
+        close_if_possible(body)
+
+
+def restore_missing_object(provider, obj, path, app, logger, trans_id=''):
+    '''Restores the object, unless it is already present in Swift (e.g.
+    restored by another proxy).
+
+    The path must be quoted, as for restore_object().
+
+    :returns: "present", "restored", or "failed".
+    '''
+    resp = Request.blank(path, method='HEAD').get_response(app)
+    close_if_possible(resp.app_iter)
+    if resp.is_success:
+        return 'present'
+    if restore_object(provider, obj, path, app, logger, trans_id):
+        return 'restored'
+    return 'failed'
+
+
+def iter_restore_prefix(provider, account, container, prefix, app, logger,
+                        workers=DEFAULT_PREFETCH_WORKERS,
+                        progress_interval=PROGRESS_INTERVAL):
+    '''Restores the remote objects under the prefix that are missing in
+    Swift, using the given number of concurrent workers.
+
+    Yields the progress counters every progress_interval seconds and once all
+    of the objects are processed, which sets "finished".
+
+    :param account: the (UTF-8 encoded) Swift account.
+    :param container: the (UTF-8 encoded) Swift container.
+    :param prefix: the (UTF-8 encoded) prefix of the objects to restore.
+    '''
+    resp, listing = iter_listing(
+        provider.list_objects, logger, '', PREFETCH_LISTING_LIMIT, prefix,
+        '')
+    if resp.status != 200:
+        raise RuntimeError('Failed to list the remote objects: %s' %
+                           resp.status)
+
+    def _names():
+        for entry, _ in listing:
+            if entry is None:
+                break
+            if 'name' in entry:
+                yield entry['name']
+
+    def _restore(name):
+        # The path is parsed as a URL by Request.blank()
+        path = urllib.quote('/'.join(
+            ['', 'v1', account, container, name.encode('utf-8')]))
+        try:
+            return restore_missing_object(provider, name, path, app, logger)
+        except Exception:
+            logger.exception('Failed to restore %s' % path)
+            return 'failed'
+
+    progress = {'scanned': 0, 'present': 0, 'restored': 0, 'failed': 0,
+                'finished': False}
+    last_report = time.time()
+    pool = eventlet.GreenPool(workers)
+    for result in pool.imap(_restore, _names()):
+        progress['scanned'] += 1
+        progress[result] += 1
+        if time.time() - last_report >= progress_interval:
+            last_report = time.time()
+            yield dict(progress)
+    yield dict(progress, finished=True)
+
+
+class BlockRestore(object):
+    '''Serves ranged GETs of a remote object from fixed-size blocks that are
+    restored into Swift as they are requested.
+
+    The blocks are stored in the <container>+blocks container of the internal
+    (hidden) account, keyed by the hash of the object path, the remote ETag,
+    and the block size, so that the blocks of an object that changed in the
+    remote store are never mixed.
+    The remote headers of the object are stored next to its blocks, so that
+    the stored blocks are served without requests to the remote store. They
+    are fetched again if a block cannot be restored (e.g. the remote object
+    changed).
+    Once all of the blocks of the object are present, the object is restored
+    from them (matching the remote ETag) and the blocks are removed.
+    '''
+    def __init__(self, provider, obj, path, app, logger, block_size,
+                 trans_id=''):
+        '''
+        :param path: the quoted Swift path of the object.
+        '''
+        self.provider = provider
+        self.obj = obj
+        self.path = path
+        self.app = app
+        self.logger = logger
+        self.block_size = block_size
+        self.trans_id = trans_id
+        _, version, account, container, _ = path.split('/', 4)
+        self.container_path = '/'.join(
+            ['', version, get_internal_account(account),
+             container + BLOCKS_CONTAINER_SUFFIX])
+        self.info_path = '/'.join(
+            [self.container_path, hashlib.md5(path).hexdigest()])
+        # The remote headers of the object and the number of leading blocks
+        # known to be stored
+        self.info = None
+        self.prefix = None
+        self.length = None
+
+    def get_range(self, range_header):
+        '''Returns the (status, headers, app_iter) response to a GET of the
+        range, or None if the request should be proxied to the remote store
+        (e.g. multiple ranges or a remote error).
+        '''
+        try:
+            byte_range = Range(range_header)
+        except ValueError:
+            return None
+        info = self._get_info()
+        stored = info is not None
+        if not stored:
+            info = self._get_remote_info()
+            if info is None:
+                return None
+        headers = info['headers']
+        remote_headers = dict((k.lower(), v) for k, v in headers)
+        self.length = int(remote_headers['content-length'])
+        ranges = byte_range.ranges_for_length(self.length)
+        if not ranges or len(ranges) > 1:
+            return None
+        start, stop = ranges[0]
+        self.info = info
+        self.prefix = '/'.join([
+            hashlib.md5(self.path).hexdigest(),
+            remote_headers['etag'].strip('"'), str(self.block_size)])
+        if not stored:
+            self._put_info()
+
+        resp_headers = [(k, v) for k, v in headers
+                        if k.lower() not in ('content-length',
+                                             'content-range')]
+        resp_headers.extend([
+            ('Content-Length', str(stop - start)),
+            ('Content-Range', 'bytes %d-%d/%d' % (
+                start, stop - 1, self.length))])
+        return ('206 Partial Content', resp_headers,
+                self._iter_range(start, stop))
+
+    def _get_info(self):
+        resp = Request.blank(self.info_path).get_response(self.app)
+        if not resp.is_success:
+            close_if_possible(resp.app_iter)
+            return None
+        try:
+            info = json.loads(resp.body)
+        except ValueError:
+            self.logger.warning('Invalid block restore info: %s' %
+                                self.info_path)
+            return None
+        # The header values are decoded by the JSON parser
+        info['headers'] = [
+            (k.encode('utf-8'), v.encode('utf-8'))
+            for k, v in info['headers']]
+        return info
+
+    def _get_remote_info(self):
+        req = Request.blank(self.path, environ={
+            'REQUEST_METHOD': 'HEAD', 'swift.trans_id': self.trans_id})
+        status, headers, body = self.provider.shunt_object(req, self.obj)
+        close_if_possible(body)
+        if not status.startswith('200 '):
+            return None
+        if 'etag' not in [k.lower() for k, _ in headers]:
+            return None
+        return {'headers': [(k, v if isinstance(v, basestring) else str(v))
+                            for k, v in headers],
+                'restored_blocks': 0}
+
+    def _put_info(self):
+        self._put(self.info_path, json.dumps(self.info))
+
+    def _block_path(self, index):
+        return '/'.join([self.container_path, self.prefix, '%08d' % index])
+
+    def _block_count(self):
+        return (self.length + self.block_size - 1) // self.block_size
+
+    def _iter_range(self, start, stop):
+        fetched = False
+        try:
+            for index in range(start // self.block_size,
+                               (stop - 1) // self.block_size + 1):
+                block_start = index * self.block_size
+                # The part of the range within the block
+                offset = max(start, block_start) - block_start
+                end = min(stop, block_start + self.block_size) - block_start
+                resp = Request.blank(
+                    self._block_path(index), method='GET',
+                    headers={'Range': 'bytes=%d-%d' % (offset, end - 1)}
+                ).get_response(self.app)
+                if resp.is_success:
+                    for chunk in resp.app_iter:
+                        yield chunk
+                    close_if_possible(resp.app_iter)
+                    continue
+                close_if_possible(resp.app_iter)
+                data = self._restore_block(index)
+                fetched = True
+                yield data[offset:end]
+        except Exception:
+            self.logger.exception('Failed to get the blocks of %s' %
+                                  self.path)
+            # The remote object may have changed; its headers are fetched
+            # again on the next request
+            self._delete(self.info_path)
+            # The response is cut short, rather than completed silently
+            raise
+        if fetched and self._all_blocks_restored():
+            eventlet.spawn_n(self._restore_from_blocks)
+
+    def _restore_block(self, index):
+        '''Fetches the block from the remote store and stores it in Swift.
+
+        :returns: the contents of the block.
+        '''
+        block_start = index * self.block_size
+        block_end = min(block_start + self.block_size, self.length)
+        req = Request.blank(self.path, environ={
+            'REQUEST_METHOD': 'GET', 'swift.trans_id': self.trans_id},
+            headers={'Range': 'bytes=%d-%d' % (block_start, block_end - 1)})
+        status, _, body = self.provider.shunt_object(req, self.obj)
+        try:
+            if not status.startswith(('200 ', '206 ')):
+                raise RuntimeError('Failed to fetch the block: %s' % status)
+            data = ''.join(body)
+        finally:
+            close_if_possible(body)
+        if len(data) != block_end - block_start:
+            raise RuntimeError('Unexpected block length: %d' % len(data))
+        self._put(self._block_path(index), data)
+        return data
+
+    def _put(self, path, data):
+        for attempt in range(2):
+            resp = Request.blank(path, method='PUT',
+                                 body=data).get_response(self.app)
+            close_if_possible(resp.app_iter)
+            if resp.status_int != 404 or attempt:
+                break
+            resp = Request.blank(self.container_path, method='PUT'
+                                 ).get_response(self.app)
+            close_if_possible(resp.app_iter)
+        if not resp.is_success:
+            self.logger.warning('Failed to store %s: %s' % (
+                path, resp.status))
+
+    def _delete(self, path):
+        resp = Request.blank(path, method='DELETE').get_response(self.app)
+        close_if_possible(resp.app_iter)
+
+    def _all_blocks_restored(self):
+        '''Checks whether all of the blocks are stored.
+
+        The check starts at the first block that was missing in the previous
+        check (kept in the info of the object), so that every block is
+        checked once while the object is restored, rather than listing all
+        of the blocks on every request. The count is only advanced past
+        blocks that are present, so concurrent updates can cause extra
+        checks, but never a restore with missing blocks.
+        '''
+        restored = self.info['restored_blocks']
+        index = restored
+        while index < self._block_count():
+            resp = Request.blank(self._block_path(index), method='HEAD'
+                                 ).get_response(self.app)
+            close_if_possible(resp.app_iter)
+            if not resp.is_success:
+                break
+            index += 1
+        if index > restored:
+            self.info['restored_blocks'] = index
+            self._put_info()
+        return index == self._block_count()
+
+    def _iter_blocks(self):
+        for index in range(self._block_count()):
+            resp = Request.blank(self._block_path(index)).get_response(
+                self.app)
+            if not resp.is_success:
+                close_if_possible(resp.app_iter)
+                raise RuntimeError('Failed to get the block %s: %s' % (
+                    self._block_path(index), resp.status))
+            for chunk in resp.app_iter:
+                yield chunk
+            close_if_possible(resp.app_iter)
+
+    def _restore_from_blocks(self):
+        try:
+            resp = Request.blank(self.path, method='HEAD').get_response(
+                self.app)
+            close_if_possible(resp.app_iter)
+            if resp.is_success:
+                # Restored by another request
+                return
+            put_headers = convert_to_local_headers(self.info['headers'])
+            if check_slo(put_headers):
+                manifest = self.provider.get_manifest(self.obj)
+                if not manifest:
+                    self.logger.error('Failed to restore slo object due to '
+                                      'missing manifest: %s' % self.obj)
+                    return
+                wrapper = SwiftSloPutWrapper(
+                    self._iter_blocks(), put_headers, self.path, self.app,
+                    manifest, self.logger)
+            else:
+                wrapper = SwiftPutWrapper(
+                    self._iter_blocks(), put_headers, self.path, self.app,
+                    self.logger)
+            for _ in wrapper:
+                pass
+            if wrapper.failed:
+                return
+            for index in range(self._block_count()):
+                self._delete(self._block_path(index))
+            self._delete(self.info_path)
+        except Exception:
+            self.logger.exception('Failed to restore %s from its blocks' %
+                                  self.path)
+
+
+class RestoreQueue(object):
+    '''Restores objects in the background with a bounded pool of workers.
+
+    An object is restored once, no matter how many requests ask for it while
+    its restore is pending. Requests are dropped when the queue is full.
+    '''
+    def __init__(self, app, logger, workers,
+                 queue_size=DEFAULT_RESTORE_QUEUE_SIZE):
+        self.app = app
+        self.logger = logger
+        self.worker_count = workers
+        self.queue = eventlet.queue.LightQueue(queue_size)
+        self.pending = set()
+        # Workers are started on the first restore, as the queue is created
+        # before the proxy forks
+        self.workers = []
+
+    def submit(self, sync_profile, per_account, obj, path, trans_id=''):
+        '''Queues the restore of the object.
+
+        :param path: the quoted Swift path of the object.
+        :returns: True if the restore is queued or in progress; False if the
+                  queue is full.
+        '''
+        if path in self.pending:
+            return True
+        try:
+            self.queue.put_nowait(
+                (sync_profile, per_account, obj, path, trans_id))
+        except eventlet.queue.Full:
+            self.logger.warning(
+                'The restore queue is full; not restoring %s' % path)
+            self.logger.increment(
+                get_metric_name('restore', sync_profile, 'dropped'))
+            return False
+        self.pending.add(path)
+        if not self.workers:
+            self.workers = [eventlet.spawn(self._worker)
+                            for _ in range(self.worker_count)]
+        return True
+
+    def _worker(self):
+        while True:
+            self._restore(*self.queue.get())
+
+    def _restore(self, sync_profile, per_account, obj, path, trans_id):
+        start = time.time()
+        result = 'failed'
+        try:
+            provider = create_provider(sync_profile, max_conns=1,
+                                       per_account=per_account)
+            result = restore_missing_object(provider, obj, path, self.app,
+                                            self.logger, trans_id)
+            if result == 'failed':
+                self.logger.warning('Failed to restore %s' % path)
+        except Exception:
+            self.logger.exception('Failed to restore %s' % path)
+        finally:
+            self.pending.discard(path)
+            metric = get_metric_name('restore', sync_profile, result)
+            self.logger.increment(metric)
+            self.logger.timing_since(metric + '.timing', start)
@@ -14,6 +14,8 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import eventlet
+import hashlib
 import json
 
 from os.path import getmtime
@@ -22,15 +24,22 @@ from swift.common.wsgi import make_subrequest
 from swift.proxy.controllers.base import get_account_info
 from time import time
 
+from .access_tracker import (AccessTracker, DEFAULT_FLUSH_INTERVAL,
+                             DEFAULT_SAMPLE_RATE)
+from .base_sync import ProviderResponse
 from .provider_factory import create_provider
+from .restore import (BlockRestore, DEFAULT_PREFETCH_WORKERS,
+                      DEFAULT_RESTORE_QUEUE_SIZE, iter_restore_prefix,
+                      RestoreQueue)
 from .utils import (check_slo, SwiftPutWrapper, SwiftSloPutWrapper,
                     RemoteHTTPError, convert_to_local_headers,
                     response_is_complete, filter_hop_by_hop_headers,
                     iter_listing, get_container_headers,
                     MigrationContainerStates, get_sys_migrator_header,
-                    get_list_params, format_listing_response,
-                    format_container_listing_response, splice_listing,
-                    SHUNT_BYPASS_HEADER, get_listing_content_type)
+                    get_list_params, iter_listing_response,
+                    iter_container_listing_response, iter_splice_listing,
+                    iter_json_listing, ListingLimit, SHUNT_BYPASS_HEADER,
+                    get_listing_content_type, get_metric_name)
 
 
 class S3SyncProxyFSSwitch(object):
@@ -65,7 +74,19 @@ class S3SyncProxyFSSwitch(object):
             'proxyfs-bimodal'))
 
 
-SECRETS = ('aws_secret',)
+SECRETS = ('aws_secret', 'remote_temp_url_key')
+# How long (in seconds) the URLs of redirected GETs are valid by default
+DEFAULT_REDIRECT_EXPIRES = 300
+LISTING_CACHE_PREFIX = 'cloud_shunt/listing'
+# The cached pages of the remote listings are requested with the page size
+# rounded up to a power of ten (up to the largest page S3 returns), so that the
+# listings with similar limits share them
+LISTING_CACHE_MIN_PAGE_SIZE = 10
+LISTING_CACHE_MAX_PAGE_SIZE = 1000
+OBJECT_CACHE_PREFIX = 'cloud_shunt/object'
+# The requests for the manifests or symlinks themselves get different remote
+# responses than the requests for the objects, so they bypass the object cache
+OBJECT_CACHE_BYPASS_PARAMS = ('multipart-manifest', 'symlink')
 
 
 def redact_secrets(profile):
@@ -76,6 +97,10 @@ def redact_secrets(profile):
     return newdict
 
 
+def is_conditional(req):
+    return any(header.lower().startswith('if-') for header in req.headers)
+
+
 def maybe_munge_profile_for_all_containers(sync_profile, container_name):
     """
     Takes a sync profile config and a UTF8-encoded container name, and returns
@@ -107,6 +132,110 @@ def maybe_munge_profile_for_all_containers(sync_profile, container_name):
     return sync_profile, False
 
 
+def _listing_headers(headers, resp_type):
+    '''The spliced listings are streamed, so the length is not known.'''
+    listing_headers = [(header, value) for header, value in headers
+                       if header.lower() not in ('content-length',
+                                                 'content-type')]
+    listing_headers.append(('Content-Type', resp_type))
+    return listing_headers
+
+
+def _get_cached_page_size(limit):
+    page_size = LISTING_CACHE_MIN_PAGE_SIZE
+    while page_size < min(limit, LISTING_CACHE_MAX_PAGE_SIZE):
+        page_size *= 10
+    return page_size
+
+
+def _iter_lazily(get_listing, *args):
+    '''Requests the first page of the listing once its first entry is needed,
+    rather than before the response is started.'''
+    _, listing = get_listing(*args)
+    for entry in listing:
+        yield entry
+
+
+def _load_local_listing(app_iter):
+    '''Parses the local listing before the response is started, so that a
+    malformed listing fails the request rather than truncating the
+    response.'''
+    try:
+        return list(iter_json_listing(app_iter))
+    finally:
+        utils.close_if_possible(app_iter)
+
+
+class HedgedRequest(object):
+    '''Requests an object from the remote store after a delay, unless the
+    request is cancelled first (e.g. because the object was found locally).'''
+    def __init__(self, provider, req, obj, delay):
+        self.provider = provider
+        self.cancelled = False
+        self.thread = eventlet.spawn(self._run, req, obj, delay)
+
+    def _run(self, req, obj, delay):
+        eventlet.sleep(delay)
+        if self.cancelled:
+            return None
+        return self.provider.shunt_object(req, obj)
+
+    def wait(self):
+        return self.thread.wait()
+
+    def cancel(self):
+        '''Discards the remote response, once it arrives.'''
+        self.cancelled = True
+        self.thread.link(self._close)
+
+    @staticmethod
+    def _close(thread):
+        try:
+            resp = thread.wait()
+        except Exception:
+            return
+        if resp is not None:
+            utils.close_if_possible(resp[2])
+
+
+def get_shunt_profiles(conf):
+    '''Returns the profiles of the containers handled by the shunt, keyed by
+    the (UTF-8 encoded) account and container.'''
+    sync_profiles = {}
+    for cont in conf.get('containers', []):
+        # ONLY use shunt if merge_namespaces is set to true for sync
+        if not cont.get('merge_namespaces', False):
+            continue
+        key = (cont['account'].encode('utf-8'),
+               cont['container'].encode('utf-8'))
+        sync_profiles[key] = cont
+
+    for migration in conf.get('migrations', []):
+        profile = dict(migration)
+        # Migrations should have some sane defaults if they aren't present
+        profile.setdefault('restore_object', True)
+        profile.setdefault('container', profile['aws_bucket'])
+        profile.setdefault('migration', True)
+        # if, in the future, we support custom_prefix on the S3 side,
+        # we may need to change this. Swift side code ignores custom_prefix
+        profile['custom_prefix'] = ''
+        key = (profile['account'].encode('utf-8'),
+               profile['container'].encode('utf-8'))
+        sync_profiles[key] = profile
+    return sync_profiles
+
+
+def find_sync_profile(sync_profiles, acct, cont):
+    '''Returns the profile that applies to the container and whether it is a
+    per-account profile, or (None, False) if there is none.'''
+    sync_profile = next((sync_profiles[(acct, c)]
+                         for c in (cont, '/*')
+                         if (acct, c) in sync_profiles), None)
+    if sync_profile is None:
+        return None, False
+    return maybe_munge_profile_for_all_containers(sync_profile, cont)
+
+
 class S3SyncShunt(object):
     def __init__(self, app, conf_file, conf):
         self.logger = utils.get_logger(
@@ -115,6 +244,32 @@ class S3SyncShunt(object):
 
         self.app = app
         self.conf_file = conf_file
+        # Remote listing pages are cached in memcache for this many seconds
+        # (0 disables the cache)
+        self.listing_cache_ttl = int(conf.get('listing_cache_ttl', 0))
+        # Remote HEAD results and remote 404s are cached for these many
+        # seconds (0 disables the cache)
+        self.object_cache_ttl = int(conf.get('object_cache_ttl', 0))
+        self.negative_cache_ttl = int(conf.get('negative_cache_ttl', 0))
+        # With restore workers, objects are restored in the background, rather
+        # than by teeing the response to the client
+        restore_workers = int(conf.get('restore_workers', 0))
+        if restore_workers > 0:
+            self.restore_queue = RestoreQueue(
+                app, self.logger, restore_workers,
+                int(conf.get('restore_queue_size',
+                             DEFAULT_RESTORE_QUEUE_SIZE)))
+        else:
+            self.restore_queue = None
+        # Upper bound on the concurrency of a prefix restore request
+        self.max_prefetch_workers = int(conf.get(
+            'max_prefetch_workers', DEFAULT_PREFETCH_WORKERS))
+        # Reads of the objects in the containers whose profiles set
+        # access_window, which defer their archival
+        self.access_tracker = AccessTracker(
+            app, self.logger,
+            float(conf.get('access_sample_rate', DEFAULT_SAMPLE_RATE)),
+            int(conf.get('access_flush_interval', DEFAULT_FLUSH_INTERVAL)))
         self.sync_profiles = {}
         self.reload_time = 15
         self._rtime = 0
@@ -135,27 +290,7 @@ class S3SyncShunt(object):
         except (IOError, ValueError, OSError):
             conf = {'containers': []}
 
-        self.sync_profiles = {}
-        for cont in conf.get('containers', []):
-            # ONLY use shunt if merge_namespaces is set to true for sync
-            if not cont.get('merge_namespaces', False):
-                continue
-            key = (cont['account'].encode('utf-8'),
-                   cont['container'].encode('utf-8'))
-            self.sync_profiles[key] = cont
-
-        for migration in conf.get('migrations', []):
-            profile = dict(migration)
-            # Migrations should have some sane defaults if they aren't present
-            profile.setdefault('restore_object', True)
-            profile.setdefault('container', profile['aws_bucket'])
-            profile.setdefault('migration', True)
-            # if, in the future, we support custom_prefix on the S3 side,
-            # we may need to change this. Swift side code ignores custom_prefix
-            profile['custom_prefix'] = ''
-            key = (profile['account'].encode('utf-8'),
-                   profile['container'].encode('utf-8'))
-            self.sync_profiles[key] = profile
+        self.sync_profiles = get_shunt_profiles(conf)
 
     def __call__(self, env, start_response):
         if time() > self._rtime:
@@ -186,13 +321,21 @@ class S3SyncShunt(object):
 
             return self.app(env, start_response)
 
-        sync_profile = next((self.sync_profiles[(acct, c)]
-                             for c in (cont, '/*')
-                             if (acct, c) in self.sync_profiles), None)
+        sync_profile, per_account = find_sync_profile(
+            self.sync_profiles, acct, cont)
         if sync_profile is None:
             return self.app(env, start_response)
-        sync_profile, per_account = maybe_munge_profile_for_all_containers(
-            sync_profile, cont)
+
+        if req.method == 'POST' and not obj and 'restore' in req.params:
+            return self.handle_prefix_restore(
+                req, start_response, sync_profile, acct, cont, per_account)
+
+        if req.method in ('PUT', 'POST', 'DELETE'):
+            # The cache is invalidated once the write succeeds, rather than
+            # before it is forwarded, as a read handled while the write is in
+            # progress would cache the old data again.
+            start_response = self._invalidate_on_success(
+                req, start_response, sync_profile, acct, cont, obj)
 
         if req.method == 'DELETE' and sync_profile.get('migration'):
             return self.handle_delete(
@@ -219,13 +362,116 @@ class S3SyncShunt(object):
 
         return self.app(env, start_response)
 
+    def _record(self, op, sync_profile, outcome, start):
+        '''Counts the request and records the time until its response
+        started, labelled by the operation, the profile and the outcome.'''
+        metric = get_metric_name(op, sync_profile, outcome)
+        self.logger.increment(metric)
+        self.logger.timing_since(metric + '.timing', start)
+
+    def _iter_with_metrics(self, app_iter, op, sync_profile):
+        '''Counts the bytes proxied from the remote store and, if the response
+        is teed into Swift, whether the object was restored.'''
+        transferred = 0
+        try:
+            for chunk in app_iter:
+                transferred += len(chunk)
+                yield chunk
+        finally:
+            utils.close_if_possible(app_iter)
+            self.logger.update_stats(
+                get_metric_name(op, sync_profile, 'bytes'), transferred)
+        if isinstance(app_iter, SwiftPutWrapper):
+            self.logger.increment(get_metric_name(
+                'restore', sync_profile,
+                'failed' if app_iter.failed else 'restored'))
+            self.logger.update_stats(
+                get_metric_name('restore', sync_profile, 'bytes'),
+                transferred)
+
+    @staticmethod
+    def _listing_generation_key(acct, cont):
+        return '/'.join([LISTING_CACHE_PREFIX, 'generation', acct, cont])
+
+    @staticmethod
+    def _object_cache_key(sync_profile, acct, cont, obj):
+        profile = json.dumps(redact_secrets(sync_profile), sort_keys=True)
+        return '/'.join([OBJECT_CACHE_PREFIX, acct, cont, hashlib.md5(
+            json.dumps([profile, obj])).hexdigest()])
+
+    def invalidate_cache(self, req, sync_profile, acct, cont, obj):
+        '''Invalidates the cached remote listing pages of the container and
+        the cached remote metadata of the object, as the request may change
+        them.'''
+        memcache = req.environ.get('swift.cache')
+        if memcache is None:
+            return
+        try:
+            if obj and (self.object_cache_ttl or self.negative_cache_ttl):
+                memcache.delete(
+                    self._object_cache_key(sync_profile, acct, cont, obj))
+            if self.listing_cache_ttl:
+                memcache.incr(self._listing_generation_key(acct, cont))
+        except Exception as e:
+            self.logger.warning(
+                'Failed to invalidate the cache of %s: %s' % (req.path, e))
+
+    def _invalidate_on_success(self, req, start_response, sync_profile, acct,
+                               cont, obj):
+        def _start_response(status, headers, exc_info=None):
+            if status.startswith('2'):
+                self.invalidate_cache(req, sync_profile, acct, cont, obj)
+            return start_response(status, headers, exc_info)
+        return _start_response
+
+    def _cached_list_func(self, req, sync_profile, list_func):
+        '''Wraps the listing function of the provider to cache the pages of
+        the remote listing.
+
+        The cache keys include a per-container generation number, which is
+        incremented to invalidate all of the cached pages of the container.
+        The limit of the requested page is rounded up by
+        _get_cached_page_size().
+        '''
+        memcache = req.environ.get('swift.cache')
+        if not self.listing_cache_ttl or memcache is None:
+            return list_func
+        _, acct, cont, _ = req.split_path(3, 4, True)
+        generation = memcache.get(
+            self._listing_generation_key(acct, cont)) or 0
+        profile = json.dumps(redact_secrets(sync_profile), sort_keys=True)
+
+        def _list(marker, limit, prefix, delimiter):
+            page_size = _get_cached_page_size(limit)
+            key = '/'.join([LISTING_CACHE_PREFIX, acct, cont, hashlib.md5(
+                json.dumps([profile, generation, marker, page_size, prefix,
+                            delimiter])).hexdigest()])
+            cached = memcache.get(key)
+            if cached is not None:
+                self.logger.increment('listing_cache.hit')
+                return ProviderResponse(
+                    True, cached['status'], cached['headers'],
+                    cached['body'])
+            self.logger.increment('listing_cache.miss')
+            resp = list_func(marker, page_size, prefix, delimiter)
+            if resp.success:
+                memcache.set(key, {'status': resp.status,
+                                   'headers': resp.headers,
+                                   'body': resp.body},
+                             time=self.listing_cache_ttl)
+            return resp
+        return _list
+
     def iter_remote_objects(
-            self, sync_profile, per_account, marker, limit, prefix, delimiter):
+            self, sync_profile, per_account, marker, limit, prefix, delimiter,
+            req=None):
         provider = create_provider(sync_profile, max_conns=1,
                                    per_account=per_account)
+        list_func = provider.list_objects
+        if req is not None:
+            list_func = self._cached_list_func(req, sync_profile, list_func)
         return iter_listing(
-            provider.list_objects, self.logger, marker, limit, prefix,
-            delimiter)
+            list_func, self.logger, marker, limit, prefix, delimiter)
 
     def iter_remote_account(
             self, sync_profile, marker, limit, prefix, delimiter):
@@ -235,6 +481,7 @@ class S3SyncShunt(object):
             provider.list_buckets, self.logger, marker, limit, prefix, False)
 
     def handle_account(self, req, start_response, sync_profile, account):
+        start = time()
         limit, marker, prefix, delimiter, _ = get_list_params(
             req, constraints.ACCOUNT_LISTING_LIMIT)
         resp_type = get_listing_content_type(req)
@@ -246,27 +493,30 @@ class S3SyncShunt(object):
         if not status.startswith('200 '):
             # Only splice 200 (since it's JSON, we know there won't be a 204).
             # The account must exist in both clusters.
+            self._record('account.GET', sync_profile, 'local', start)
             start_response(status, headers)
             return app_iter
 
-        _, remote_iter = self.iter_remote_account(
-            sync_profile, marker, limit, prefix, delimiter)
-        spliced = splice_listing(
-            json.load(utils.FileLikeIter(app_iter)), remote_iter, limit)
-        response = format_container_listing_response(
+        local_listing = _load_local_listing(app_iter)
+        listing_limit = ListingLimit(limit)
+        remote_iter = _iter_lazily(
+            self.iter_remote_account, sync_profile, marker,
+            listing_limit.remaining, prefix, delimiter)
+        spliced = iter_splice_listing(
+            local_listing, remote_iter, listing_limit)
+        response = iter_container_listing_response(
             spliced, resp_type, account)
-        dict_headers = dict(headers)
-        dict_headers['Content-Length'] = len(response)
-        dict_headers['Content-Type'] = resp_type
-        start_response(status, dict_headers.items())
+        self._record('account.GET', sync_profile, 'spliced', start)
+        start_response(status, _listing_headers(headers, resp_type))
         return response
 
     def handle_object_put(
             self, req, start_response, sync_profile, per_account):
-
+        start = time()
         status, headers, app_iter = req.call_application(self.app)
 
         if not status.startswith('404 '):
+            self._record('object.PUT', sync_profile, 'local', start)
             start_response(status, headers)
             return app_iter
 
@@ -280,6 +530,8 @@ class S3SyncShunt(object):
                 self.logger.warning(
                     'Failed to query the remote container (%d): %s' % (
                         e.resp.status, e.resp.body))
+                self._record('object.PUT', sync_profile,
+                             'remote_%d' % e.resp.status, start)
                 start_response(status, headers)
                 return app_iter
 
@@ -298,19 +550,25 @@ class S3SyncShunt(object):
 
         if int(status.split()[0]) // 100 != 2:
             self.logger.warning('Failed to create container: %s' % status)
+            outcome = 'container_failed'
+        else:
+            outcome = 'container_created'
 
         status, headers, app_iter = req.call_application(self.app)
+        self._record('object.PUT', sync_profile, outcome, start)
         start_response(status, headers)
         return app_iter
 
     def handle_listing(self, req, start_response, sync_profile, cont,
                        per_account):
+        start = time()
         limit, marker, prefix, delimiter, path = get_list_params(
             req, constraints.CONTAINER_LISTING_LIMIT)
 
         if path:
             # We do not support the path parameter in listings
             status, headers, app_iter = req.call_application(self.app)
+            self._record('container.GET', sync_profile, 'local', start)
             start_response(status, headers)
             return app_iter
 
@@ -324,15 +582,19 @@ class S3SyncShunt(object):
                 (status.startswith('404 ') and sync_profile.get('migration')):
             # Only splice 200 or 404 on migrations (since it's JSON, we know
             # there won't be a 204)
+            self._record('container.GET', sync_profile, 'local', start)
             start_response(status, headers)
             return app_iter
 
-        remote_resp, remote_iter = self.iter_remote_objects(
-            sync_profile, per_account, marker, limit, prefix, delimiter)
-
+        # The remote pages are requested as the listing is streamed and
+        # only ask for the entries that are still missing.
+        listing_limit = ListingLimit(limit)
         if status.startswith('404 '):
             # This must be a migration, where the container has not yet been
-            # created
+            # created. The remote response replaces the local one.
+            remote_resp, remote_iter = self.iter_remote_objects(
+                sync_profile, per_account, marker, listing_limit.remaining,
+                prefix, delimiter, req)
             headers = {}
             for hdr in remote_resp.headers:
                 # These are set after we mutate the request in the appropriate
@@ -343,17 +605,23 @@ class S3SyncShunt(object):
                     remote_resp.headers[hdr].encode('utf8')
             # TODO: If to_wsgi does the utf8 header encoding, we wouldn't have
             # to worry about it here.
+            headers = headers.items()
             status = remote_resp.to_wsgi()[0]
-            spliced = splice_listing([], remote_iter, limit)
+            utils.close_if_possible(app_iter)
+            spliced = iter_splice_listing([], remote_iter, listing_limit)
+            outcome = 'remote'
         else:
-            spliced = splice_listing(
-                json.load(utils.FileLikeIter(app_iter)), remote_iter, limit)
-
-        response = format_listing_response(spliced, resp_type, cont)
-        dict_headers = dict(headers)
-        dict_headers['Content-Length'] = len(response)
-        dict_headers['Content-Type'] = resp_type
-        start_response(status, dict_headers.items())
+            local_listing = _load_local_listing(app_iter)
+            remote_iter = _iter_lazily(
+                self.iter_remote_objects, sync_profile, per_account, marker,
+                listing_limit.remaining, prefix, delimiter, req)
+            spliced = iter_splice_listing(
+                local_listing, remote_iter, listing_limit)
+            outcome = 'spliced'
+
+        response = iter_listing_response(spliced, resp_type, cont)
+        self._record('container.GET', sync_profile, outcome, start)
+        start_response(status, _listing_headers(headers, resp_type))
         return response
 
     def handle_container_head(self, req, start_response, sync_profile, cont,
@@ -391,11 +659,97 @@ class S3SyncShunt(object):
         start_response('204 No Content', headers)
         return []
 
+    def _get_cached_object(self, req, sync_profile, obj):
+        '''Returns the memcache client and the cache key for the remote
+        metadata of the object, along with the cached entry, if any.
+
+        The cached HEAD results are only used for unconditional HEAD
+        requests, while the cached 404s apply to all requests, except for the
+        ones with OBJECT_CACHE_BYPASS_PARAMS.
+        '''
+        memcache = req.environ.get('swift.cache')
+        if memcache is None or not (
+                self.object_cache_ttl or self.negative_cache_ttl):
+            return None, None, None
+        if any(param in req.params for param in OBJECT_CACHE_BYPASS_PARAMS):
+            return None, None, None
+        _, acct, cont, _ = req.split_path(4, 4, True)
+        key = self._object_cache_key(sync_profile, acct, cont, obj)
+        cached = memcache.get(key)
+        if cached is None:
+            self.logger.increment('object_cache.miss')
+        elif cached['status'].startswith('404 '):
+            self.logger.increment('object_cache.negative_hit')
+        elif req.method == 'HEAD' and not is_conditional(req):
+            self.logger.increment('object_cache.hit')
+        else:
+            cached = None
+        return memcache, key, cached
+
+    def _cache_object(self, req, memcache, key, status, headers):
+        if status.startswith('404 ') and self.negative_cache_ttl:
+            memcache.set(key, {'status': status},
+                         time=self.negative_cache_ttl)
+        elif status.startswith('200 ') and req.method == 'HEAD' and\
+                self.object_cache_ttl and not is_conditional(req):
+            memcache.set(key, {'status': status, 'headers': headers},
+                         time=self.object_cache_ttl)
+
+    def _start_hedge(self, req, sync_profile, obj, per_account):
+        '''Starts the remote request for the object while the local request
+        is in progress, for the profiles that set hedge_delay (in seconds) or
+        archive_first (no delay). The local response still takes precedence.
+        '''
+        if sync_profile.get('archive_first'):
+            delay = 0
+        elif sync_profile.get('hedge_delay') is not None:
+            delay = float(sync_profile['hedge_delay'])
+        else:
+            return None
+        if sync_profile.get('redirect_threshold') or\
+                self._use_block_restore(req, sync_profile):
+            # Redirects only need the remote HEAD and block restores fetch
+            # whole blocks
+            return None
+        provider = create_provider(sync_profile, max_conns=1,
+                                   per_account=per_account)
+        # The local request may change the request while the remote one is in
+        # progress, so the remote request uses a copy of it
+        hedge_req = swob.Request.blank(req.path, environ={
+            'REQUEST_METHOD': req.method,
+            'swift.trans_id': req.environ.get('swift.trans_id', '')},
+            headers=dict(req.headers))
+        return HedgedRequest(provider, hedge_req, obj.decode('utf-8'), delay)
+
+    @staticmethod
+    def _use_block_restore(req, sync_profile):
+        '''Ranged GETs are served from (and restore) blocks of the object
+        for the profiles that set restore_block_size (in bytes).'''
+        return req.method == 'GET' and 'range' in req.headers and\
+            sync_profile.get('restore_object', False) and\
+            int(sync_profile.get('restore_block_size', 0)) > 0 and\
+            not is_conditional(req)
+
+    @staticmethod
+    def _get_remote_object(req, provider, obj, hedge):
+        if hedge:
+            return hedge.wait()
+        return provider.shunt_object(req, obj)
+
     def handle_object(self, req, start_response, sync_profile, obj,
                       per_account):
+        start = time()
+        op = 'object.%s' % req.method
+        hedge = self._start_hedge(req, sync_profile, obj, per_account)
         status, headers, app_iter = req.call_application(self.app)
         if not status.startswith('404 '):
             # Only shunt 404s
+            if hedge:
+                hedge.cancel()
+            if req.method == 'GET' and status.startswith('2'):
+                self.access_tracker.record(
+                    sync_profile, *req.split_path(4, 4, True))
+            self._record(op, sync_profile, 'local', start)
             start_response(status, headers)
             return app_iter
         self.logger.debug('404 for %s; shunting to %r'
@@ -405,46 +759,179 @@ class S3SyncShunt(object):
         trans_id_headers = [(h, v) for h, v in headers if h.lower() in (
             'x-trans-id', 'x-openstack-request-id')]
 
+        memcache, cache_key, cached = self._get_cached_object(
+            req, sync_profile, obj)
+        if cached is not None:
+            self.logger.debug('Cached remote resp: %s' % cached['status'])
+            if hedge:
+                hedge.cancel()
+            if cached['status'].startswith('404 '):
+                # The local 404 is as good as the remote one
+                self._record(op, sync_profile, 'negative_cache', start)
+                start_response(status, headers)
+                return app_iter
+            utils.close_if_possible(app_iter)
+            self._record(op, sync_profile, 'cache', start)
+            start_response(cached['status'], [
+                (k.encode('utf-8'), v.encode('utf-8'))
+                for k, v in cached['headers']] + trans_id_headers)
+            return []
+
         utils.close_if_possible(app_iter)
 
-        provider = create_provider(sync_profile, max_conns=1,
-                                   per_account=per_account)
+        if hedge:
+            provider = hedge.provider
+        else:
+            provider = create_provider(sync_profile, max_conns=1,
+                                       per_account=per_account)
         if req.method == 'GET' and sync_profile.get('restore_object', False) \
                 and 'range' not in req.headers:
-            # We incur an extra request hit by checking for a possible SLO.
             obj = obj.decode('utf-8')
-            manifest = provider.get_manifest(obj)
-            self.logger.debug("Manifest: %s" % manifest)
-            status, headers, app_iter = provider.shunt_object(req, obj)
-
-            if response_is_complete(int(status.split()[0]), headers):
-                put_headers = convert_to_local_headers(headers)
-                if check_slo(put_headers):
-                    if manifest:
-                        app_iter = SwiftSloPutWrapper(
-                            app_iter, put_headers, req.environ['PATH_INFO'],
-                            self.app, manifest, self.logger)
-                    else:
-                        # if slo manifest is missing, log error, don't attempt
-                        # to restore object, but continue shunt
-                        self.logger.error('Failed to restore slo object due '
-                                          'to missing manifest: %s' % obj)
-                else:
-                    app_iter = SwiftPutWrapper(
-                        app_iter, put_headers, req.environ['PATH_INFO'],
-                        self.app, self.logger)
+            if self.restore_queue:
+                # The restore fetches the object separately, so that it does
+                # not depend on the client
+                status, headers, app_iter = self._get_remote_object(
+                    req, provider, obj, hedge)
+                if response_is_complete(int(status.split()[0]), headers):
+                    # The restore parses the (quoted) path as a URL
+                    self.restore_queue.submit(
+                        sync_profile, per_account, obj, req.path,
+                        req.environ.get('swift.trans_id', ''))
+            else:
+                status, headers, app_iter = self._shunt_and_restore(
+                    req, provider, obj, hedge)
+        elif self._use_block_restore(req, sync_profile):
+            block_restore = BlockRestore(
+                provider, obj.decode('utf-8'), req.path,
+                self.app, self.logger, int(sync_profile['restore_block_size']),
+                req.environ.get('swift.trans_id', ''))
+            resp = block_restore.get_range(req.headers['range'])
+            if resp is None:
+                resp = provider.shunt_object(req, obj)
+            status, headers, app_iter = resp
         else:
-            status, headers, app_iter = provider.shunt_object(req, obj)
+            redirect_url = self._get_redirect_url(
+                req, provider, sync_profile, obj)
+            if redirect_url:
+                self.logger.debug('Redirecting to the remote store: %s' %
+                                  req.path)
+                self._record(op, sync_profile, 'redirect', start)
+                start_response('307 Temporary Redirect', [
+                    ('Location', redirect_url),
+                    ('Content-Length', '0')] + trans_id_headers)
+                return ['']
+            status, headers, app_iter = self._get_remote_object(
+                req, provider, obj, hedge)
         headers = [(k.encode('utf-8'), unicode(v).encode('utf-8'))
                    for k, v in headers]
         self.logger.debug('Remote resp: %s' % status)
 
         headers = filter_hop_by_hop_headers(headers)
+        if memcache is not None:
+            self._cache_object(req, memcache, cache_key, status, headers)
         headers.extend(trans_id_headers)
 
+        self._record(op, sync_profile, 'remote_%s' % status.split()[0], start)
         start_response(status, headers)
+        if req.method == 'GET':
+            return self._iter_with_metrics(app_iter, op, sync_profile)
         return app_iter
 
+    def _get_redirect_url(self, req, provider, sync_profile, obj):
+        '''Returns the URL to redirect a GET of a large object to, if the
+        profile redirects the GETs of objects of at least redirect_threshold
+        bytes (and does not restore them).'''
+        threshold = int(sync_profile.get('redirect_threshold', 0))
+        if req.method != 'GET' or not threshold or\
+                sync_profile.get('restore_object', False):
+            return None
+        resp = provider.head_object(obj)
+        if resp.status != 200:
+            # Let the GET report the error
+            return None
+        headers = dict((k.lower(), v) for k, v in resp.headers.items())
+        if int(headers.get('content-length', 0)) < threshold:
+            return None
+        try:
+            return provider.presign_object(obj, int(sync_profile.get(
+                'redirect_expires', DEFAULT_REDIRECT_EXPIRES)))
+        except Exception as e:
+            self.logger.error('Failed to create the redirect URL for %s: %s' %
+                              (req.path, e))
+            return None
+
+    def _shunt_and_restore(self, req, provider, obj, hedge=None):
+        '''Fetches the object from the remote store and tees the response into
+        a PUT to restore the object.'''
+        # We incur an extra request hit by checking for a possible SLO.
+        manifest = provider.get_manifest(obj)
+        self.logger.debug("Manifest: %s" % manifest)
+        status, headers, app_iter = self._get_remote_object(
+            req, provider, obj, hedge)
+
+        if response_is_complete(int(status.split()[0]), headers):
+            put_headers = convert_to_local_headers(headers)
+            if check_slo(put_headers):
+                if manifest:
+                    app_iter = SwiftSloPutWrapper(
+                        app_iter, put_headers, req.path,
+                        self.app, manifest, self.logger)
+                else:
+                    # if slo manifest is missing, log error, don't attempt
+                    # to restore object, but continue shunt
+                    self.logger.error('Failed to restore slo object due '
+                                      'to missing manifest: %s' % obj)
+            else:
+                app_iter = SwiftPutWrapper(
+                    app_iter, put_headers, req.path,
+                    self.app, self.logger)
+        return status, headers, app_iter
+
+    def handle_prefix_restore(self, req, start_response, sync_profile, acct,
+                              cont, per_account):
+        '''Restores the remote objects under the prefix into the container.
+
+        The request (POST /v1/<account>/<container>?restore&prefix=<prefix>
+        &workers=<N>) requires the same authorization as a container POST.
+        The progress is reported as a JSON object per line, while the restore
+        is in progress.
+        '''
+        authorize = req.environ.get('swift.authorize')
+        if authorize:
+            denied = authorize(req)
+            if denied:
+                return denied(req.environ, start_response)
+        try:
+            workers = int(req.params.get('workers', DEFAULT_PREFETCH_WORKERS))
+            if workers < 1:
+                raise ValueError
+        except ValueError:
+            return swob.HTTPBadRequest(
+                body='Invalid number of workers')(req.environ, start_response)
+        workers = min(workers, self.max_prefetch_workers)
+        prefix = req.params.get('prefix', '')
+
+        provider = create_provider(sync_profile, max_conns=workers,
+                                   per_account=per_account)
+        self.logger.info('Restoring %s/%s/%s* with %d workers' % (
+            acct, cont, prefix, workers))
+        try:
+            progress = iter_restore_prefix(
+                provider, acct, cont, prefix, self.app, self.logger, workers)
+            first = next(progress)
+        except Exception as e:
+            self.logger.error('Failed to restore %s/%s/%s*: %s' % (
+                acct, cont, prefix, e))
+            return swob.HTTPBadGateway()(req.environ, start_response)
+
+        def _iter_progress():
+            yield json.dumps(first) + '\n'
+            for counters in progress:
+                yield json.dumps(counters) + '\n'
+
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return _iter_progress()
+
     def handle_delete(
             self, req, start_response, sync_profile, obj, per_account):
         status, headers, app_iter = req.call_application(self.app)
@@ -1,4 +1,30 @@
+import collections
+import contextlib
 import eventlet
+import logging
+import os
+import re
+import tempfile
+import time
+
+from swift.common.utils import StatsdClient
+
+
+# Upper bounds (in seconds) of the buckets of the latency histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0, 300.0)
+DEFAULT_STATSD_PORT = 8125
+# How often (in seconds) the metrics file is written
+DEFAULT_METRICS_INTERVAL = 10
+# Characters of the label values that would break the statsd metric names or
+# packets
+STATSD_UNSAFE_CHARS = re.compile(r'[.:|@\s]')
+
+
+def _encode_label(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
 
 
 class AtomicStats(object):
@@ -14,11 +40,174 @@ class AtomicStats(object):
 class MigratorPassStats(AtomicStats):
     def __init__(self):
         super(MigratorPassStats, self).__init__()
+        self.started = time.time()
         self.copied = 0
         self.scanned = 0
         self.bytes_copied = 0
+        self.errors = 0
 
-    def _update_stats(self, copied=0, scanned=0, bytes_copied=0):
+    def _update_stats(self, copied=0, scanned=0, bytes_copied=0, errors=0):
         self.copied += copied
         self.scanned += scanned
         self.bytes_copied += bytes_copied
+        self.errors += errors
+
+
+class Metrics(object):
+    '''Counters, gauges and latency histograms of a daemon.
+
+    A metric is identified by its name and labels (e.g. the account and
+    container). All of the metrics are sent to statsd as they are recorded,
+    if it is configured, and all of the metrics can be written
+    out periodically in the Prometheus text format (e.g. for the textfile
+    collector of the node exporter).
+
+    Failures to send the metrics are logged, and never raised to the caller.
+    '''
+    def __init__(self, namespace, logger_name=None):
+        self.namespace = namespace
+        self.logger = logging.getLogger(logger_name)
+        self.counters = collections.defaultdict(int)
+        self.gauges = {}
+        self.histograms = {}
+        self.statsd = None
+        self.metrics_file = None
+        self.write_interval = DEFAULT_METRICS_INTERVAL
+        self.last_write = 0
+
+    def configure(self, conf, metrics_file=None):
+        '''Sets up the export of the metrics. Statsd uses the same settings
+        as Swift (log_statsd_host, log_statsd_port, etc).'''
+        if conf.get('log_statsd_host'):
+            self.statsd = StatsdClient(
+                conf['log_statsd_host'],
+                int(conf.get('log_statsd_port', DEFAULT_STATSD_PORT)),
+                base_prefix=conf.get('log_statsd_metric_prefix', ''),
+                tail_prefix=self.namespace,
+                default_sample_rate=float(
+                    conf.get('log_statsd_default_sample_rate', 1)))
+        self.metrics_file = metrics_file
+        self.write_interval = float(
+            conf.get('metrics_interval', DEFAULT_METRICS_INTERVAL))
+
+    @staticmethod
+    def _key(name, labels):
+        # The same label value may be passed as unicode or UTF-8
+        return name, tuple(sorted(
+            (label, _encode_label(value)) for label, value in labels.items()))
+
+    @staticmethod
+    def _statsd_name(name, labels):
+        return '.'.join([name] + [
+            STATSD_UNSAFE_CHARS.sub('_', _encode_label(value))
+            for _, value in sorted(labels.items())])
+
+    def _send_statsd(self, method, name, labels, *args):
+        if self.statsd is None:
+            return
+        try:
+            getattr(self.statsd, method)(self._statsd_name(name, labels),
+                                         *args)
+        except Exception:
+            self.logger.exception('Failed to send the %s metric to statsd' %
+                                  name)
+
+    def increment(self, name, amount=1, **labels):
+        self.counters[self._key(name, labels)] += amount
+        self._send_statsd('update_stats', name, labels, amount)
+
+    def set_gauge(self, name, value, **labels):
+        self.gauges[self._key(name, labels)] = value
+        # Swift's statsd client has no method for gauges, which must not be
+        # sampled
+        self._send_statsd('_send', name, labels, value, 'g', 1)
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        if key not in self.histograms:
+            # The bucket counts, followed by the total count and sum
+            self.histograms[key] = [0] * len(LATENCY_BUCKETS) + [0, 0.0]
+        histogram = self.histograms[key]
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+        histogram[-2] += 1
+        histogram[-1] += seconds
+        self._send_statsd('timing', name, labels, seconds * 1000)
+
+    @contextlib.contextmanager
+    def timer(self, op, is_expected=None):
+        '''Records the latency (and failures) of an operation.
+
+        is_expected -- optional callable that returns True for the exceptions
+                       that are not failures (e.g. a 404 for a HEAD).
+        '''
+        start = time.time()
+        try:
+            yield
+        except Exception as e:
+            if not is_expected or not is_expected(e):
+                self.increment('op_errors', op=op)
+            raise
+        finally:
+            self.observe('op_seconds', time.time() - start, op=op)
+
+    def _format_name(self, name):
+        return '%s_%s' % (self.namespace, name)
+
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ''
+        return '{%s}' % ','.join(
+            '%s="%s"' % (label, _encode_label(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+            for label, value in labels)
+
+    def format_prometheus(self):
+        lines = []
+        for name, labels, value in sorted(
+                (name, labels, value)
+                for (name, labels), value in self.counters.items()):
+            metric = self._format_name(name) + '_total'
+            lines.append('%s%s %s' % (
+                metric, self._format_labels(labels), value))
+        for name, labels, value in sorted(
+                (name, labels, value)
+                for (name, labels), value in self.gauges.items()):
+            lines.append('%s%s %s' % (
+                self._format_name(name), self._format_labels(labels), value))
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            metric = self._format_name(name)
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',),
+                                    histogram[:-2] + [histogram[-2]]):
+                lines.append('%s_bucket%s %d' % (
+                    metric, self._format_labels(labels + (('le', bound),)),
+                    count))
+            lines.append('%s_count%s %d' % (
+                metric, self._format_labels(labels), histogram[-2]))
+            lines.append('%s_sum%s %f' % (
+                metric, self._format_labels(labels), histogram[-1]))
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        '''Atomically replaces the metrics file, if one is configured.'''
+        if not self.metrics_file:
+            return
+        directory = os.path.dirname(self.metrics_file)
+        fd, temp_file = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.format_prometheus())
+        os.rename(temp_file, self.metrics_file)
+        self.last_write = time.time()
+
+    def maybe_write(self):
+        if self.metrics_file and \
+                time.time() - self.last_write >= self.write_interval:
+            self.write()
+
+
+# Metrics of the sync daemon and of the providers
+SYNC_METRICS = Metrics('swift_s3_sync', 's3-sync')
+# Progress of the migrations
+MIGRATOR_METRICS = Metrics('swift_s3_migrator', 'swift-s3-migrator')
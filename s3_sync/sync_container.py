@@ -17,6 +17,8 @@ limitations under the License.
 import eventlet
 eventlet.patcher.monkey_patch(all=True)
 
+import collections
+import eventlet.semaphore
 import json
 import logging
 import os
@@ -26,16 +28,93 @@ from swift.common.internal_client import UnexpectedResponse
 import time
 
 import container_crawler.base_sync
+from .access_tracker import load_access_times
 from .provider_factory import create_provider
+from .stats import SYNC_METRICS
+from .utils import iter_listing, parse_list_time
 from container_crawler import RetryError
 
 
+MB = 1024 * 1024
+
+# By default, large uploads are limited so that they cannot take all of the
+# crawler workers and stall the uploads of smaller objects.
+DEFAULT_UPLOAD_LANES = [
+    {'name': 'small', 'max_size': MB},
+    {'name': 'medium', 'max_size': 100 * MB},
+    {'name': 'large', 'workers': 2}]
+
+# Settings of the bulk seed, which replaces the initial walk of the rows of a
+# container with a comparison of the local and remote listings.
+DEFAULT_SEED_WORKERS = 20
+SEED_LISTING_LIMIT = 1000
+# The number of local objects compared by a single handler call, so that a
+# large container is seeded over many calls (and its progress recorded)
+# rather than holding up a crawler worker.
+SEED_PAGE_SIZE = 10000
+# Objects written shortly before the seed are left to the regular row
+# processing, as their container updates may not have been applied yet.
+SEED_SETTLE_TIME = 3600
+
+
+class UploadLane(object):
+    '''Limits the number of concurrent uploads of objects in a size range.
+
+    A lane without a workers limit admits any number of uploads.
+    '''
+    def __init__(self, name, max_size=None, workers=None):
+        self.name = name
+        self.max_size = max_size
+        self.workers = workers
+        self.semaphore = None
+        if workers:
+            self.semaphore = eventlet.semaphore.Semaphore(workers)
+
+    def acquire(self):
+        if self.semaphore is None:
+            return True
+        return self.semaphore.acquire(blocking=False)
+
+    def release(self):
+        if self.semaphore is not None:
+            self.semaphore.release()
+
+
+class UploadLanes(object):
+    '''The upload lanes, ordered by the maximum size of their objects.
+
+    The last lane takes all of the objects larger than the other lanes.
+    '''
+    def __init__(self, lanes_conf):
+        lanes = [UploadLane(lane.get('name', str(i)),
+                            lane.get('max_size'),
+                            int(lane.get('workers', 0)))
+                 for i, lane in enumerate(lanes_conf)]
+        self.lanes = sorted(
+            lanes, key=lambda lane: (lane.max_size is None, lane.max_size))
+
+    def get_lane(self, size):
+        for lane in self.lanes[:-1]:
+            if size <= lane.max_size:
+                return lane
+        return self.lanes[-1]
+
+
 class SyncContainer(container_crawler.base_sync.BaseSync):
     # There is an implicit link between the names of the json fields and the
     # object fields -- they have to be the same.
     POLICY_FIELDS = ['copy_after',
                      'retain_local',
                      'propagate_delete']
+    # Maximum number of rows in the copy_after schedule of a container
+    MAX_DEFERRED_ROWS = 10000
+    # Maximum number of recently handled object names to remember
+    MAX_RECENT_KEYS = 10000
+    # How often (in seconds) the object accesses recorded by the shunt are
+    # reloaded
+    ACCESS_RELOAD_INTERVAL = 60
+    # Upload lanes shared by the containers synced to the same destination
+    SHARED_UPLOAD_LANES = {}
 
     def __init__(self, status_dir, sync_settings, max_conns=10,
                  per_account=False):
@@ -46,10 +125,159 @@ class SyncContainer(container_crawler.base_sync.BaseSync):
         self.copy_after = int(sync_settings.get('copy_after', 0))
         self.retain_local = sync_settings.get('retain_local', True)
         self.propagate_delete = sync_settings.get('propagate_delete', True)
+        # Objects read through the shunt within this many seconds are not
+        # archived (removed from Swift)
+        self.access_window = int(sync_settings.get('access_window', 0))
+        self.access_times = {}
+        self._access_loaded = 0
+        # Containers synced to the same destination share its connections
         self.provider = create_provider(sync_settings, max_conns,
-                                        per_account=self._per_account)
+                                        per_account=self._per_account,
+                                        shared_pool=True)
+        # Rows that are not yet eligible for copy_after (row ID -> time of
+        # eligibility), so that they can be retried without being evaluated
+        self.deferred_rows = {}
+        # Newest row timestamp handled for recently seen object names, used
+        # to coalesce rows for objects that are frequently overwritten
+        self.recent_keys = collections.OrderedDict()
+        lanes_conf = sync_settings.get('upload_lanes', DEFAULT_UPLOAD_LANES)
+        lanes_key = (self.provider.client_pool_key,
+                     json.dumps(lanes_conf, sort_keys=True))
+        if lanes_key not in self.SHARED_UPLOAD_LANES:
+            self.SHARED_UPLOAD_LANES[lanes_key] = UploadLanes(lanes_conf)
+        self.upload_lanes = self.SHARED_UPLOAD_LANES[lanes_key]
+        # Highest row handed to the handler and the timestamps of the rows
+        # that could not be synced yet, to report how far behind we are
+        self.max_row = 0
+        self.unsynced_rows = {}
+        # The rows of the objects last modified before the seed point have
+        # been synced by the bulk seed. Seeding does not apply to containers
+        # that do not retain the local copies, as it does not remove them.
+        self.bulk_seed = bool(sync_settings.get('bulk_seed')) and \
+            self.retain_local
+        self.seed_workers = int(sync_settings.get(
+            'bulk_seed_workers', DEFAULT_SEED_WORKERS))
+        self.seed_point = None
+        # (seed point, marker) of a seed that is in progress
+        self.seed_progress = None
+        self.seed_pending = False
+        self._seeding = False
+        self._db_id = None
+
+    def _defer_row(self, row_id, eligible_at):
+        self.deferred_rows[row_id] = eligible_at
+        if len(self.deferred_rows) > self.MAX_DEFERRED_ROWS:
+            # Drop the rows that become eligible last; they will be
+            # evaluated again.
+            latest = max(self.deferred_rows,
+                         key=lambda row_id: self.deferred_rows[row_id])
+            del self.deferred_rows[latest]
+
+    def _load_deferred_rows(self, entry):
+        self.deferred_rows = dict(
+            (row_id, eligible_at)
+            for eligible_at, row_id in entry.get('deferred', []))
+
+    def _get_deferred_schedule(self, last_row):
+        # Rows up to the last processed row no longer need to be tracked
+        for row_id in [row_id for row_id in self.deferred_rows
+                       if row_id <= last_row]:
+            del self.deferred_rows[row_id]
+        return sorted([eligible_at, row_id] for row_id, eligible_at
+                      in self.deferred_rows.items())
+
+    def _get_last_access(self, name, swift_client):
+        '''Returns the time of the last read of the object recorded by the
+        shunt, or 0 if there is none.'''
+        if time.time() - self._access_loaded >= self.ACCESS_RELOAD_INTERVAL:
+            try:
+                self.access_times = load_access_times(
+                    swift_client, self._account, self._container)
+            except UnexpectedResponse as e:
+                self.logger.warning(
+                    'Failed to load the object accesses of %s/%s: %s' % (
+                        self._account, self._container, e))
+            self._access_loaded = time.time()
+        if isinstance(name, str):
+            name = name.decode('utf-8')
+        return self.access_times.get(name, 0)
+
+    def _remember_key(self, name, row_ts):
+        self.recent_keys.pop(name, None)
+        self.recent_keys[name] = row_ts
+        if len(self.recent_keys) > self.MAX_RECENT_KEYS:
+            self.recent_keys.popitem(last=False)
+
+    def _is_superseded(self, row, data_ts, meta_ts, swift_client):
+        '''Checks whether the row describes an object version that has
+        already been handled or has since been replaced.
+
+        Only objects that have already been seen by this handler are
+        checked, as those are the ones that are being frequently
+        overwritten. A superseded row can be skipped, as the row for the
+        newer version (or the delete) follows it in the container DB.
+        '''
+        newest = self.recent_keys.get(row['name'])
+        if newest is None:
+            return False
+        if meta_ts <= newest:
+            return True
+        if row['deleted']:
+            return False
+        headers = {'X-Backend-Storage-Policy-Index':
+                   row['storage_policy_index'],
+                   'X-Newest': True}
+        try:
+            metadata = swift_client.get_object_metadata(
+                self._account, self._container, row['name'],
+                headers=headers)
+        except UnexpectedResponse as e:
+            if '404 Not Found' in e.message:
+                return True
+            raise
+        return Timestamp(metadata['x-timestamp']) > data_ts
+
+    def _count_row(self, result):
+        SYNC_METRICS.increment('rows', account=self._account,
+                               container=self._container, result=result)
+
+    def _record_unsynced(self, row):
+        row_id = row.get('ROWID')
+        if row_id is None or row_id in self.unsynced_rows or \
+                'created_at' not in row:
+            return
+        row_ts, _, _ = decode_timestamps(row['created_at'])
+        self.unsynced_rows[row_id] = row_ts.timestamp
+
+    def _update_lag_metrics(self, last_row):
+        for row_id in [row_id for row_id in self.unsynced_rows
+                       if row_id <= last_row]:
+            del self.unsynced_rows[row_id]
+        labels = {'account': self._account, 'container': self._container}
+        SYNC_METRICS.set_gauge('last_row', last_row, **labels)
+        SYNC_METRICS.set_gauge(
+            'backlog_rows', max(0, self.max_row - last_row), **labels)
+        oldest_age = 0
+        if self.unsynced_rows:
+            oldest_age = time.time() - min(self.unsynced_rows.values())
+        SYNC_METRICS.set_gauge(
+            'oldest_unsynced_age_seconds', oldest_age, **labels)
+        try:
+            SYNC_METRICS.maybe_write()
+        except Exception as e:
+            self.logger.error('Failed to write the metrics: %s' % e)
 
     def get_last_row(self, db_id):
+        self.deferred_rows = {}
+        self.seed_point = None
+        self.seed_progress = None
+        self._db_id = db_id
+        last_row = self._load_last_row(db_id)
+        self.seed_pending = self.bulk_seed and last_row == 0 and \
+            self.seed_point is None
+        return last_row
+
+    def _load_last_row(self, db_id):
         if not os.path.exists(self._status_file):
             return 0
         with open(self._status_file) as f:
@@ -68,18 +296,30 @@ class SyncContainer(container_crawler.base_sync.BaseSync):
                             value = getattr(self, field)
                             if status[db_id]['policy'][field] != value:
                                 return 0
+                    self._load_deferred_rows(entry)
+                    self.seed_point = entry.get('seed_point')
+                    if entry.get('seed_progress'):
+                        self.seed_progress = tuple(entry['seed_progress'])
                     return entry['last_row']
                 return 0
             except ValueError:
                 return 0
 
     def save_last_row(self, row, db_id):
+        self._update_lag_metrics(row)
         if not os.path.exists(self._status_account_dir):
             os.mkdir(self._status_account_dir)
+        deferred = self._get_deferred_schedule(row)
         if not os.path.exists(self._status_file):
+            new_status = dict(last_row=row, aws_bucket=self.aws_bucket)
+            if deferred:
+                new_status['deferred'] = deferred
+            if self.seed_point is not None:
+                new_status['seed_point'] = self.seed_point
+            if self.seed_progress is not None:
+                new_status['seed_progress'] = list(self.seed_progress)
             with open(self._status_file, 'w') as f:
-                json.dump({db_id: dict(last_row=row,
-                                       aws_bucket=self.aws_bucket)}, f)
+                json.dump({db_id: new_status}, f)
                 return
 
         with open(self._status_file, 'r+') as f:
@@ -92,6 +332,13 @@ class SyncContainer(container_crawler.base_sync.BaseSync):
             new_status = dict(last_row=row,
                               aws_bucket=self.aws_bucket,
                               policy=policy)
+            if deferred:
+                # Time-ordered schedule of the rows deferred by copy_after
+                new_status['deferred'] = deferred
+            if self.seed_point is not None:
+                new_status['seed_point'] = self.seed_point
+            if self.seed_progress is not None:
+                new_status['seed_progress'] = list(self.seed_progress)
             if 'last_row' in status:
                 status = {db_id: new_status}
             else:
@@ -101,17 +348,181 @@ class SyncContainer(container_crawler.base_sync.BaseSync):
             f.truncate()
 
     def handle(self, row, swift_client):
+        row_id = row.get('ROWID')
+        if row_id is not None:
+            self.max_row = max(self.max_row, row_id)
+        eligible_at = self.deferred_rows.get(row_id)
+        if eligible_at is not None and time.time() <= eligible_at:
+            # The row was counted as unsynced when it was deferred; it is
+            # skipped without any work until it is eligible.
+            raise RetryError('Object is not yet eligible for archive')
+        try:
+            result = self._handle_row(row, swift_client)
+        except RetryError:
+            self._record_unsynced(row)
+            self._count_row('retried')
+            raise
+        except Exception:
+            self._record_unsynced(row)
+            self._count_row('error')
+            raise
+        self.unsynced_rows.pop(row_id, None)
+        self._count_row(result)
+        if result == 'uploaded':
+            SYNC_METRICS.increment(
+                'bytes', row.get('size', 0), account=self._account,
+                container=self._container)
+
+    def _seed(self, storage_policy_index, swift_client):
+        if self._seeding:
+            raise RetryError('Container is being seeded')
+        self._seeding = True
+        try:
+            if self.seed_progress is None:
+                seed_point = time.time() - SEED_SETTLE_TIME - self.copy_after
+                marker = u''
+            else:
+                seed_point, marker = self.seed_progress
+            marker = self._seed_objects(
+                seed_point, marker, storage_policy_index, swift_client)
+        finally:
+            self._seeding = False
+        if marker is None:
+            self.seed_point = seed_point
+            self.seed_progress = None
+            self.seed_pending = False
+        else:
+            self.seed_progress = (seed_point, marker)
+        # Record the seed right away, as the seeded rows may take several
+        # crawler passes to go through.
+        self.save_last_row(0, self._db_id)
+        if marker is not None:
+            raise RetryError('Container is being seeded')
+
+    def _seed_objects(self, seed_point, marker, storage_policy_index,
+                      swift_client):
+        '''Uploads the objects last modified before the seed point that are
+        missing from the remote store or may differ from it, starting after
+        the marker. At most SEED_PAGE_SIZE objects are compared.
+
+        The local and remote listings are merged, so that the objects that
+        are already in the remote store are not examined one by one.
+
+        :returns: the marker to continue the seed from, or None if the seed
+                  is done.
+        '''
+        marker = marker.encode('utf-8')
+        resp, remote_iter = iter_listing(
+            self.provider.list_objects, self.logger, marker,
+            SEED_LISTING_LIMIT, '')
+        if resp.status == 404:
+            remote_iter = iter([(None, None)])
+        elif resp.status != 200:
+            raise RuntimeError('Failed to list the remote store: %d' %
+                               resp.status)
+        if not marker:
+            self.logger.info('Seeding %s/%s' % (
+                self._account, self._container))
+        labels = {'account': self._account, 'container': self._container}
+        failed = []
+
+        def _upload(name):
+            try:
+                if self.provider.upload_object(
+                        name, storage_policy_index, swift_client):
+                    SYNC_METRICS.increment(
+                        'seeded_objects', result='uploaded', **labels)
+            except Exception as e:
+                SYNC_METRICS.increment(
+                    'seeded_objects', result='error', **labels)
+                self.logger.error('Failed to seed %s: %s' % (name, e))
+                failed.append(name)
+
+        pool = eventlet.GreenPool(self.seed_workers)
+        remote_item, _ = next(remote_iter)
+        seed_point_us = seed_point * 1000000
+        last_name = next_marker = None
+        for count, entry in enumerate(swift_client.iter_objects(
+                self._account, self._container, marker=marker)):
+            if count == SEED_PAGE_SIZE:
+                next_marker = last_name
+                break
+            last_name = entry['name']
+            # The listing time of a local object is its metadata timestamp
+            modified = parse_list_time(entry['last_modified'])
+            if modified > seed_point_us:
+                continue
+            while remote_item and remote_item['name'] < entry['name']:
+                remote_item, _ = next(remote_iter)
+            # Matching ETags only show that the data was copied. Objects
+            # whose metadata changed after the copy are uploaded, which
+            # compares their metadata as for any other row.
+            if remote_item and remote_item['name'] == entry['name'] and \
+                    remote_item['hash'] == entry['hash'] and \
+                    remote_item.get('last_modified') and \
+                    parse_list_time(remote_item['last_modified']) >= modified:
+                continue
+            pool.spawn_n(_upload, entry['name'].encode('utf-8'))
+        pool.waitall()
+        if failed:
+            raise RuntimeError('Failed to seed %d objects' % len(failed))
+        if next_marker is None:
+            self.logger.info('Seeded %s/%s' % (
+                self._account, self._container))
+        return next_marker
+
+    def _handle_row(self, row, swift_client):
+        '''Syncs the row and returns what was done with it: "deleted",
+        "uploaded", "superseded", "seeded" or "ignored".'''
+        if self.seed_pending:
+            self._seed(row['storage_policy_index'], swift_client)
         if row['deleted']:
+            delete_ts = Timestamp(row['created_at'])
+            if self._is_superseded(row, delete_ts, delete_ts, swift_client):
+                return 'superseded'
+            result = 'ignored'
             if self.propagate_delete:
                 self.provider.delete_object(row['name'])
+                result = 'deleted'
+            self._remember_key(row['name'], delete_ts)
+            return result
         else:
+            row_id = row.get('ROWID')
             # The metadata timestamp should always be the latest timestamp
-            _, _, meta_ts = decode_timestamps(row['created_at'])
-            if time.time() <= self.copy_after + meta_ts.timestamp:
+            data_ts, _, meta_ts = decode_timestamps(row['created_at'])
+            if self.seed_point is not None and \
+                    meta_ts.timestamp <= self.seed_point:
+                return 'seeded'
+            eligible_at = self.copy_after + meta_ts.timestamp
+            if time.time() <= eligible_at:
+                if row_id is not None:
+                    self._defer_row(row_id, eligible_at)
                 raise RetryError('Object is not yet eligible for archive')
-            uploaded = self.provider.upload_object(row['name'],
-                                                   row['storage_policy_index'],
-                                                   swift_client)
+            if not self.retain_local and self.access_window:
+                # Recently read objects are kept in Swift
+                eligible_at = self._get_last_access(
+                    row['name'], swift_client) + self.access_window
+                if time.time() <= eligible_at:
+                    if row_id is not None:
+                        self._defer_row(row_id, eligible_at)
+                    raise RetryError('Object was recently read')
+            self.deferred_rows.pop(row_id, None)
+            # Objects of different sizes are uploaded in separate lanes, so
+            # that large uploads do not hold up all of the small ones. The
+            # lane is acquired first, so that a row that has to wait for it
+            # does not issue any requests.
+            lane = self.upload_lanes.get_lane(row.get('size', 0))
+            if not lane.acquire():
+                raise RetryError('Upload lane "%s" is full' % lane.name)
+            try:
+                if self._is_superseded(row, data_ts, meta_ts, swift_client):
+                    self.logger.debug('Skipping superseded row for %s' %
+                                      row['name'])
+                    return 'superseded'
+                uploaded = self.provider.upload_object(
+                    row['name'], row['storage_policy_index'], swift_client)
+            finally:
+                lane.release()
 
             if not self.retain_local and uploaded:
                 # NOTE: We rely on the DELETE object X-Timestamp header to
@@ -128,3 +539,5 @@ class SyncContainer(container_crawler.base_sync.BaseSync):
                 except UnexpectedResponse as e:
                     if '409 Conflict' in e.message:
                         pass
+            self._remember_key(row['name'], meta_ts)
+            return 'uploaded' if uploaded else 'ignored'
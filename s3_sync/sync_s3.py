@@ -46,6 +46,11 @@ class SyncS3(BaseSync):
     CLOUD_SYNC_VERSION = '5.0'
     GOOGLE_UA_STRING = 'CloudSync/%s (GPN:SwiftStack)' % CLOUD_SYNC_VERSION
     SLO_MANIFEST_SUFFIX = '.swift_slo_manifest'
+    CLIENT_SETTINGS = BaseSync.CLIENT_SETTINGS + ('aws_session_token',)
+
+    def __init__(self, *args, **kwargs):
+        super(SyncS3, self).__init__(*args, **kwargs)
+        self.encryption = self.settings.get('encryption', True)
 
     def _add_extra_headers(self, model, params, **kwargs):
         """
@@ -66,7 +71,6 @@ class SyncS3(BaseSync):
     def _get_client_factory(self):
         aws_identity = self.settings['aws_identity']
         aws_secret = self.settings['aws_secret']
-        self.encryption = self.settings.get('encryption', True)
 
         session_kwargs = {
             'aws_access_key_id': aws_identity,
@@ -122,7 +126,8 @@ class SyncS3(BaseSync):
     def upload_object(self, swift_key, storage_policy_index, internal_client):
         s3_key = self.get_s3_name(swift_key)
         try:
-            with self.client_pool.get_client() as s3_client:
+            with self.client_pool.get_client() as s3_client, \
+                    self._timed('remote_head', self._is_not_found):
                 s3_meta = s3_client.head_object(Bucket=self.aws_bucket,
                                                 Key=s3_key)
         except botocore.exceptions.ClientError as e:
@@ -137,9 +142,10 @@ class SyncS3(BaseSync):
         }
 
         try:
-            metadata = internal_client.get_object_metadata(
-                self.account, self.container, swift_key,
-                headers=swift_req_hdrs)
+            with self._timed('internal_head', self._is_internal_not_found):
+                metadata = internal_client.get_object_metadata(
+                    self.account, self.container, swift_key,
+                    headers=swift_req_hdrs)
         except UnexpectedResponse as e:
             if '404 Not Found' in e.message:
                 return
@@ -165,11 +171,10 @@ class SyncS3(BaseSync):
                 return True
 
         with self.client_pool.get_client() as s3_client:
-            wrapper_stream = FileWrapper(internal_client,
-                                         self.account,
-                                         self.container,
-                                         swift_key,
-                                         swift_req_hdrs)
+            with self._timed('internal_get'):
+                wrapper_stream = FileWrapper(
+                    internal_client, self.account, self.container, swift_key,
+                    swift_req_hdrs, limiters=self._get_bandwidth_limiters())
             self.logger.debug('Uploading %s with meta: %r' % (
                 s3_key, wrapper_stream.get_s3_headers()))
 
@@ -183,14 +188,22 @@ class SyncS3(BaseSync):
             )
             if self._is_amazon() and self.encryption:
                 params['ServerSideEncryption'] = 'AES256'
-            s3_client.put_object(**params)
+            with self._timed('remote_put'):
+                s3_client.put_object(**params)
         return True
 
+    @staticmethod
+    def _is_not_found(error):
+        return isinstance(error, botocore.exceptions.ClientError) and \
+            error.response.get('ResponseMetadata', {}).get(
+                'HTTPStatusCode') == 404
+
     def delete_object(self, swift_key):
         s3_key = self.get_s3_name(swift_key)
         self.logger.debug('Deleting object %s' % s3_key)
-        resp = self._call_boto('delete_object', Bucket=self.aws_bucket,
-                               Key=s3_key)
+        with self._timed('remote_delete'):
+            resp = self._call_boto('delete_object', Bucket=self.aws_bucket,
+                                   Key=s3_key)
         if not resp.success:
             if resp.status == 404:
                 self.logger.warning('%s already removed from %s', s3_key,
@@ -238,6 +251,14 @@ class SyncS3(BaseSync):
 
         return response.to_wsgi()
 
+    def presign_object(self, swift_key, expires):
+        with self.client_pool.get_client() as s3_client:
+            return s3_client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': self.aws_bucket,
+                        'Key': self.get_s3_name(swift_key)},
+                ExpiresIn=expires)
+
     def head_object(self, swift_key, bucket=None, **options):
         key = self.get_s3_name(swift_key)
         if bucket is None:
@@ -536,13 +557,15 @@ class SyncS3(BaseSync):
 
         with self.client_pool.get_client() as s3_client:
             slo_wrapper = SLOFileWrapper(
-                internal_client, self.account, manifest, metadata, req_hdrs)
-            s3_client.put_object(Bucket=self.aws_bucket,
-                                 Key=s3_key,
-                                 Body=slo_wrapper,
-                                 Metadata=slo_wrapper.get_s3_headers(),
-                                 ContentLength=len(slo_wrapper),
-                                 ContentType=metadata['content-type'])
+                internal_client, self.account, manifest, metadata, req_hdrs,
+                limiters=self._get_bandwidth_limiters())
+            with self._timed('remote_put'):
+                s3_client.put_object(Bucket=self.aws_bucket,
+                                     Key=s3_key,
+                                     Body=slo_wrapper,
+                                     Metadata=slo_wrapper.get_s3_headers(),
+                                     ContentLength=len(slo_wrapper),
+                                     ContentType=metadata['content-type'])
 
     def _validate_slo_manifest(self, manifest):
         parts = len(manifest)
@@ -671,15 +694,19 @@ class SyncS3(BaseSync):
                     # because once we instantiate a FileWrapper, we create an
                     # open Swift connection and the request will timeout if we
                     # do not read for more than 60 seconds.
-                    wrapper = FileWrapper(internal_client, self.account,
-                                          container, obj, req_headers)
-                    resp = s3_client.upload_part(
-                        Bucket=self.aws_bucket,
-                        Key=s3_key,
-                        Body=wrapper,
-                        ContentLength=len(wrapper),
-                        UploadId=upload_id,
-                        PartNumber=part_number)
+                    with self._timed('internal_get'):
+                        wrapper = FileWrapper(
+                            internal_client, self.account, container, obj,
+                            req_headers,
+                            limiters=self._get_bandwidth_limiters())
+                    with self._timed('mpu_part'):
+                        resp = s3_client.upload_part(
+                            Bucket=self.aws_bucket,
+                            Key=s3_key,
+                            Body=wrapper,
+                            ContentLength=len(wrapper),
+                            UploadId=upload_id,
+                            PartNumber=part_number)
                     if not self.check_etag(segment['hash'], resp['ETag']):
                         self.logger.error('Part %d ETag mismatch (%s): %s %s',
                                           part_number,
@@ -17,13 +17,16 @@ limitations under the License.
 import datetime
 import eventlet
 import hashlib
+import hmac
 import json
 import swiftclient
 from swift.common.internal_client import UnexpectedResponse
 from swift.common.utils import FileLikeIter
 import sys
+import time
 import traceback
 import urllib
+import urlparse
 
 from .base_sync import BaseSync, ProviderResponse, match_item
 from .utils import (FileWrapper, ClosingResourceIterable, check_slo,
@@ -41,6 +44,10 @@ DEFAULT_SEGMENT_DELAY = 60 * 60 * 24
 
 
 class SyncSwift(BaseSync):
+    CLIENT_SETTINGS = BaseSync.CLIENT_SETTINGS + (
+        'auth_type', 'tenant_name', 'project_name', 'project_domain_name',
+        'user_domain_name', 'remote_account')
+
     def __init__(self, *args, **kwargs):
         super(SyncSwift, self).__init__(*args, **kwargs)
         # Used to verify the remote container in case of per_account uploads
@@ -177,9 +184,10 @@ class SyncSwift(BaseSync):
         """
         with self.client_pool.get_client() as swift_client:
             try:
-                headers = swift_client.head_object(
-                    self.remote_container, swift_key,
-                    headers=self._client_headers())
+                with self._timed('remote_head', self._is_not_found):
+                    headers = swift_client.head_object(
+                        self.remote_container, swift_key,
+                        headers=self._client_headers())
             except swiftclient.exceptions.ClientException as e:
                 if e.http_status == 404:
                     return
@@ -188,13 +196,19 @@ class SyncSwift(BaseSync):
         delete_kwargs = {'headers': self._client_headers()}
         if check_slo(headers):
             delete_kwargs['query_string'] = 'multipart-manifest=delete'
-        resp = self._call_swiftclient('delete_object',
-                                      self.remote_container, swift_key,
-                                      **delete_kwargs)
+        with self._timed('remote_delete'):
+            resp = self._call_swiftclient('delete_object',
+                                          self.remote_container, swift_key,
+                                          **delete_kwargs)
         if not resp.success and resp.status != 404:
             resp.reraise()
         return resp
 
+    @staticmethod
+    def _is_not_found(error):
+        return isinstance(error, swiftclient.exceptions.ClientException) and \
+            error.http_status == 404
+
     def shunt_object(self, req, swift_key):
         """Fetch an object from the remote cluster to stream back to a client.
 
@@ -250,6 +264,29 @@ class SyncSwift(BaseSync):
                 headers=headers)
         return resp.to_wsgi()
 
+    def presign_object(self, swift_key, expires):
+        '''Returns a temp URL for the object, signed with the
+        remote_temp_url_key of the profile (which must be set as a temp URL
+        key of the remote account).'''
+        temp_url_key = self.settings.get('remote_temp_url_key')
+        if not temp_url_key:
+            raise ValueError('Missing remote_temp_url_key')
+        with self.client_pool.get_client() as swift_client:
+            if not swift_client.url:
+                swift_client.get_auth()
+            storage_url = swift_client.url
+        if isinstance(swift_key, unicode):
+            swift_key = swift_key.encode('utf-8')
+        scheme, netloc, account_path = urlparse.urlparse(storage_url)[:3]
+        path = '/'.join([urllib.unquote(account_path),
+                         self.remote_container.encode('utf-8'), swift_key])
+        expires = int(time.time() + expires)
+        signature = hmac.new(
+            temp_url_key.encode('utf-8'), 'GET\n%d\n%s' % (expires, path),
+            hashlib.sha1).hexdigest()
+        return '%s://%s%s?temp_url_sig=%s&temp_url_expires=%d' % (
+            scheme, netloc, urllib.quote(path), signature, expires)
+
     def head_object(self, swift_key, bucket=None, **options):
         if bucket is None:
             bucket = self.remote_container
@@ -356,7 +393,8 @@ class SyncSwift(BaseSync):
     def _upload_object(self, src_container, dst_container, key, req_hdrs,
                        internal_client, segment=False):
         try:
-            with self.client_pool.get_client() as swift_client:
+            with self.client_pool.get_client() as swift_client, \
+                    self._timed('remote_head', self._is_not_found):
                 remote_meta = swift_client.head_object(
                     dst_container, key, headers=self._client_headers())
         except swiftclient.exceptions.ClientException as e:
@@ -366,9 +404,10 @@ class SyncSwift(BaseSync):
                 raise
 
         try:
-            metadata = internal_client.get_object_metadata(
-                self.account, src_container, key,
-                headers=req_hdrs)
+            with self._timed('internal_head', self._is_internal_not_found):
+                metadata = internal_client.get_object_metadata(
+                    self.account, src_container, key,
+                    headers=req_hdrs)
         except UnexpectedResponse as e:
             if '404 Not Found' in e.message:
                 return True
@@ -401,11 +440,10 @@ class SyncSwift(BaseSync):
             return True
 
         with self.client_pool.get_client() as swift_client:
-            wrapper_stream = FileWrapper(internal_client,
-                                         self.account,
-                                         src_container,
-                                         key,
-                                         req_hdrs)
+            with self._timed('internal_get'):
+                wrapper_stream = FileWrapper(
+                    internal_client, self.account, src_container, key,
+                    req_hdrs, limiters=self._get_bandwidth_limiters())
             headers = self._get_user_headers(wrapper_stream.get_headers())
             if self.remote_delete_after:
                 del_after = self.remote_delete_after
@@ -415,12 +453,12 @@ class SyncSwift(BaseSync):
             self.logger.debug('Uploading %s with meta: %r' % (
                 key, headers))
 
-            swift_client.put_object(dst_container,
-                                    key,
-                                    wrapper_stream,
-                                    etag=wrapper_stream.get_headers()['etag'],
-                                    headers=self._client_headers(headers),
-                                    content_length=len(wrapper_stream))
+            with self._timed('remote_put'):
+                swift_client.put_object(
+                    dst_container, key, wrapper_stream,
+                    etag=wrapper_stream.get_headers()['etag'],
+                    headers=self._client_headers(headers),
+                    content_length=len(wrapper_stream))
         return True
 
     def _make_content_location(self, bucket):
@@ -14,6 +14,7 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import datetime
 import eventlet
 import hashlib
 import json
@@ -50,6 +51,8 @@ from swift.common.request_helpers import (
 from swift.common.swob import Request
 from swift.common.utils import FileLikeIter, close_if_possible
 
+from .bandwidth import RateLimitedIter
+
 
 SWIFT_USER_META_PREFIX = 'x-object-meta-'
 S3_USER_META_PREFIX = 'x-amz-meta-'
@@ -57,6 +60,14 @@ MANIFEST_HEADER = 'x-object-manifest'
 SLO_HEADER = 'x-static-large-object'
 SLO_ETAG_FIELD = 'swift-slo-etag'
 SWIFT_TIME_FMT = '%Y-%m-%dT%H:%M:%S.%f'
+# Listing responses are streamed in chunks of about this size
+LISTING_CHUNK_SIZE = 65536
+EPOCH = datetime.datetime.utcfromtimestamp(0)
+_EPOCH_ORDINAL = EPOCH.toordinal()
+# Listings are ordered by name, not time, but the dates in a bucket tend to
+# cluster. Caching the day offsets avoids the calendar math on every entry.
+_EPOCH_DAYS_CACHE = {}
+_EPOCH_DAYS_CACHE_SIZE = 4096
 # Blacklist of known hop-by-hop headers taken from
 # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers
 HOP_BY_HOP_HEADERS = set([
@@ -76,6 +87,14 @@ ACCOUNT_ACL_KEY = 'x-account-access-control'
 SYSMETA_ACCOUNT_ACL_KEY = \
     get_sys_meta_prefix('account') + 'core-access-control'
 PFS_ETAG_PREFIX = 'pfs'
+# The shunt keeps its own data about the objects of an account (e.g. the blocks
+# of restored objects) in a hidden account, which the users cannot list or
+# access and the sync process does not crawl
+INTERNAL_ACCOUNT_PREFIX = '.cloud_sync_'
+
+
+def get_internal_account(account):
+    return INTERNAL_ACCOUNT_PREFIX + account
 
 
 class MigrationContainerStates(object):
@@ -118,6 +137,21 @@ class MigrationContainerStates(object):
     SRC_DELETED = 'src_deleted'
 
 
+class ListingDiffActions(object):
+    '''Decisions emitted by diff_listings().
+
+    MIGRATE -- the remote (source) entry is missing or stale locally.
+    SKIP -- the remote entry is up to date locally (or not old enough).
+    CHECK_ETAG -- the entries have the same date, but differing ETags. This
+                  is expected for large objects and requires a closer look.
+    RECONCILE -- the local entry no longer exists in the remote listing.
+    '''
+    MIGRATE = 'migrate'
+    SKIP = 'skip'
+    CHECK_ETAG = 'check_etag'
+    RECONCILE = 'reconcile'
+
+
 class RemoteHTTPError(Exception):
     def __init__(self, resp, *args, **kwargs):
         self.resp = resp
@@ -278,12 +312,15 @@ class SeekableFileLikeIter(FileLikeIter):
 
 
 class FileWrapper(SeekableFileLikeIter):
-    def __init__(self, swift_client, account, container, key, headers={}):
+    def __init__(self, swift_client, account, container, key, headers={},
+                 limiters=None):
         self._swift = swift_client
         self._account = account
         self._container = container
         self._key = key
         self.swift_req_hdrs = headers
+        # Bandwidth limiters (see s3_sync.bandwidth) for the data read
+        self._limiters = limiters or []
 
         self.iterator = None
         self._swift_stream = None
@@ -294,6 +331,12 @@ class FileWrapper(SeekableFileLikeIter):
         super(FileWrapper, self).__init__(self._swift_stream,
                                           length=self.content_length,
                                           seek_zero_cb=self.open_object_stream)
+        self.iterator = self._limit_bandwidth(self.iterator)
+
+    def _limit_bandwidth(self, iterator):
+        if not self._limiters:
+            return iterator
+        return RateLimitedIter(iterator, self._limiters)
 
     def open_object_stream(self):
         if self._swift_stream:
@@ -313,7 +356,7 @@ class FileWrapper(SeekableFileLikeIter):
         else:
             self.content_length = self.length = None
 
-        return iter(self._swift_stream)
+        return self._limit_bandwidth(iter(self._swift_stream))
 
     def next(self, called_from_read=False):
         the_data = super(FileWrapper, self).next(called_from_read)
@@ -353,11 +396,12 @@ class SLOFileWrapper(object):
     # For the headers, we must also attach the Swift manifest ETag, as we have
     # no way of verifying the object has been uploaded otherwise.
     def __init__(self, swift_client, account, manifest, manifest_meta,
-                 headers={}):
+                 headers={}, limiters=None):
         self._swift = swift_client
         self._manifest = manifest
         self._account = account
         self._swift_req_headers = headers
+        self._limiters = limiters
         self._s3_headers = convert_to_s3_headers(manifest_meta)
         self._s3_headers[SLO_ETAG_FIELD] = manifest_meta['etag']
         self._segment = None
@@ -380,7 +424,8 @@ class SLOFileWrapper(object):
         segment = self._manifest[self._segment_index]
         container, key = segment['name'].split('/', 2)[1:]
         self._segment = FileWrapper(self._swift, self._account, container,
-                                    key, self._swift_req_headers)
+                                    key, self._swift_req_headers,
+                                    self._limiters)
         self._segment_index += 1
 
     def read(self, size=-1):
@@ -451,6 +496,8 @@ class BlobstorePutWrapper(object):
 
 class SwiftPutWrapper(object):
     CHUNK_SIZE = 65536
+    # Set when the object could not be restored
+    failed = False
 
     def __init__(self, body, headers, path, app, logger):
         self.body = body
@@ -485,9 +532,11 @@ class SwiftPutWrapper(object):
 
     def _wait_for_put(self):
         resp = self.put_thread.wait()
-        if not resp.is_success and self.logger:
-            self.logger.warning(
-                'Failed to restore the object: %s' % resp.status)
+        if not resp.is_success:
+            self.failed = True
+            if self.logger:
+                self.logger.warning(
+                    'Failed to restore the object: %s' % resp.status)
         close_if_possible(resp.app_iter)
         return resp
 
@@ -589,6 +638,8 @@ class SwiftSloPutWrapper(SwiftPutWrapper):
         self.headers['ETag'] = etag.hexdigest()
         req = Request.blank(self.path, environ=env, headers=self.headers)
         resp = req.get_response(self.app)
+        if not resp.is_success:
+            self.failed = True
         if self.logger:
             if resp.status_int == 202:
                 self.logger.warning(
@@ -917,6 +968,16 @@ def response_is_complete(status_code, headers):
 
 
 def iter_listing(list_func, logger, marker, limit, prefix, *args):
+    '''Iterates over the entries of a listing, requesting the pages as they
+    are needed.
+
+    The limit may be a callable that returns the size of the next page.
+    '''
+    def _page_size():
+        if callable(limit):
+            return limit()
+        return limit
+
     def _results_iterator(_resp):
         while True:
             if _resp.status != 200:
@@ -937,20 +998,77 @@ def iter_listing(list_func, logger, marker, limit, prefix, *args):
             # strings. We should do the same when submitting
             # subsequent requests.
             marker = marker.encode('utf-8')
-            _resp = list_func(marker, limit, prefix, *args)
+            _resp = list_func(marker, _page_size(), prefix, *args)
         yield None, None  # just to simplify some book-keeping
 
-    resp = list_func(marker, limit, prefix, *args)
+    resp = list_func(marker, _page_size(), prefix, *args)
     return resp, _results_iterator(resp)
 
 
+def iter_json_listing(body_iter):
+    '''Parses the entries of a JSON listing as the chunks of the body
+    arrive, rather than loading the whole listing at once.'''
+    decoder = json.JSONDecoder()
+    chunks = iter(body_iter)
+    buf = ''
+    pos = 0
+    started = False
+    while True:
+        while pos < len(buf) and buf[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(buf):
+            if not started:
+                if buf[pos] != '[':
+                    raise ValueError('Listing is not a JSON list')
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == ']':
+                return
+            try:
+                entry, pos = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # The entry continues in the next chunk
+                pass
+            else:
+                yield entry
+                continue
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            raise ValueError('Truncated JSON listing')
+        buf = buf[pos:] + chunk
+        pos = 0
+
+
+class ListingLimit(object):
+    '''Counts the entries of a spliced listing against the limit of the
+    request, so that the remote pages only ask for what is still needed.'''
+    def __init__(self, limit):
+        self.limit = limit
+        self.count = 0
+
+    def remaining(self):
+        return max(1, self.limit - self.count)
+
+    def reached(self):
+        return self.count >= self.limit
+
+
 def splice_listing(local_iter, remote_iter, limit):
+    return list(iter_splice_listing(local_iter, remote_iter, limit))
+
+
+def iter_splice_listing(local_iter, remote_iter, limit):
+    '''Merges the local and remote listings, up to the limit (a number or
+    a ListingLimit).'''
+    if not isinstance(limit, ListingLimit):
+        limit = ListingLimit(limit)
     remote_item, remote_key = next(remote_iter)
     # There used to be an unnecessary short-circuit here if remote_item is
     # false. However, it's easier to handle "local_iter" possibly only yielding
     # items and not tuples of (item, key) if that's only handled in one place.
 
-    spliced_response = []
     for local_item in local_iter:
         # If local_iter came from iter_listing() then it has local_key in it
         # already, otherwise it will have come from a local Swift cluster
@@ -968,20 +1086,24 @@ def splice_listing(local_iter, remote_iter, limit):
             # local_iter came from iter_listing() and it's exhausted
             break
 
-        if len(spliced_response) == limit:
-            break
+        if limit.reached():
+            return
 
         if not remote_item:
-            spliced_response.append(local_item)
+            limit.count += 1
+            yield local_item
             continue
 
         while (remote_item and remote_key < local_key and
-               len(spliced_response) < limit):
-            spliced_response.append(remote_item)
+               not limit.reached()):
+            limit.count += 1
+            yield remote_item
+            if limit.reached():
+                return
             remote_item, remote_key = next(remote_iter)
 
-        if len(spliced_response) == limit:
-            break
+        if limit.reached():
+            return
 
         if remote_key == local_key:
             # duplicate!
@@ -991,65 +1113,138 @@ def splice_listing(local_iter, remote_iter, limit):
             # local_item['content_location'] or
             # local_item['content_location'][0] or something??
             remote_item['content_location'].append('swift')
-            spliced_response.append(remote_item)
+            limit.count += 1
+            yield remote_item
+            if limit.reached():
+                return
             remote_item, remote_key = next(remote_iter)
         else:
-            spliced_response.append(local_item)
+            limit.count += 1
+            yield local_item
 
     while remote_item:
-        if len(spliced_response) == limit:
-            break
-        spliced_response.append(remote_item)
+        if limit.reached():
+            return
+        limit.count += 1
+        yield remote_item
+        if limit.reached():
+            return
         remote_item, _junk = next(remote_iter)
-    return spliced_response
+
+
+def _make_xml_entry(entry, entry_node, fields):
+    obj = etree.Element(entry_node)
+    for f in fields:
+        if f not in entry:
+            continue
+        el = etree.Element(f)
+        text = entry[f]
+        if type(text) == str:
+            text = text.decode('utf-8')
+        elif type(text) == int:
+            text = str(text)
+        el.text = text
+        obj.append(el)
+    return obj
 
 
 def format_xml_listing(
         list_results, root_node, root_name, entry_node, fields):
     root = etree.Element(root_node, name=root_name)
     for entry in list_results:
-        obj = etree.Element(entry_node)
-        for f in fields:
-            if f not in entry:
-                continue
-            el = etree.Element(f)
-            text = entry[f]
-            if type(text) == str:
-                text = text.decode('utf-8')
-            elif type(text) == int:
-                text = str(text)
-            el.text = text
-            obj.append(el)
-        root.append(obj)
+        root.append(_make_xml_entry(entry, entry_node, fields))
     resp = etree.tostring(root, encoding='UTF-8', xml_declaration=True)
     return resp.replace("<?xml version='1.0' encoding='UTF-8'?>",
                         '<?xml version="1.0" encoding="UTF-8"?>', 1)
 
 
-def format_container_listing_response(list_results, list_format, account):
+def iter_xml_listing(
+        list_results, root_node, root_name, entry_node, fields):
+    list_results = iter(list_results)
+    try:
+        entry = next(list_results)
+    except StopIteration:
+        yield format_xml_listing([], root_node, root_name, entry_node, fields)
+        return
+    # The empty root element is "<root_node name=.../>"
+    root_tag = format_xml_listing(
+        [], root_node, root_name, entry_node, fields)[:-2]
+    yield root_tag + '>'
+    yield etree.tostring(_make_xml_entry(entry, entry_node, fields),
+                         encoding='UTF-8')
+    for entry in list_results:
+        yield etree.tostring(_make_xml_entry(entry, entry_node, fields),
+                             encoding='UTF-8')
+    yield '</%s>' % root_node
+
+
+def _iter_json_listing_response(list_results):
+    yield '['
+    for i, entry in enumerate(list_results):
+        if i:
+            yield ', '
+        yield json.dumps(entry)
+    yield ']'
+
+
+def _iter_plain_listing_response(list_results):
+    for i, entry in enumerate(list_results):
+        name = entry['name'] if 'name' in entry else entry['subdir']
+        if i:
+            yield '\n'
+        yield name.encode('utf-8')
+
+
+def _iter_chunks(pieces):
+    chunk_size = LISTING_CHUNK_SIZE
+    chunk = []
+    size = 0
+    for piece in pieces:
+        chunk.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def iter_container_listing_response(list_results, list_format, account):
+    '''Formats the (possibly lazy) list of containers as chunks of the
+    response body.'''
     if list_format == 'application/json':
-        return json.dumps(list_results)
+        return _iter_chunks(_iter_json_listing_response(list_results))
     if list_format.endswith('/xml'):
         fields = ['name', 'count', 'bytes', 'last_modified', 'subdir']
-        return format_xml_listing(
-            list_results, 'account', account, 'container', fields)
+        return _iter_chunks(iter_xml_listing(
+            list_results, 'account', account, 'container', fields))
     # Default to plain format
-    return u'\n'.join(entry['name'] if 'name' in entry else entry['subdir']
-                      for entry in list_results).encode('utf-8')
+    return _iter_chunks(_iter_plain_listing_response(list_results))
 
 
-def format_listing_response(list_results, list_format, container):
+def iter_listing_response(list_results, list_format, container):
+    '''Formats the (possibly lazy) list of objects as chunks of the
+    response body.'''
     if list_format == 'application/json':
-        return json.dumps(list_results)
+        return _iter_chunks(_iter_json_listing_response(list_results))
     if list_format.endswith('/xml'):
         fields = ['name', 'content_type', 'hash', 'bytes', 'last_modified',
                   'subdir']
-        return format_xml_listing(
-            list_results, 'container', container, 'object', fields)
-
+        return _iter_chunks(iter_xml_listing(
+            list_results, 'container', container, 'object', fields))
     # Default to plain format
-    return u'\n'.join(entry['name'] if 'name' in entry else entry['subdir']
-                      for entry in list_results).encode('utf-8')
+    return _iter_chunks(_iter_plain_listing_response(list_results))
+
+
+def format_container_listing_response(list_results, list_format, account):
+    return ''.join(iter_container_listing_response(
+        list_results, list_format, account))
+
+
+def format_listing_response(list_results, list_format, container):
+    return ''.join(iter_listing_response(
+        list_results, list_format, container))
 
 
 def get_list_params(req, list_limit):
@@ -1061,7 +1256,130 @@ def get_list_params(req, list_limit):
     return limit, marker, prefix, delimiter, path
 
 
+def _epoch_days(date):
+    days = _EPOCH_DAYS_CACHE.get(date)
+    if days is None:
+        days = datetime.date(
+            int(date[0:4]), int(date[5:7]), int(date[8:10])).toordinal() -\
+            _EPOCH_ORDINAL
+        if len(_EPOCH_DAYS_CACHE) >= _EPOCH_DAYS_CACHE_SIZE:
+            _EPOCH_DAYS_CACHE.clear()
+        _EPOCH_DAYS_CACHE[date] = days
+    return days
+
+
+def datetime_to_us(dt):
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def parse_list_time(value):
+    '''Convert a listing timestamp into microseconds since the epoch.
+
+    The listing timestamps are always in the SWIFT_TIME_FMT format, which
+    allows us to slice out the fields instead of calling strptime() (which is
+    an order of magnitude slower). Anything that does not look like the
+    expected format is handed off to strptime(), so the errors raised for
+    malformed values are unchanged.
+    '''
+    if len(value) > 20 and len(value) <= 26 and value[19] == '.' and\
+            value[10] == 'T' and value[4] == value[7] == '-' and\
+            value[13] == value[16] == ':' and value[20:].isdigit():
+        try:
+            seconds = _epoch_days(value[:10]) * 86400 +\
+                int(value[11:13]) * 3600 + int(value[14:16]) * 60 +\
+                int(value[17:19])
+            return seconds * 1000000 + int(value[20:].ljust(6, '0'))
+        except ValueError:
+            pass
+    return datetime_to_us(datetime.datetime.strptime(value, SWIFT_TIME_FMT))
+
+
+def diff_listings(local_iter, remote_iter, marker, older_than=None,
+                  now=None):
+    '''Merge the local and remote listings and decide what to do with each.
+
+    Both iterators must be sorted by name and yield None once exhausted (as
+    the migrator listing generators do). Yields (action, entry) tuples, where
+    action is one of the ListingDiffActions. Every remote entry is yielded
+    exactly once (MIGRATE, SKIP, or CHECK_ETAG); local entries are yielded as
+    RECONCILE if they are not present in the remote listing. Once the remote
+    listing is exhausted, we reconcile the local entries up to the last
+    remote key (or all of them, if the remote listing was empty).
+
+    :param marker: the marker used for the remote listing.
+    :param older_than: only migrate objects older than this many seconds.
+    :param now: the current time (seconds since the epoch); defaults to the
+                time the diff is started. The cutoff is computed once, rather
+                than for every entry.
+    '''
+    cutoff = None
+    if older_than is not None:
+        if now is None:
+            now = datetime_to_us(datetime.datetime.utcnow())
+        else:
+            now = int(now * 1000000)
+        cutoff = now - int(older_than * 1000000)
+
+    scanned = 0
+    local = next(local_iter)
+    remote = next(remote_iter)
+    while remote:
+        remote_name = remote['name']
+        marker = remote_name
+        while local and local['name'] < remote_name:
+            yield ListingDiffActions.RECONCILE, local
+            local = next(local_iter)
+
+        remote_time = None
+        matched = local and local['name'] == remote_name
+        if matched:
+            remote_time = parse_list_time(remote['last_modified'])
+            local_time = parse_list_time(local['last_modified'])
+            if local_time == remote_time:
+                if local['hash'] == remote['hash']:
+                    action = ListingDiffActions.SKIP
+                else:
+                    action = ListingDiffActions.CHECK_ETAG
+            elif local_time > remote_time:
+                action = ListingDiffActions.SKIP
+            else:
+                action = ListingDiffActions.MIGRATE
+        else:
+            action = ListingDiffActions.MIGRATE
+
+        if action == ListingDiffActions.MIGRATE and cutoff is not None:
+            if remote_time is None:
+                remote_time = parse_list_time(remote['last_modified'])
+            if remote_time >= cutoff:
+                action = ListingDiffActions.SKIP
+        scanned += 1
+        yield action, remote
+        remote = next(remote_iter)
+        if matched:
+            local = next(local_iter)
+
+    # We may have objects left behind that need to be removed
+    while local and (not marker or local['name'] < marker or scanned == 0):
+        yield ListingDiffActions.RECONCILE, local
+        local = next(local_iter)
+
+
 def get_sys_migrator_header(path_type):
     if path_type == 'object':
         return get_object_transient_sysmeta(MIGRATOR_HEADER)
     return '%s%s' % (get_sys_meta_prefix(path_type), MIGRATOR_HEADER)
+
+
+def get_metric_name(op, sync_profile, *labels):
+    '''Returns the statsd name of a shunt metric:
+    <op>.<account>.<bucket>[.<label>...].
+
+    The profile is identified by its account and remote bucket, rather than
+    the container, so that the profiles that apply to all of the containers
+    of an account do not create the metrics for every container.
+    '''
+    profile_labels = [sync_profile['account'], sync_profile['aws_bucket']]
+    return '.'.join([op] + [
+        unicode(label).encode('utf-8').replace('.', '_')
+        for label in profile_labels + list(labels)])
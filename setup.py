@@ -19,6 +19,7 @@ setup(name='swift-s3-sync',
               'swift-s3-sync = s3_sync.__main__:main',
               'swift-s3-verify = s3_sync.verify:main',
               'swift-s3-migrator = s3_sync.migrator:main',
+              'swift-s3-prefetch = s3_sync.prefetch:main',
               'cloud-connector = s3_sync.cloud_connector.app:main',
           ],
           'paste.filter_factory': [
@@ -0,0 +1,97 @@
+"""
+Copyright 2018 SwiftStack
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+# Microbenchmark comparing the per-entry strptime() based listing comparison
+# the migrator used to perform with utils.diff_listings(). Run with:
+#
+#   python test/perf/listing_diff.py [entries]
+
+import datetime
+import random
+import sys
+import time
+
+from s3_sync.utils import diff_listings, SWIFT_TIME_FMT
+
+
+def make_listings(count):
+    base = 1.5e9
+    local = []
+    remote = []
+    for i in xrange(count):
+        name = 'obj-%08d' % i
+        ts = base + random.randint(0, 10 ** 7) + random.random()
+        remote.append({'name': name, 'hash': 'etag',
+                       'last_modified': datetime.datetime.utcfromtimestamp(
+                           ts).strftime(SWIFT_TIME_FMT)})
+        if i % 10:
+            local.append(dict(remote[-1]))
+    return local, remote
+
+
+def legacy_diff(local_iter, remote_iter, older_than):
+    # The loop in Migrator._find_missing_objects() prior to diff_listings()
+    def old_enough(remote):
+        now = datetime.datetime.utcnow()
+        remote_time = datetime.datetime.strptime(
+            remote['last_modified'], SWIFT_TIME_FMT)
+        return remote_time < now - datetime.timedelta(seconds=older_than)
+
+    migrate = 0
+    local = next(local_iter)
+    remote = next(remote_iter)
+    while remote:
+        if not local or local['name'] > remote['name']:
+            if old_enough(remote):
+                migrate += 1
+            remote = next(remote_iter)
+        elif local['name'] < remote['name']:
+            local = next(local_iter)
+        else:
+            local_time = datetime.datetime.strptime(
+                local['last_modified'], SWIFT_TIME_FMT)
+            remote_time = datetime.datetime.strptime(
+                remote['last_modified'], SWIFT_TIME_FMT)
+            if local_time < remote_time and old_enough(remote):
+                migrate += 1
+            remote = next(remote_iter)
+            local = next(local_iter)
+    return migrate
+
+
+def new_diff(local_iter, remote_iter, older_than):
+    return sum(1 for action, _ in diff_listings(
+        local_iter, remote_iter, '', older_than) if action == 'migrate')
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    local, remote = make_listings(count)
+    results = []
+    for name, func in (('legacy', legacy_diff), ('diff_listings', new_diff)):
+        start = time.time()
+        migrated = func(iter(local + [None]), iter(remote + [None]), 60)
+        elapsed = time.time() - start
+        results.append(migrated)
+        print '%-14s %8d entries in %.3fs (%.0f keys/s)' % (
+            name, count, elapsed, count / elapsed)
+    if results[0] != results[1]:
+        print 'Mismatched results: %r' % results
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import json
+import mock
+import unittest
+
+from swift.common import swob
+
+from s3_sync import access_tracker
+
+
+class FakeApp(object):
+    def __init__(self):
+        self.calls = []
+        self.containers = set()
+
+    def __call__(self, env, start_response):
+        req = swob.Request(env)
+        self.calls.append((req.method, req.path_info, req.headers.get(
+            'X-Delete-After'), req.body))
+        version, account, container, obj = req.split_path(3, 4, True)
+        container_path = '/'.join(['', version, account, container])
+        if not obj:
+            self.containers.add(container_path)
+        elif container_path not in self.containers:
+            return swob.HTTPNotFound()(env, start_response)
+        return swob.HTTPCreated()(env, start_response)
+
+
+class TestAccessTracker(unittest.TestCase):
+    def setUp(self):
+        self.app = FakeApp()
+        self.logger = mock.Mock()
+        self.tracker = access_tracker.AccessTracker(
+            self.app, self.logger, flush_interval=60)
+        self.tracker._writer = 'proxy-1'
+        self.profile = {'account': 'AUTH_a', 'container': 'c',
+                        'access_window': 3600}
+
+    @mock.patch('s3_sync.access_tracker.eventlet.spawn')
+    def test_record(self, mock_spawn):
+        with mock.patch('s3_sync.access_tracker.time.time', return_value=0):
+            self.tracker.record(self.profile, 'v1', 'AUTH_a', 'c', 'o')
+        accesses = self.tracker.containers[('v1', 'AUTH_a', 'c')]
+        for now in (10, 20):
+            with mock.patch('s3_sync.access_tracker.time.time',
+                            return_value=now):
+                self.tracker.record(
+                    self.profile, 'v1', 'AUTH_a', 'c', '\xc3\xa9')
+        self.assertEqual([(u'o', [1, 0]), (u'\u00e9', [2, 20])],
+                         accesses.objects.items())
+        # The accesses are written out by a single background greenthread
+        mock_spawn.assert_called_once_with(self.tracker._run_flusher)
+
+        with mock.patch('s3_sync.access_tracker.time.time', return_value=60):
+            self.tracker.record(self.profile, 'v1', 'AUTH_a', 'c', 'o')
+        with mock.patch('s3_sync.access_tracker.time.time',
+                        return_value=3615):
+            self.tracker._flush_all()
+        # The entries out of the window are not written
+        body = json.dumps({u'\u00e9': [2, 20], u'o': [2, 60]})
+        self.assertEqual(
+            [('PUT', '/v1/.cloud_sync_AUTH_a/c+access/proxy-1', '3660', body),
+             ('PUT', '/v1/.cloud_sync_AUTH_a/c+access', None, ''),
+             ('PUT', '/v1/.cloud_sync_AUTH_a/c+access/proxy-1', '3660', body)],
+            self.app.calls)
+        self.assertFalse(accesses.dirty)
+
+        # Nothing is written if there were no reads since the last flush
+        self.app.calls = []
+        self.tracker._flush_all()
+        self.assertEqual([], self.app.calls)
+
+    @mock.patch('s3_sync.access_tracker.eventlet.sleep')
+    @mock.patch('s3_sync.access_tracker.eventlet.spawn')
+    def test_flush_single_read(self, mock_spawn, mock_sleep):
+        with mock.patch('s3_sync.access_tracker.time.time', return_value=10):
+            self.tracker.record(self.profile, 'v1', 'AUTH_a', 'c', 'o')
+            # A read is written out without any further traffic
+            mock_sleep.side_effect = [None, None, RuntimeError('stop')]
+            with self.assertRaises(RuntimeError):
+                mock_spawn.call_args[0][0]()
+        self.assertEqual([mock.call(60)] * 3, mock_sleep.mock_calls)
+        body = json.dumps({u'o': [1, 10]})
+        self.assertEqual(
+            [('PUT', '/v1/.cloud_sync_AUTH_a/c+access/proxy-1', '3660', body),
+             ('PUT', '/v1/.cloud_sync_AUTH_a/c+access', None, ''),
+             ('PUT', '/v1/.cloud_sync_AUTH_a/c+access/proxy-1', '3660', body)],
+            self.app.calls)
+
+    @mock.patch('s3_sync.access_tracker.eventlet.spawn')
+    def test_record_untracked(self, mock_spawn):
+        self.tracker.record({'account': 'AUTH_a', 'container': 'c'},
+                            'v1', 'AUTH_a', 'c', 'o')
+        self.tracker.sample_rate = 0.5
+        with mock.patch('s3_sync.access_tracker.random.random',
+                        return_value=0.5):
+            self.tracker.record(self.profile, 'v1', 'AUTH_a', 'c', 'o')
+        self.assertEqual({}, self.tracker.containers)
+
+    def test_max_tracked_objects(self):
+        accesses = access_tracker.ContainerAccesses(3600)
+        with mock.patch.object(access_tracker, 'MAX_TRACKED_OBJECTS', 2):
+            for i, obj in enumerate(['a', 'b', 'a', 'c']):
+                accesses.record(obj, i)
+        # The least recently read objects are dropped
+        self.assertEqual([('a', [2, 2]), ('c', [1, 3])],
+                         accesses.objects.items())
+
+    def test_load_access_times(self):
+        swift_client = mock.Mock()
+        swift_client.iter_objects.return_value = [
+            {'name': 'proxy-1'}, {'name': 'proxy-2'}, {'name': 'proxy-3'}]
+        swift_client.get_object.side_effect = [
+            (200, {}, [json.dumps({'a': [1, 10], 'b': [2, 30]})]),
+            (200, {}, [json.dumps({'a': [5, 20]})]),
+            # Expired since the listing
+            (404, {}, ['Not Found'])]
+        self.assertEqual(
+            {'a': 20, 'b': 30}, access_tracker.load_access_times(
+                swift_client, 'AUTH_a', 'c'))
+        swift_client.iter_objects.assert_called_once_with(
+            '.cloud_sync_AUTH_a', 'c+access')
@@ -0,0 +1,127 @@
+import mock
+import time
+import unittest
+
+from s3_sync import bandwidth
+
+
+class TestTokenBucket(unittest.TestCase):
+    @mock.patch('s3_sync.bandwidth.eventlet.sleep')
+    @mock.patch('s3_sync.bandwidth.time.time')
+    def test_consume(self, mock_time, mock_sleep):
+        mock_time.return_value = 1000.0
+        bucket = bandwidth.TokenBucket(100, burst=200)
+
+        # The burst is available right away
+        bucket.consume(150)
+        bucket.consume(50)
+        self.assertFalse(mock_sleep.called)
+
+        # Past the burst, the consumer waits for the tokens to be refilled
+        bucket.consume(50)
+        mock_sleep.assert_called_once_with(0.5)
+        mock_sleep.reset_mock()
+
+        mock_time.return_value = 1001.0
+        bucket.consume(50)
+        self.assertFalse(mock_sleep.called)
+
+        # Idle time does not accumulate past the burst
+        mock_time.return_value = 1100.0
+        bucket.consume(300)
+        mock_sleep.assert_called_once_with(1.0)
+
+    @mock.patch('s3_sync.bandwidth.eventlet.sleep')
+    @mock.patch('s3_sync.bandwidth.time.time')
+    def test_set_rate(self, mock_time, mock_sleep):
+        mock_time.return_value = 1000.0
+        bucket = bandwidth.TokenBucket(1000)
+        bucket.set_rate(10)
+        self.assertEqual(10, bucket.burst)
+        bucket.consume(20)
+        mock_sleep.assert_called_once_with(1.0)
+
+
+class TestBandwidthLimiter(unittest.TestCase):
+    def test_schedule(self):
+        limiter = bandwidth.BandwidthLimiter(
+            1000, schedule=[
+                {'start': '09:00', 'end': '18:00', 'limit': 10},
+                {'start': '22:00', 'end': '02:30', 'limit': 0}])
+
+        def _at(hours, minutes):
+            return time.mktime((2018, 6, 1, hours, minutes, 0, 0, 0, -1))
+
+        self.assertEqual(1000, limiter.get_limit(_at(8, 59)))
+        self.assertEqual(10, limiter.get_limit(_at(9, 0)))
+        self.assertEqual(10, limiter.get_limit(_at(17, 59)))
+        self.assertEqual(1000, limiter.get_limit(_at(18, 0)))
+        self.assertEqual(0, limiter.get_limit(_at(23, 0)))
+        self.assertEqual(0, limiter.get_limit(_at(2, 29)))
+        self.assertEqual(1000, limiter.get_limit(_at(2, 30)))
+
+    def test_invalid_schedule(self):
+        for value in ['9', '24:00', '12:60', 'noon']:
+            with self.assertRaises(ValueError):
+                bandwidth.BandwidthLimiter(
+                    schedule=[{'start': value, 'end': '18:00', 'limit': 1}])
+
+    @mock.patch('s3_sync.bandwidth.TokenBucket')
+    def test_consume(self, mock_bucket):
+        limiter = bandwidth.BandwidthLimiter(0, burst=500)
+        limiter.consume(100)
+        self.assertFalse(mock_bucket.called)
+
+        limiter.limit = 100
+        limiter.consume(100)
+        mock_bucket.assert_called_once_with(100, 500)
+        mock_bucket.return_value.rate = 100
+        mock_bucket.return_value.consume.assert_called_once_with(100)
+
+        limiter.limit = 50
+        limiter.consume(10)
+        mock_bucket.return_value.set_rate.assert_called_once_with(50, 500)
+
+
+class TestGetLimiters(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(bandwidth, '_endpoint_limiters', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(bandwidth.set_process_limiter, {})
+
+    def test_no_limits(self):
+        bandwidth.set_process_limiter({})
+        self.assertEqual([], bandwidth.get_limiters({'aws_bucket': 'foo'}))
+
+    def test_shared_limiters(self):
+        bandwidth.set_process_limiter({'bandwidth_limit': 1000})
+        settings = {'aws_endpoint': 'http://remote', 'aws_bucket': 'foo',
+                    'bandwidth_limit': 100, 'bandwidth_burst': 200}
+        limiters = bandwidth.get_limiters(settings)
+        self.assertEqual([100, 1000], [limiter.limit for limiter in limiters])
+        self.assertEqual(200, limiters[0].burst)
+
+        # Profiles with the same endpoint and limits share the limiter
+        other = bandwidth.get_limiters(dict(settings, aws_bucket='bar'))
+        self.assertIs(limiters[0], other[0])
+        self.assertIs(limiters[1], other[1])
+
+        other = bandwidth.get_limiters(dict(settings, aws_endpoint='http://x'))
+        self.assertIsNot(limiters[0], other[0])
+        other = bandwidth.get_limiters(dict(settings, bandwidth_limit=10))
+        self.assertIsNot(limiters[0], other[0])
+
+
+class TestRateLimitedIter(unittest.TestCase):
+    def test_iter(self):
+        limiters = [mock.Mock(), mock.Mock()]
+        body = mock.MagicMock()
+        body.__iter__.return_value = iter(['abc', 'de'])
+        limited = bandwidth.RateLimitedIter(body, limiters)
+        self.assertEqual(['abc', 'de'], list(limited))
+        for limiter in limiters:
+            self.assertEqual([mock.call(3), mock.call(2)],
+                             limiter.consume.mock_calls)
+        limited.close()
+        body.close.assert_called_once_with()
@@ -1,7 +1,13 @@
+import logging
+import logging.handlers
 import mock
+import os
 import s3_sync.daemon_utils
+import shutil
 import StringIO
 import sys
+import tempfile
+import time
 import unittest
 
 
@@ -94,3 +100,112 @@ class TestDaemonUtils(unittest.TestCase):
             mock.call('botocore'),
             mock.call().setLevel('INFO'),
             mock.call().addHandler(handler)])
+
+
+class TestSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(self.temp_dir))
+        self.logger = logging.getLogger('test-supervisor')
+
+    def _record_start(self, index):
+        # Every start of a worker creates a new file
+        fd, _ = tempfile.mkstemp(dir=self.temp_dir, prefix='%d-' % index)
+        os.close(fd)
+
+    def _starts(self, index):
+        return len([name for name in os.listdir(self.temp_dir)
+                    if name.startswith('%d-' % index)])
+
+    @mock.patch('s3_sync.daemon_utils.multiprocessing.cpu_count')
+    def test_get_process_count(self, cpu_count_mock):
+        cpu_count_mock.return_value = 8
+        self.assertEqual(8, s3_sync.daemon_utils.get_process_count('auto'))
+        self.assertEqual(3, s3_sync.daemon_utils.get_process_count('3'))
+        self.assertEqual(1, s3_sync.daemon_utils.get_process_count(1))
+        for value in (0, -1, 'foo'):
+            with self.assertRaises(ValueError):
+                s3_sync.daemon_utils.get_process_count(value)
+
+    def test_run_once(self):
+        def _target(index):
+            self._record_start(index)
+
+        supervisor = s3_sync.daemon_utils.Supervisor(
+            3, _target, self.logger, interval=0.01)
+        self.assertEqual(0, supervisor.run(once=True))
+        self.assertEqual([1, 1, 1], [self._starts(i) for i in range(3)])
+        self.assertEqual({}, supervisor.children)
+
+    def test_run_once_failure(self):
+        def _target(index):
+            if index == 1:
+                raise RuntimeError('failed')
+            if index == 2:
+                sys.exit(3)
+
+        supervisor = s3_sync.daemon_utils.Supervisor(
+            3, _target, self.logger, interval=0.01)
+        with mock.patch.object(self.logger, 'error') as error_mock:
+            self.assertEqual(1, supervisor.run(once=True))
+        # The error logged by the failed worker happens in the child process
+        errors = sorted(call[0][0] for call in error_mock.call_args_list)
+        self.assertEqual(2, len(errors))
+        self.assertTrue(errors[0].startswith('Worker 1 (pid '))
+        self.assertTrue(errors[0].endswith(') exited with status 1'))
+        self.assertTrue(errors[1].startswith('Worker 2 (pid '))
+        self.assertTrue(errors[1].endswith(') exited with status 3'))
+
+    def test_restarts_workers(self):
+        def _target(index):
+            self._record_start(index)
+            if index == 0:
+                raise RuntimeError('crashed')
+            # The second worker keeps running until it is stopped
+            while True:
+                time.sleep(0.01)
+
+        supervisor = s3_sync.daemon_utils.Supervisor(
+            2, _target, self.logger, interval=0.01, restart_interval=0)
+
+        def _callback():
+            if self._starts(0) >= 3:
+                supervisor.stop()
+
+        with mock.patch.object(self.logger, 'error'):
+            self.assertEqual(1, supervisor.run(callback=_callback))
+        self.assertGreaterEqual(self._starts(0), 3)
+        self.assertEqual(1, self._starts(1))
+        self.assertEqual({}, supervisor.children)
+
+    def test_worker_log_files(self):
+        log_file = os.path.join(self.temp_dir, 'worker.log')
+        logger = logging.getLogger('test-supervisor-log')
+        logger.setLevel(logging.INFO)
+        handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=100, backupCount=1)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        self.addCleanup(handler.close)
+
+        def _target(index):
+            # The workers follow the rotations instead of rotating the file
+            if logger.handlers[0].__class__ is not \
+                    logging.handlers.WatchedFileHandler:
+                sys.exit(2)
+            logger.info('worker %d' % index)
+
+        supervisor = s3_sync.daemon_utils.Supervisor(
+            2, _target, self.logger, interval=0.01)
+        self.assertEqual(0, supervisor.run(once=True))
+        self.assertEqual([handler], logger.handlers)
+        with open(log_file) as fh:
+            self.assertEqual(['worker 0\n', 'worker 1\n'],
+                             sorted(fh.readlines()))
+
+        # The supervisor rotates the log file once the workers fill it up
+        with open(log_file, 'a') as fh:
+            fh.write('x' * 100)
+        supervisor._rotate_log_files()
+        self.assertTrue(os.path.exists(log_file + '.1'))
+        self.assertEqual(0, os.path.getsize(log_file))
@@ -15,8 +15,11 @@ limitations under the License.
 """
 
 import mock
+import os
 import s3_sync
+import shutil
 import sys
+import tempfile
 import unittest
 
 
@@ -77,7 +80,8 @@ class TestMain(unittest.TestCase):
             {'https_proxy': 'https://some-proxy:1443'}
         ]
 
-        mock_args = mock.Mock(console=False, log_level='debug', once=False)
+        mock_args = mock.Mock(console=False, log_level='debug', once=False,
+                              processes=None)
 
         for conf in test_params:
             context_mock.return_value = (mock_args, conf)
@@ -97,8 +101,10 @@ class TestMain(unittest.TestCase):
     @mock.patch('s3_sync.__main__.setup_context')
     @mock.patch('s3_sync.__main__.ContainerCrawler')
     def test_run_once(self, crawler_mock, context_mock, logger_mock):
-        tests = [mock.Mock(console=False, log_level='debug', once=False),
-                 mock.Mock(console=False, log_level='debug', once=True)]
+        tests = [mock.Mock(console=False, log_level='debug', once=False,
+                           processes=None),
+                 mock.Mock(console=False, log_level='debug', once=True,
+                           processes=None)]
 
         # avoid loading boto3 and SyncContainer
         sys.modules['s3_sync.sync_container'] = mock.Mock()
@@ -113,3 +119,72 @@ class TestMain(unittest.TestCase):
 
             crawler_mock.reset_mock()
             context_mock.reset_mock()
+
+    @mock.patch('s3_sync.__main__.Supervisor')
+    @mock.patch('s3_sync.__main__.setup_logger')
+    @mock.patch('s3_sync.__main__.setup_context')
+    @mock.patch('s3_sync.__main__.ContainerCrawler')
+    def test_processes(self, crawler_mock, context_mock, logger_mock,
+                       supervisor_mock):
+        mappings = [{'account': 'AUTH_test', 'container': 'c%d' % i}
+                    for i in range(5)]
+        conf = {'containers': mappings, 'workers': 10}
+        context_mock.return_value = (
+            mock.Mock(console=False, log_level='debug', once=True,
+                      processes='2'),
+            conf)
+        supervisor_mock.return_value.run.return_value = 0
+
+        s3_sync.__main__.main()
+        supervisor_mock.assert_called_once_with(2, mock.ANY, mock.ANY)
+        supervisor_mock.return_value.run.assert_called_once_with(True)
+        self.assertFalse(crawler_mock.called)
+
+        run_worker = supervisor_mock.call_args[0][1]
+        for index, expected in ((0, [0, 2, 4]), (1, [1, 3])):
+            crawler_mock.reset_mock()
+            run_worker(index)
+            shard = crawler_mock.call_args[0][0]
+            self.assertEqual([mappings[i] for i in expected],
+                             shard['containers'])
+            self.assertEqual(10, shard['workers'])
+            crawler_mock.return_value.run_once.assert_called_once_with()
+        self.assertEqual(mappings, conf['containers'])
+
+        # A failed worker fails the daemon
+        supervisor_mock.return_value.run.return_value = 1
+        with self.assertRaises(SystemExit):
+            s3_sync.__main__.main()
+
+    def test_metrics_file(self):
+        conf = {'status_dir': '/var/lib/swift-s3-sync'}
+        self.assertIsNone(s3_sync.__main__.get_metrics_file(conf))
+        conf['prometheus_metrics'] = True
+        self.assertEqual('/var/lib/swift-s3-sync/metrics.prom',
+                         s3_sync.__main__.get_metrics_file(conf))
+        self.assertEqual('/var/lib/swift-s3-sync/metrics.2.prom',
+                         s3_sync.__main__.get_metrics_file(conf, 2))
+
+    def test_remove_stale_metrics_files(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(temp_dir))
+        conf = {'status_dir': temp_dir, 'prometheus_metrics': True}
+        names = ['metrics.prom', 'metrics.0.prom', 'metrics.1.prom',
+                 'metrics.2.prom', 'metrics.other.prom', 'status.1.prom']
+        for name in names:
+            open(os.path.join(temp_dir, name), 'w').close()
+
+        # The files of the processes that are no longer run are removed
+        s3_sync.__main__.remove_stale_metrics_files(conf, 2)
+        self.assertEqual(
+            ['metrics.0.prom', 'metrics.1.prom', 'metrics.other.prom',
+             'status.1.prom'], sorted(os.listdir(temp_dir)))
+        s3_sync.__main__.remove_stale_metrics_files(conf, 1)
+        self.assertEqual(['metrics.other.prom', 'status.1.prom'],
+                         sorted(os.listdir(temp_dir)))
+
+        # Nothing is removed if the metrics files are not enabled
+        open(os.path.join(temp_dir, 'metrics.0.prom'), 'w').close()
+        del conf['prometheus_metrics']
+        s3_sync.__main__.remove_stale_metrics_files(conf, 1)
+        self.assertIn('metrics.0.prom', os.listdir(temp_dir))
@@ -16,6 +16,7 @@ limitations under the License.
 from contextlib import contextmanager
 import datetime
 import errno
+import eventlet
 import hashlib
 import itertools
 import json
@@ -614,6 +615,28 @@ class TestMigratorUtils(unittest.TestCase):
         with open(self.status_file_path) as rf:
             self.assertEqual(1, len(json.load(rf)))
 
+    def test_status_save_progress(self):
+        config = {'account': 'AUTH_dev', 'aws_bucket': 'bucket',
+                  'aws_secret': 'secret'}
+        self.setup_status_file_path()
+        status = s3_sync.migrator.Status(self.status_file_path)
+        status.load_status_list()
+        status.save_progress(config, {'copied_count': 1})
+        for count in range(s3_sync.migrator.PASS_HISTORY_LENGTH + 2):
+            status.save_progress(config, {'copied_count': count},
+                                 pass_finished=True)
+        status.save_progress(config, {'copied_count': 100})
+        with open(self.status_file_path) as rf:
+            status_list = json.load(rf)
+        self.assertEqual(1, len(status_list))
+        self.assertNotIn('aws_secret', status_list[0])
+        self.assertEqual({'copied_count': 100},
+                         status_list[0]['status']['progress'])
+        self.assertEqual(
+            [{'copied_count': count} for count in range(
+                2, s3_sync.migrator.PASS_HISTORY_LENGTH + 2)],
+            status_list[0]['status']['pass_history'])
+
     @mock.patch('s3_sync.migrator.json.load')
     def test_load_corrupt_json(self, mock_json_load):
         mock_json_load.side_effect = ValueError(
@@ -1164,6 +1187,18 @@ class TestMigrator(unittest.TestCase):
         self.assertEqual(['Copied "bucket1/obj"',
                           'Copied "bucket2/obj"'],
                          self.stream.getvalue().splitlines())
+        progress = {
+            'started': 100.0,
+            'updated': 100.0,
+            'copied_count': 1,
+            'scanned_count': 1,
+            'bytes_count': 1337,
+            'error_count': 0,
+            'objects_per_second': 1000.0,
+            'bytes_per_second': 1337000.0,
+            'object_queue': 0,
+            'container_queue': 0,
+        }
         with open(status_file) as f:
             status = json.load(f)
         self.assertEqual(status, [{
@@ -1173,6 +1208,8 @@ class TestMigrator(unittest.TestCase):
                 'finished': 100.0,
                 'scanned_count': 1,
                 'bytes_count': 1337,
+                'progress': progress,
+                'pass_history': [progress],
             },
             'account': 'AUTH_dev',
             'container': 'bucket1',
@@ -1185,6 +1222,8 @@ class TestMigrator(unittest.TestCase):
                 'finished': 100.0,
                 'scanned_count': 1,
                 'bytes_count': 1337,
+                'progress': progress,
+                'pass_history': [progress],
             },
             'account': 'AUTH_dev',
             'container': 'bucket2',
@@ -1207,6 +1246,8 @@ class TestMigrator(unittest.TestCase):
                 'finished': 100.0,
                 'scanned_count': 1,
                 'bytes_count': 1337,
+                'progress': progress,
+                'pass_history': [progress],
             },
             'account': 'AUTH_dev',
             'container': 'bucket1',
@@ -1219,6 +1260,8 @@ class TestMigrator(unittest.TestCase):
                 'finished': 100.0,
                 'scanned_count': 1,
                 'bytes_count': 1337,
+                'progress': progress,
+                'pass_history': [progress],
             },
             'account': 'AUTH_dev',
             'container': 'bucket2',
@@ -1231,6 +1274,8 @@ class TestMigrator(unittest.TestCase):
                 'finished': 100.0,
                 'scanned_count': 1,
                 'bytes_count': 1337,
+                'progress': progress,
+                'pass_history': [progress],
             },
             'account': 'AUTH_dev',
             'container': 'bucket3',
@@ -1329,6 +1374,272 @@ class TestMigrator(unittest.TestCase):
             self.assertEqual(self.migrator.config['container'],
                              called_env['PATH_INFO'].split('/')[3])
 
+    def test_checkpoint_tracker(self):
+        tracker = s3_sync.migrator.CheckpointTracker('container')
+        self.assertIsNone(tracker.checkpoint())
+        tracker.add('a')
+        tracker.add('b', pending=True)
+        tracker.add('c')
+        self.assertEqual('a', tracker.checkpoint())
+        tracker.add('d', pending=True)
+        tracker.done('d')
+        self.assertEqual('a', tracker.checkpoint())
+        tracker.done('b')
+        self.assertEqual('d', tracker.checkpoint())
+        self.assertEqual('d', tracker.checkpoint())
+
+    def test_checkpoint_marker(self):
+        def _entry(name):
+            return {'name': name, 'hash': 'etag',
+                    'last_modified': '2017-07-14T02:40:00.000000'}
+
+        self.migrator.checkpoint_keys = 2
+        self.migrator.stats = s3_sync.migrator.MigratorPassStats()
+        self.migrator._manifests = set()
+        self.migrator._saved_stats = (0, 0, 0)
+        self.migrator._stats_reset = False
+        self.migrator._iter_source_container = mock.Mock(return_value=iter(
+            [_entry(name) for name in 'abcd'] + [None]))
+        self.migrator._iterate_internal_listing = mock.Mock(
+            return_value=iter([_entry('a'), _entry('c'), None]))
+
+        # Objects "b" and "d" need to be migrated; only "b" completes while
+        # the listing is processed.
+        def fake_put(work):
+            if work.key == 'b':
+                self.migrator._work_done(work)
+
+        self.migrator.object_queue = mock.Mock()
+        self.migrator.object_queue.put.side_effect = fake_put
+
+        marker = self.migrator._find_missing_objects(
+            'bucket', 'bucket', '', '', False)
+        self.assertEqual('d', marker)
+        self.assertEqual(
+            [mock.call(self.migrator.config, 'b', 0, 2, 0, False,
+                       pass_finished=False),
+             mock.call(self.migrator.config, 'c', 0, 2, 0, False,
+                       pass_finished=False)],
+            self.migrator.status.save_migration.mock_calls)
+        self.assertEqual(4, self.migrator.stats.scanned)
+        self.assertIsNone(self.migrator._checkpoints)
+
+        # The end of the pass only records the counts since the checkpoint
+        self.migrator.stats.update(copied=1, bytes_copied=10)
+        self.migrator._save_progress(marker)
+        self.migrator.status.save_migration.assert_called_with(
+            self.migrator.config, 'd', 1, 0, 10, False)
+
+    def test_checkpoint_slo_manifest(self):
+        self.migrator._manifests = set()
+        self.migrator._checkpoints = s3_sync.migrator.CheckpointTracker(
+            'bucket')
+        self.migrator._checkpoints.add('slo', pending=True)
+        work = s3_sync.migrator.MigrateObjectWork('bucket', 'bucket', 'slo')
+        manifest_work = s3_sync.migrator.UploadObjectWork(
+            'bucket', 'slo', None, {}, 'bucket')
+        self.migrator._pending_manifests[('bucket', 'slo')] = work
+
+        # The object remains pending while its manifest is queued
+        self.migrator._work_done(work)
+        self.assertIsNone(self.migrator._checkpoints.checkpoint())
+        self.migrator._work_done(manifest_work)
+        self.assertEqual('slo', self.migrator._checkpoints.checkpoint())
+        self.assertEqual({}, self.migrator._pending_manifests)
+
+    def test_failed_slo_manifest(self):
+        work = s3_sync.migrator.MigrateObjectWork('bucket', 'bucket', 'slo')
+        manifest_work = s3_sync.migrator.UploadObjectWork(
+            'bucket', 'slo', None, {'Content-Length': '0'}, 'bucket')
+        self.migrator._pending_manifests[('bucket', 'slo')] = work
+        self.migrator._recovered.add(work)
+        self.migrator.stats = s3_sync.migrator.MigratorPassStats()
+        self.migrator._upload_object = mock.Mock(
+            side_effect=s3_sync.migrator.MigrationError('failed to upload'))
+        self.migrator.object_queue.put(manifest_work)
+        self.migrator.object_queue.put(None)
+        self.migrator._upload_worker()
+        self.assertEqual([(work, 'MigrationError: failed to upload')],
+                         self.migrator._failed_work)
+        self.assertEqual(set(), self.migrator._recovered)
+        self.assertEqual({}, self.migrator._pending_manifests)
+
+    @mock.patch('s3_sync.migrator.MIGRATOR_METRICS')
+    def test_pass_progress(self, mock_metrics):
+        with mock.patch('time.time', return_value=1000.0):
+            self.migrator.stats = s3_sync.migrator.MigratorPassStats()
+        self.migrator.object_queue.put('work')
+        self.migrator.stats.update(copied=10, bytes_copied=1000, errors=1)
+        self.migrator._set_remaining(
+            {'x-container-object-count': '110',
+             'x-container-bytes-used': '10000'},
+            {'x-container-object-count': '20',
+             'x-container-bytes-used': '1000'})
+        self.migrator.stats.update(copied=10, scanned=30, bytes_copied=1000)
+
+        with mock.patch('time.time', return_value=1010.0):
+            self.migrator._report_progress()
+        progress = {
+            'started': 1000.0,
+            'updated': 1010.0,
+            'copied_count': 20,
+            'scanned_count': 30,
+            'bytes_count': 2000,
+            'error_count': 1,
+            'objects_per_second': 2.0,
+            'bytes_per_second': 200.0,
+            'object_queue': 1,
+            'container_queue': 0,
+            'remaining_count': 80,
+            'remaining_bytes': 8000,
+            'eta': 40,
+        }
+        self.migrator.status.save_progress.assert_called_once_with(
+            self.migrator.config, progress, False)
+        mock_metrics.set_gauge.assert_any_call(
+            'pass_eta', 40, account='AUTH_test', container='bucket')
+        mock_metrics.set_gauge.assert_any_call(
+            'pass_object_queue', 1, account='AUTH_test', container='bucket')
+        mock_metrics.maybe_write.assert_called_once_with()
+
+        # Without the source container stats, there is no estimate
+        self.migrator._set_remaining({}, None)
+        with mock.patch('time.time', return_value=1010.0):
+            self.migrator._report_progress(pass_finished=True)
+        for key in ('remaining_count', 'remaining_bytes', 'eta'):
+            del progress[key]
+        self.migrator.status.save_progress.assert_called_with(
+            self.migrator.config, progress, True)
+        mock_metrics.set_gauge.assert_called_with(
+            'last_pass_finished', 1010.0, account='AUTH_test',
+            container='bucket')
+
+    @mock.patch('swift.common.utils.StatsdClient._open_socket')
+    def test_pass_progress_statsd(self, mock_socket):
+        metrics = s3_sync.stats.Metrics('test')
+        metrics.configure({'log_statsd_host': 'localhost',
+                           'log_statsd_default_sample_rate': '0.5'})
+        with mock.patch('time.time', return_value=1000.0):
+            self.migrator.stats = s3_sync.migrator.MigratorPassStats()
+        self.migrator.stats.update(copied=10, scanned=10, bytes_copied=1000)
+        with mock.patch('s3_sync.migrator.MIGRATOR_METRICS', metrics), \
+                mock.patch('time.time', return_value=1010.0):
+            self.migrator._report_progress(pass_finished=True)
+        # The gauges are never sampled
+        self.assertEqual(
+            ['test.pass_copied_count.AUTH_test.bucket:10|g',
+             'test.pass_bytes_count.AUTH_test.bucket:1000|g',
+             'test.pass_error_count.AUTH_test.bucket:0|g',
+             'test.pass_objects_per_second.AUTH_test.bucket:1.0|g',
+             'test.pass_bytes_per_second.AUTH_test.bucket:100.0|g',
+             'test.pass_object_queue.AUTH_test.bucket:0|g',
+             'test.pass_container_queue.AUTH_test.bucket:0|g',
+             'test.last_pass_finished.AUTH_test.bucket:1010.0|g'],
+            [call[1][0]
+             for call in mock_socket.return_value.sendto.mock_calls])
+
+    @mock.patch('s3_sync.migrator.create_provider')
+    def test_retry_failed_objects(self, create_provider_mock):
+        temp_dir = mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(temp_dir))
+        journal = s3_sync.migrator.RetryJournal(
+            os.path.join(temp_dir, 'status.retry'))
+        self.migrator.retry_journal = journal
+        self.migrator.status.get_migration.return_value = {}
+        self.swift_client.container_exists.return_value = True
+        self.swift_client.make_request.return_value = mock.Mock(
+            body=json.dumps([]), status_int=200)
+        provider = create_provider_mock.return_value
+        provider.list_objects.return_value = ProviderResponse(
+            True, 200, {}, [{'name': 'foo'}])
+        provider.get_object.return_value = ProviderResponse(
+            False, 500, {}, mock.Mock())
+
+        with mock.patch('time.time', return_value=1000.0):
+            self.migrator.next_pass()
+        work = s3_sync.migrator.MigrateObjectWork('bucket', 'bucket', 'foo')
+        self.assertEqual([work], journal.get_failures(self.migrator.config))
+        with open(journal.location) as fh:
+            failure = json.load(fh)[0]['failures'][0]
+        self.assertEqual(1, failure['attempts'])
+        self.assertEqual(1060.0, failure['retry_at'])
+        self.assertTrue(failure['error'].startswith(
+            'MigrationError: Failed to GET "bucket/foo"'))
+        self.migrator.status.save_migration.assert_called_with(
+            self.migrator.config, 'foo', 0, 1, 0, False, failed_count=1,
+            retried_count=0)
+
+        # The object is not retried before the backoff expires
+        provider.reset_mock()
+        provider.list_objects.return_value = ProviderResponse(
+            True, 200, {}, [])
+        with mock.patch('time.time', return_value=1059.0):
+            self.migrator.next_pass()
+        self.assertEqual([], provider.get_object.mock_calls)
+        self.migrator.status.save_migration.assert_called_with(
+            self.migrator.config, '', 0, 0, 0, True, failed_count=1,
+            retried_count=0)
+
+        # A failed retry doubles the backoff
+        with mock.patch('time.time', return_value=1060.0):
+            self.migrator.next_pass()
+        provider.get_object.assert_called_once_with(
+            'foo', bucket='bucket', query_string='multipart-manifest=get')
+        self.assertEqual(
+            [], journal.get_failures(self.migrator.config, 1179.0))
+        self.assertEqual(
+            [work], journal.get_failures(self.migrator.config, 1180.0))
+
+        provider.get_object.return_value = ProviderResponse(
+            True, 200, {'last-modified': create_timestamp(1.5e9),
+                        'etag': 'deadbeef',
+                        'Content-Length': '3'},
+            StringIO('foo'))
+        with mock.patch('time.time', return_value=1180.0):
+            self.migrator.next_pass()
+        self.assertEqual([], journal.get_failures(self.migrator.config))
+        self.migrator.status.save_migration.assert_called_with(
+            self.migrator.config, '', 1, 0, 3, True, failed_count=0,
+            retried_count=1)
+        self.assertEqual('bucket', self.swift_client.upload_object.call_args[
+            0][2])
+
+    @mock.patch('s3_sync.migrator.create_provider')
+    def test_retry_source_not_found(self, create_provider_mock):
+        temp_dir = mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(temp_dir))
+        journal = s3_sync.migrator.RetryJournal(
+            os.path.join(temp_dir, 'status.retry'))
+        self.migrator.retry_journal = journal
+        work = s3_sync.migrator.MigrateObjectWork('bucket', 'bucket', 'foo')
+        journal.update(self.migrator.config, [(work, 'error')], [], 1000.0)
+        self.migrator.status.get_migration.return_value = {}
+        self.swift_client.container_exists.return_value = True
+        self.swift_client.make_request.return_value = mock.Mock(
+            body=json.dumps([]), status_int=200)
+        provider = create_provider_mock.return_value
+        provider.list_objects.return_value = ProviderResponse(
+            True, 200, {}, [])
+        provider.get_object.return_value = ProviderResponse(
+            False, 404, {}, mock.Mock())
+
+        # The object was removed from the source since the failure
+        with mock.patch('time.time', return_value=1060.0):
+            self.migrator.next_pass()
+        provider.get_object.assert_called_once_with(
+            'foo', bucket='bucket', query_string='multipart-manifest=get')
+        self.assertEqual([], journal.get_failures(self.migrator.config))
+        self.migrator.status.save_migration.assert_called_with(
+            self.migrator.config, '', 0, 0, 0, True, failed_count=0,
+            retried_count=1)
+
+        # Objects that are missing when first copied are not journaled
+        provider.list_objects.return_value = ProviderResponse(
+            True, 200, {}, [{'name': 'bar'}])
+        with mock.patch('time.time', return_value=1120.0):
+            self.migrator.next_pass()
+        self.assertEqual([], journal.get_failures(self.migrator.config))
+
     @mock.patch('s3_sync.migrator.create_provider')
     def test_head_container_error(self, create_provider_mock):
         self.migrator.config['protocol'] = 'swift'
@@ -1377,7 +1688,8 @@ class TestMigrator(unittest.TestCase):
             ['http://test/v1', self.migrator.config['account'],
              self.migrator.config['container']])
 
-        time_mock.time.side_effect = (0, 0, 1)
+        # The last call is for the progress report at the end of the pass
+        time_mock.time.side_effect = (0, 0, 1, 1)
         self.migrator.status.get_migration.return_value = {}
 
         self.migrator.next_pass()
@@ -1554,6 +1866,110 @@ class TestMigrator(unittest.TestCase):
                 self.assertEqual(manifest, json.loads(''.join(body)))
             parts[obj] = True
 
+    def test_migrate_large_object_as_slo(self):
+        self.migrator.config['large_object_threshold'] = 8
+        self.migrator.config['segment_size'] = 4
+        self.migrator._manifests = set()
+        self.migrator.gthread_local.uploaded_objects = 0
+        self.migrator.gthread_local.bytes_copied = 0
+        content = 'abcdefghij'
+        remote_headers = {
+            'x-object-meta-foo': 'bar',
+            'last-modified': create_timestamp(1.5e9),
+            'etag': hashlib.md5(content).hexdigest(),
+            'content-type': 'text/plain',
+            'Content-Length': str(len(content))}
+        get_body = mock.Mock()
+
+        def get_object(key, **kwargs):
+            self.assertEqual('big', key)
+            self.assertEqual('bucket', kwargs['bucket'])
+            if 'Range' not in kwargs:
+                return ProviderResponse(True, 200, remote_headers, get_body)
+            start, end = map(int, kwargs['Range'][len('bytes='):].split('-'))
+            return ProviderResponse(
+                True, 206, {'Content-Length': str(end - start + 1)},
+                iter([content[start:end + 1]]))
+
+        uploads = {}
+
+        def upload_object(body, account, container, key, headers):
+            uploads[(container, key)] = (body.read(), headers)
+
+        swift_404_resp = mock.Mock()
+        swift_404_resp.status_int = 404
+        self.migrator.provider = mock.Mock()
+        self.migrator.provider.get_object.side_effect = get_object
+        self.swift_client.get_object_metadata.side_effect = \
+            UnexpectedResponse('', swift_404_resp)
+        self.swift_client.container_exists.return_value = False
+        self.swift_client.upload_object.side_effect = upload_object
+
+        self.migrator._migrate_object('bucket', 'bucket', 'big')
+
+        get_body.close.assert_called_once_with()
+        self.swift_client.create_container.assert_called_once_with(
+            'AUTH_test', u'bucket_segments')
+        x_timestamp = Timestamp(1.5e9).internal
+        segment_prefix = u'big/slo/%s/10/4/' % x_timestamp
+        expected_segments = [('abcd', segment_prefix + '00000000'),
+                             ('efgh', segment_prefix + '00000001'),
+                             ('ij', segment_prefix + '00000002')]
+        for data, name in expected_segments:
+            self.assertEqual(
+                (data, {'Content-Length': str(len(data)),
+                        'Content-Type': 'application/octet-stream'}),
+                uploads[('bucket_segments', name)])
+
+        manifest = [{'name': u'/bucket_segments/' + name,
+                     'hash': hashlib.md5(data).hexdigest(),
+                     'bytes': len(data),
+                     'content_type': 'application/octet-stream'}
+                    for data, name in expected_segments]
+        manifest_blob, headers = uploads[('bucket', 'big')]
+        self.assertEqual(manifest, json.loads(manifest_blob))
+        self.assertEqual({
+            'x-object-meta-foo': 'bar',
+            'content-type': 'text/plain',
+            'x-timestamp': x_timestamp,
+            'Content-Length': str(len(manifest_blob)),
+            'x-static-large-object': 'True',
+            'x-object-sysmeta-slo-etag': hashlib.md5(''.join(
+                [entry['hash'] for entry in manifest])).hexdigest(),
+            'x-object-sysmeta-slo-size': '10',
+            'x-object-sysmeta-multi-cloud-source-etag': hashlib.md5(
+                content).hexdigest(),
+            'x-object-sysmeta-multi-cloud-source-size': '10',
+            s3_sync.utils.get_sys_migrator_header('object'): x_timestamp,
+        }, headers)
+        self.assertEqual(1, self.migrator.gthread_local.uploaded_objects)
+        self.assertEqual(len(content) + len(manifest_blob),
+                         self.migrator.gthread_local.bytes_copied)
+
+    def test_migrate_large_object_aligned_segments(self):
+        self.migrator.config['large_object_threshold'] = 8
+        self.migrator.config['align_segments'] = True
+        self.migrator.provider = mock.Mock()
+        self.migrator.provider.head_object.return_value = ProviderResponse(
+            True, 206, {'Content-Length': '6'}, [''])
+        self.assertEqual(6, self.migrator._get_segment_size(
+            'bucket', 'big', {'etag': 'deadbeef-2'}))
+        self.migrator.provider.head_object.assert_called_once_with(
+            'big', bucket='bucket', PartNumber=1)
+
+        # Not a multipart upload
+        self.assertEqual(
+            s3_sync.migrator.DEFAULT_SEGMENT_SIZE,
+            self.migrator._get_segment_size(
+                'bucket', 'big', {'etag': 'deadbeef'}))
+
+        self.migrator.provider.head_object.return_value = ProviderResponse(
+            False, 400, {}, [''])
+        self.assertEqual(
+            s3_sync.migrator.DEFAULT_SEGMENT_SIZE,
+            self.migrator._get_segment_size(
+                'bucket', 'big', {'etag': 'deadbeef-2'}))
+
     @mock.patch('s3_sync.sync_s3.SyncS3._get_client_factory')
     @mock.patch('s3_sync.migrator.create_provider')
     def test_closes_s3_connections(
@@ -1867,6 +2283,77 @@ class TestMigrator(unittest.TestCase):
         self.migrator.next_pass()
         self.assertEqual('', self.stream.getvalue())
 
+    @mock.patch('s3_sync.migrator.create_provider')
+    def test_etag_mismatch_migrated_as_slo(self, create_provider_mock):
+        self.migrator.config['large_object_threshold'] = 8
+        self.migrator.config['segment_size'] = 4
+        self.migrator._manifests = set()
+        self.migrator.status.get_migration.return_value = {}
+        self.migrator.gthread_local.uploaded_objects = 0
+        self.migrator.gthread_local.bytes_copied = 0
+        provider = create_provider_mock.return_value
+        content = 'abcdefghij'
+        remote_headers = {
+            'last-modified': create_timestamp(1.5e9),
+            'etag': hashlib.md5(content).hexdigest(),
+            'Content-Length': str(len(content))}
+
+        def get_object(key, **kwargs):
+            if 'Range' not in kwargs:
+                return ProviderResponse(True, 200, remote_headers, mock.Mock())
+            start, end = map(int, kwargs['Range'][len('bytes='):].split('-'))
+            return ProviderResponse(
+                True, 206, {'Content-Length': str(end - start + 1)},
+                iter([content[start:end + 1]]))
+
+        uploads = {}
+
+        def upload_object(body, account, container, key, headers):
+            uploads[(container, key)] = headers
+
+        swift_404_resp = mock.Mock()
+        swift_404_resp.status_int = 404
+        self.migrator.provider = provider
+        provider.get_object.side_effect = get_object
+        self.swift_client.get_object_metadata.side_effect = \
+            UnexpectedResponse('', swift_404_resp)
+        self.swift_client.upload_object.side_effect = upload_object
+        self.migrator._migrate_object('bucket', 'bucket', 'big')
+        local_meta = dict((k.lower(), v) for k, v in
+                          uploads[('bucket', 'big')].items())
+
+        # Re-run the migration over the segmented object: the listings have
+        # the same date, but the local ETag is the SLO ETag
+        self.swift_client.get_object_metadata.side_effect = None
+        self.swift_client.get_object_metadata.return_value = local_meta
+        self.swift_client.container_exists.return_value = True
+        self.migrator._read_account_headers = mock.Mock(return_value={})
+        self.swift_client.make_request.side_effect = lambda *args, **kw: \
+            mock.Mock(status_int=200, body=json.dumps([
+                {'name': 'big',
+                 'last_modified': create_list_timestamp(1.5e9),
+                 'hash': local_meta['x-object-sysmeta-slo-etag']}]))
+        provider.list_objects.return_value = ProviderResponse(
+            True, 200, {},
+            [{'name': 'big', 'last_modified': create_list_timestamp(1.5e9),
+              'hash': remote_headers['etag']}])
+        provider.head_object.return_value = ProviderResponse(
+            True, 200, remote_headers, [''])
+        provider.head_bucket.return_value = mock.Mock(status=200, headers={})
+        provider.head_account.return_value = {}
+        uploads.clear()
+        self.stream.truncate(0)
+
+        self.migrator.next_pass()
+        self.assertEqual('', self.stream.getvalue())
+        self.assertEqual({}, uploads)
+
+        # The error is still reported if the source object differs
+        remote_headers['Content-Length'] = '11'
+        self.migrator.next_pass()
+        self.assertIn('Mismatching ETag for regular objects with the same '
+                      'date', self.stream.getvalue())
+
     @mock.patch('s3_sync.migrator.create_provider')
     def test_reconcile_deleted_object(self, create_provider_mock):
         provider_mock = create_provider_mock.return_value
@@ -2226,6 +2713,112 @@ class TestStatus(unittest.TestCase):
             'last_scanned_count': 16,
         }, status)
 
+    def test_update_checkpoint_keeps_finished(self):
+        status = {
+            'finished': self.start,
+            'moved_count': 1,
+            'scanned_count': 8,
+            'bytes_count': 100,
+        }
+        s3_sync.migrator._update_status_counts(
+            status, 0, 4, 0, True, pass_finished=False)
+        self.assertEqual({
+            'finished': self.start,
+            'moved_count': 0,
+            'scanned_count': 4,
+            'bytes_count': 0,
+            'last_finished': self.start,
+            'last_moved_count': 1,
+            'last_scanned_count': 8,
+            'last_bytes_count': 100,
+        }, status)
+        s3_sync.migrator._update_status_counts(status, 1, 4, 10, False)
+        self.assertEqual(self.start + 1, status['finished'])
+        self.assertEqual(self.start, status['last_finished'])
+
+
+class TestRetryJournal(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(self.temp_dir))
+        self.journal = s3_sync.migrator.RetryJournal(
+            os.path.join(self.temp_dir, 'status.retry'), 10, 25)
+        self.migration = {'aws_bucket': 'bucket',
+                          'account': 'AUTH_test',
+                          'aws_identity': 'identity',
+                          'aws_secret': 'secret'}
+
+    def _load(self):
+        with open(self.journal.location) as fh:
+            return json.load(fh)
+
+    def test_missing_journal(self):
+        self.assertEqual([], self.journal.get_failures(self.migration))
+        self.assertEqual(0, self.journal.update(self.migration, [], [], 0))
+        self.assertFalse(os.path.exists(self.journal.location))
+
+    def test_corrupted_journal(self):
+        with open(self.journal.location, 'w') as fh:
+            fh.write('{"foo"')
+        self.assertEqual([], self.journal.get_failures(self.migration))
+
+    def test_backoff(self):
+        work = s3_sync.migrator.MigrateObjectWork('bucket', 'container', 'a')
+        for now, retry_at in [(100, 110), (110, 130), (130, 155),
+                              (155, 180)]:
+            self.assertEqual(1, self.journal.update(
+                self.migration, [(work, 'error')], [], now))
+            self.assertEqual(
+                [], self.journal.get_failures(self.migration, retry_at - 1))
+            self.assertEqual(
+                [work], self.journal.get_failures(self.migration, retry_at))
+
+        journal = self._load()
+        self.assertEqual(1, len(journal))
+        self.assertNotIn('aws_secret', journal[0]['migration'])
+        self.assertEqual([{'aws_bucket': 'bucket',
+                           'container': 'container',
+                           'key': 'a',
+                           'attempts': 4,
+                           'retry_at': 180,
+                           'error': 'error'}], journal[0]['failures'])
+
+    def test_recovered(self):
+        failed = [s3_sync.migrator.MigrateObjectWork('bucket', 'bucket', key)
+                  for key in ('a', 'b')]
+        self.assertEqual(2, self.journal.update(
+            self.migration, [(work, 'error') for work in failed], [], 0))
+        self.assertEqual(1, self.journal.update(
+            self.migration, [], failed[:1], 0))
+        self.assertEqual(failed[1:],
+                         self.journal.get_failures(self.migration))
+        self.assertEqual(0, self.journal.update(
+            self.migration, [], failed[1:], 0))
+        self.assertEqual([], self._load())
+
+    def test_max_attempts(self):
+        self.journal.max_attempts = 3
+        work = s3_sync.migrator.MigrateObjectWork('bucket', 'bucket', 'a')
+        for now in (100, 110):
+            self.assertEqual(1, self.journal.update(
+                self.migration, [(work, 'error')], [], now))
+        self.assertEqual(0, self.journal.update(
+            self.migration, [(work, 'error')], [], 130))
+        self.assertEqual([], self.journal.get_failures(self.migration))
+        self.assertEqual([], self._load())
+
+    def test_prune(self):
+        other = dict(self.migration, aws_bucket='other')
+        work = s3_sync.migrator.MigrateObjectWork('bucket', 'bucket', 'a')
+        self.journal.update(self.migration, [(work, 'error')], [], 0)
+        self.journal.update(other, [(work, 'error')], [], 0)
+        self.assertEqual(2, len(self._load()))
+
+        self.journal.prune([other])
+        journal = self._load()
+        self.assertEqual(1, len(journal))
+        self.assertEqual('other', journal[0]['migration']['aws_bucket'])
+
 
 class TestMain(unittest.TestCase):
 
@@ -2311,22 +2904,178 @@ class TestMain(unittest.TestCase):
         with self.patch('setup_context') as mock_setup_context,\
                 self.patch('Migrator') as mock_migrator,\
                 self.patch('Status') as mock_status,\
+                self.patch('RetryJournal') as mock_journal,\
                 self.patch(
                     'run',
                     new_callable=lambda: mock.Mock(side_effect=old_run))\
                 as mock_run:
             mock_setup_context.return_value = (
-                mock.Mock(log_level='warn', console=True, once=True),
+                mock.Mock(log_level='warn', console=True, once=True,
+                          processes=None),
                 config)
+            mock_migrator.return_value.next_pass.return_value = [
+                config['migrations'][0]]
 
             s3_sync.migrator.main()
             mock_status.assert_called_once_with('/test/status')
+            mock_journal.assert_called_once_with(
+                '/test/status.retry', 60.0, 86400.0, 10)
             mock_migrator.assert_called_once_with(
                 config['migrations'][0], mock_status.return_value, 42, 1337,
-                mock.ANY, mock.ANY, 0, 15)
+                mock.ANY, mock.ANY, 0, 15, mock_journal.return_value,
+                mock.ANY)
             mock_run.assert_called_once_with(
                 config['migrations'], mock_status.return_value, mock.ANY,
-                mock.ANY, 42, 1337, 0, 15, 60, True)
+                mock.ANY, 42, 1337, 0, 15, 60, True,
+                mock_journal.return_value, 1)
+            mock_journal.return_value.prune.assert_called_once_with(
+                [config['migrations'][0]])
+
+    def test_supervised_workers(self):
+        temp_dir = mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(temp_dir))
+        status_file = os.path.join(temp_dir, 'migrator.status')
+        with open(status_file, 'w') as fh:
+            json.dump([{'aws_bucket': 'bucket'}], fh)
+        # Left over from running with more worker processes
+        stale_files = [status_file + suffix
+                       for suffix in ('.3', '.3.retry', '.3.prom', '.10')]
+        other_files = [status_file + suffix
+                       for suffix in ('.retry', '.prom', '.corrupted.1',
+                                      '.3.corrupted.1')]
+        for location in stale_files + other_files:
+            with open(location, 'w') as fh:
+                json.dump([{'aws_bucket': 'stale'}], fh)
+        config = {
+            'migrator_settings': {
+                'items_chunk': 42,
+                'status_file': status_file,
+                'process': 1,
+                'processes': 2,
+                'worker_processes': 3,
+            },
+            'migrations': [],
+        }
+
+        with self.patch('setup_context') as mock_setup_context,\
+                self.patch('Supervisor') as mock_supervisor,\
+                self.patch('_run_migrations') as mock_run_migrations,\
+                self.patch('aggregate_status') as mock_aggregate:
+            mock_setup_context.return_value = (
+                mock.Mock(log_level='warn', console=True, once=True,
+                          processes=None),
+                config)
+            mock_supervisor.return_value.run.return_value = 0
+
+            s3_sync.migrator.main()
+            mock_supervisor.assert_called_once_with(3, mock.ANY, mock.ANY)
+            mock_supervisor.return_value.run.assert_called_once_with(
+                True, mock.ANY)
+            mock_aggregate.assert_called_once_with(
+                status_file, ['%s.%d' % (status_file, i) for i in range(3)])
+
+            run_worker = mock_supervisor.call_args[0][1]
+            run_worker(2)
+            mock_run_migrations.assert_called_once_with(
+                config, config['migrator_settings'], mock.ANY, True, 5, 6,
+                status_file + '.2')
+
+        for index in range(3):
+            with open('%s.%d' % (status_file, index)) as fh:
+                self.assertEqual([{'aws_bucket': 'bucket'}], json.load(fh))
+        for location in stale_files:
+            self.assertFalse(os.path.exists(location))
+        for location in other_files:
+            self.assertTrue(os.path.exists(location))
+
+    def test_aggregate_status(self):
+        temp_dir = mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(temp_dir))
+        status_file = os.path.join(temp_dir, 'migrator.status')
+        worker_files = ['%s.%d' % (status_file, i) for i in range(3)]
+        with open(worker_files[0], 'w') as fh:
+            json.dump([{'aws_bucket': 'bucket0'}], fh)
+        with open(worker_files[2], 'w') as fh:
+            json.dump([{'aws_bucket': 'bucket2'},
+                       {'aws_bucket': 'bucket3'}], fh)
+
+        s3_sync.migrator.aggregate_status(status_file, worker_files)
+        with open(status_file) as fh:
+            self.assertEqual([{'aws_bucket': 'bucket0'},
+                              {'aws_bucket': 'bucket2'},
+                              {'aws_bucket': 'bucket3'}], json.load(fh))
+
+    def test_worker_shares(self):
+        tests = [
+            # weights, workers, concurrency, expected
+            ([], 10, 1, []),
+            ([1, 1, 1], 10, 1, [10, 10, 10]),
+            ([1, 1, 1, 1], 10, 2, [5, 5, 5, 5]),
+            ([1, 1], 10, 4, [5, 5]),
+            ([3, 1, 1, 1], 12, 2, [12, 4, 4, 4]),
+            ([1] * 100, 8, 16, [1] * 100),
+            ([0.5, 1.5], 10, 2, [2, 7]),
+        ]
+        for weights, workers, concurrency, expected in tests:
+            migrations = [{'aws_bucket': 'bucket%d' % i, 'weight': weight}
+                          for i, weight in enumerate(weights)]
+            self.assertEqual(
+                expected, s3_sync.migrator._get_worker_shares(
+                    migrations, workers, concurrency))
+
+    def test_concurrent_migrations(self):
+        migrations = [{'aws_bucket': 'bucket%d' % i,
+                       'account': 'AUTH_test',
+                       'aws_identity': 'identity'} for i in range(6)]
+        running = set()
+        max_running = [0]
+
+        def fake_next_pass(migration):
+            running.add(migration['aws_bucket'])
+            max_running[0] = max(max_running[0], len(running))
+            eventlet.sleep(0.01)
+            running.remove(migration['aws_bucket'])
+            return [migration]
+
+        def fake_migrator(migration, *args):
+            migrator = mock.Mock()
+            migrator.next_pass.side_effect = lambda: fake_next_pass(migration)
+            return migrator
+
+        status = mock.Mock()
+        provider_cache = mock.Mock()
+        with self.patch('Migrator') as mock_migrator:
+            mock_migrator.side_effect = fake_migrator
+            s3_sync.migrator.process_migrations(
+                migrations, status, mock.Mock(), self.logger, 1000, 9, 0, 1,
+                None, 3, provider_cache)
+        self.assertEqual(3, max_running[0])
+        self.assertEqual(
+            [mock.call(migration, status, 1000, 3, mock.ANY, self.logger, 0,
+                       1, None, provider_cache)
+             for migration in migrations],
+            mock_migrator.call_args_list)
+        status.prune.assert_called_once_with(migrations)
+        provider_cache.prune.assert_called_once_with(migrations)
+
+    def test_provider_cache(self):
+        cache = s3_sync.migrator.ProviderCache()
+        migration = {'aws_bucket': 'bucket', 'aws_identity': 'identity'}
+        create = mock.Mock(side_effect=lambda: mock.Mock())
+        provider = cache.get(migration, create)
+        self.assertIs(provider, cache.get(dict(migration), create))
+        self.assertEqual(1, create.call_count)
+
+        other = dict(migration, aws_bucket='other')
+        other_provider = cache.get(other, create)
+        self.assertIsNot(provider, other_provider)
+
+        cache.prune([other])
+        provider.close.assert_called_once_with()
+        self.assertFalse(other_provider.close.called)
+        self.assertIs(other_provider, cache.get(other, create))
+        cache.close()
+        other_provider.close.assert_called_once_with()
 
     @mock.patch('s3_sync.migrator.create_provider')
     def test_migrate_all_containers_error(self, create_provider_mock):
@@ -0,0 +1,58 @@
+import json
+import mock
+import unittest
+
+from s3_sync import prefetch
+
+
+class TestPrefetch(unittest.TestCase):
+    @mock.patch('s3_sync.prefetch.requests.post')
+    @mock.patch('s3_sync.prefetch.swiftclient.client.get_auth')
+    def test_main(self, mock_get_auth, mock_post):
+        mock_get_auth.return_value = ('http://swift/v1/AUTH_test', 'token')
+        progress = [
+            {'scanned': 10, 'restored': 5, 'present': 5, 'failed': 0,
+             'finished': False},
+            {'scanned': 12, 'restored': 7, 'present': 5, 'failed': 0,
+             'finished': True}]
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.iter_lines.return_value = [
+            json.dumps(counters) for counters in progress]
+        self.assertEqual(0, prefetch.main([
+            '--auth', 'http://swift/auth/v1.0', '--user', 'test:tester',
+            '--key', 'testing', '--container', '\xc3\xa9',
+            '--prefix', 'p/', '--workers', '4']))
+        mock_post.assert_called_once_with(
+            'http://swift/v1/AUTH_test/%C3%A9',
+            params={'restore': '', 'prefix': 'p/', 'workers': 4},
+            headers={'X-Auth-Token': 'token'}, stream=True)
+
+        # Failed restores and unfinished restores are reported
+        progress[-1]['failed'] = 1
+        mock_post.return_value.iter_lines.return_value = [
+            json.dumps(counters) for counters in progress]
+        self.assertEqual('Failed to restore 1 objects', prefetch.main([
+            '--url', 'http://swift/v1/AUTH_test', '--token', 'token',
+            '--container', 'c']))
+        mock_post.return_value.iter_lines.return_value = [
+            json.dumps(progress[0])]
+        self.assertEqual('The restore did not finish', prefetch.main([
+            '--url', 'http://swift/v1/AUTH_test', '--token', 'token',
+            '--container', 'c']))
+
+        mock_post.return_value.status_code = 403
+        mock_post.return_value.text = 'Forbidden'
+        self.assertEqual(
+            'Failed to restore the objects: 403 Forbidden', prefetch.main([
+                '--url', 'http://swift/v1/AUTH_test', '--token', 'token',
+                '--container', 'c']))
+
+    def test_missing_credentials(self):
+        self.assertEqual(
+            'argument --url is required with --token',
+            prefetch.main(['--token', 'token', '--container', 'c']))
+        self.assertEqual(
+            'arguments --auth, --user, and --key are required without '
+            '--token',
+            prefetch.main(['--auth', 'http://swift/auth/v1.0',
+                           '--container', 'c']))
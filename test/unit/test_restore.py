@@ -0,0 +1,372 @@
+import hashlib
+import json
+import mock
+import StringIO
+import unittest
+
+from swift.common import swob
+
+from s3_sync.base_sync import ProviderResponse
+from s3_sync import restore
+from s3_sync import utils
+
+
+class FakeApp(object):
+    def __init__(self, status='201 Created'):
+        self.status = status
+        self.calls = []
+
+    def __call__(self, env, start_response):
+        body = env['wsgi.input'].read() if 'wsgi.input' in env else ''
+        self.calls.append((env['REQUEST_METHOD'], env['PATH_INFO'], body))
+        status = '404 Not Found' if env['REQUEST_METHOD'] == 'HEAD' else \
+            self.status
+        start_response(status, [])
+        return ['']
+
+
+class TestRestoreObject(unittest.TestCase):
+    def setUp(self):
+        self.provider = mock.Mock()
+        self.logger = mock.Mock()
+        self.app = FakeApp()
+
+    def test_restore(self):
+        self.provider.shunt_object.return_value = (
+            '200 OK', [('Content-Length', '4'), ('etag', 'etag')],
+            StringIO.StringIO('data'))
+        self.assertTrue(restore.restore_object(
+            self.provider, u'o', '/v1/AUTH_a/c/o', self.app, self.logger,
+            'trans-id'))
+        req = self.provider.shunt_object.call_args[0][0]
+        self.assertEqual('GET', req.method)
+        self.assertEqual('trans-id', req.environ['swift.trans_id'])
+        self.assertEqual([('PUT', '/v1/AUTH_a/c/o', 'data')], self.app.calls)
+        self.assertFalse(self.provider.get_manifest.called)
+
+    def test_restore_slo(self):
+        self.provider.shunt_object.return_value = (
+            '200 OK', [('Content-Length', '4'), (utils.SLO_HEADER, 'True'),
+                       ('etag', 'etag')],
+            StringIO.StringIO('data'))
+        self.provider.get_manifest.return_value = [
+            {'bytes': 4, 'name': '/segments/part1', 'hash': 'etag'}]
+        self.assertTrue(restore.restore_object(
+            self.provider, u'o', '/v1/AUTH_a/c/o', self.app, self.logger))
+        self.provider.get_manifest.assert_called_once_with(u'o')
+        self.assertEqual(
+            [('PUT', '/v1/AUTH_a/segments', ''),
+             ('PUT', '/v1/AUTH_a/segments/part1', 'data'),
+             ('PUT', '/v1/AUTH_a/c/o', json.dumps([
+                 {'size_bytes': 4, 'path': '/segments/part1',
+                  'etag': 'etag'}]))],
+            self.app.calls)
+
+        # Without the manifest, the object is not restored
+        self.app.calls = []
+        self.provider.get_manifest.return_value = None
+        self.assertFalse(restore.restore_object(
+            self.provider, u'o', '/v1/AUTH_a/c/o', self.app, self.logger))
+        self.assertEqual([], self.app.calls)
+
+    def test_restore_failure(self):
+        self.provider.shunt_object.return_value = (
+            '404 Not Found', [], [''])
+        self.assertFalse(restore.restore_object(
+            self.provider, u'o', '/v1/AUTH_a/c/o', self.app, self.logger))
+        self.assertEqual([], self.app.calls)
+
+        self.app.status = '503 Service Unavailable'
+        self.provider.shunt_object.return_value = (
+            '200 OK', [('Content-Length', '4'), ('etag', 'etag')],
+            StringIO.StringIO('data'))
+        self.assertFalse(restore.restore_object(
+            self.provider, u'o', '/v1/AUTH_a/c/o', self.app, self.logger))
+
+
+class TestRestorePrefix(unittest.TestCase):
+    def setUp(self):
+        self.provider = mock.Mock()
+        self.logger = mock.Mock()
+        self.app = FakeApp()
+
+    @mock.patch('s3_sync.restore.restore_missing_object')
+    def test_restore_prefix(self, mock_restore):
+        self.provider.list_objects.side_effect = [
+            ProviderResponse(True, 200, {}, [
+                {'name': u'p/a', 'content_location': 'remote'},
+                {'name': u'p/\u00e9', 'content_location': 'remote'}]),
+            ProviderResponse(True, 200, {}, [
+                {'name': u'p/c', 'content_location': 'remote'}]),
+            ProviderResponse(True, 200, {}, [])]
+        mock_restore.side_effect = ['restored', 'present', RuntimeError()]
+        with mock.patch('s3_sync.restore.time.time',
+                        side_effect=[0, 1, 20, 20, 21]):
+            progress = list(restore.iter_restore_prefix(
+                self.provider, 'AUTH_a', 'c', 'p/', self.app, self.logger,
+                workers=1))
+        self.assertEqual([
+            {'scanned': 2, 'restored': 1, 'present': 1, 'failed': 0,
+             'finished': False},
+            {'scanned': 3, 'restored': 1, 'present': 1, 'failed': 1,
+             'finished': True}], progress)
+        self.assertEqual(
+            [mock.call(self.provider, u'p/a', '/v1/AUTH_a/c/p/a', self.app,
+                       self.logger),
+             mock.call(self.provider, u'p/\u00e9',
+                       '/v1/AUTH_a/c/p/%C3%A9', self.app, self.logger),
+             mock.call(self.provider, u'p/c', '/v1/AUTH_a/c/p/c', self.app,
+                       self.logger)],
+            mock_restore.mock_calls)
+        self.assertEqual(mock.call('', 1000, 'p/', ''),
+                         self.provider.list_objects.mock_calls[0])
+        self.logger.exception.assert_called_once_with(
+            'Failed to restore /v1/AUTH_a/c/p/c')
+
+    def test_restore_prefix_quoted_names(self):
+        self.provider.list_objects.side_effect = [
+            ProviderResponse(True, 200, {}, [
+                {'name': u'p/a?b#c%d', 'content_location': 'remote'}]),
+            ProviderResponse(True, 200, {}, [])]
+        self.provider.shunt_object.return_value = (
+            '200 OK', [('Content-Length', '4'), ('etag', 'etag')],
+            StringIO.StringIO('data'))
+        progress = list(restore.iter_restore_prefix(
+            self.provider, 'AUTH_a', 'c', 'p/', self.app, self.logger))
+        self.assertEqual(1, progress[-1]['restored'])
+        self.assertEqual([('HEAD', '/v1/AUTH_a/c/p/a?b#c%d', ''),
+                          ('PUT', '/v1/AUTH_a/c/p/a?b#c%d', 'data')],
+                         self.app.calls)
+        self.assertEqual(u'p/a?b#c%d',
+                         self.provider.shunt_object.mock_calls[0][1][1])
+
+    def test_restore_prefix_listing_error(self):
+        self.provider.list_objects.return_value = ProviderResponse(
+            False, 404, {}, [])
+        with self.assertRaises(RuntimeError):
+            next(restore.iter_restore_prefix(
+                self.provider, 'AUTH_a', 'c', '', self.app, self.logger))
+
+    def test_restore_missing_object(self):
+        self.provider.shunt_object.return_value = (
+            '200 OK', [('Content-Length', '4'), ('etag', 'etag')],
+            StringIO.StringIO('data'))
+        self.assertEqual('restored', restore.restore_missing_object(
+            self.provider, u'o', '/v1/AUTH_a/c/o', self.app, self.logger))
+        self.assertEqual([('HEAD', '/v1/AUTH_a/c/o', ''),
+                          ('PUT', '/v1/AUTH_a/c/o', 'data')], self.app.calls)
+
+        with mock.patch.object(swob.Request, 'get_response') as mock_resp:
+            mock_resp.return_value = swob.Response(status=200)
+            self.assertEqual('present', restore.restore_missing_object(
+                self.provider, u'o', '/v1/AUTH_a/c/o', self.app,
+                self.logger))
+
+
+class FakeObjectStore(object):
+    """Keeps the objects and lists the containers."""
+    def __init__(self):
+        self.objects = {}
+        self.containers = set()
+        self.calls = []
+
+    def __call__(self, env, start_response):
+        req = swob.Request(env)
+        self.calls.append((req.method, req.path_info))
+        version, account, container, obj = req.split_path(3, 4, True)
+        container_path = '/'.join(['', version, account, container])
+        if req.method == 'PUT' and not obj:
+            self.containers.add(req.path_info)
+            resp = swob.HTTPCreated()
+        elif req.method == 'PUT' and container_path not in self.containers:
+            resp = swob.HTTPNotFound()
+        elif req.method == 'PUT':
+            self.objects[req.path_info] = req.body
+            resp = swob.HTTPCreated()
+        elif req.method == 'GET' and not obj:
+            listing = [{'name': path[len(req.path_info) + 1:]}
+                       for path in sorted(self.objects)
+                       if path.startswith(req.path_info + '/')]
+            listing = [entry for entry in listing
+                       if entry['name'].startswith(req.params['prefix']) and
+                       entry['name'] > req.params['marker']][:2]
+            resp = swob.Response(body=json.dumps(listing))
+        elif req.method == 'DELETE' and req.path_info in self.objects:
+            del self.objects[req.path_info]
+            resp = swob.HTTPNoContent()
+        elif req.method == 'DELETE':
+            resp = swob.HTTPNotFound()
+        elif req.path_info in self.objects:
+            resp = swob.Response(body=self.objects[req.path_info],
+                                 conditional_response=True)
+        else:
+            resp = swob.HTTPNotFound()
+        return resp(env, start_response)
+
+
+class TestBlockRestore(unittest.TestCase):
+    def setUp(self):
+        self.data = '0123456789'
+        self.provider = mock.Mock()
+        self.provider.shunt_object.side_effect = self._shunt_object
+        self.logger = mock.Mock()
+        self.app = FakeObjectStore()
+        self.app.containers.add('/v1/AUTH_a/c')
+        self.info = '/v1/.cloud_sync_AUTH_a/c+blocks/%s' % (
+            hashlib.md5('/v1/AUTH_a/c/o').hexdigest())
+        self.blocks = self.info + '/etag/4'
+
+    def _shunt_object(self, req, obj):
+        resp = req.get_response(swob.Response(
+            body=self.data, conditional_response=True,
+            headers={'etag': 'etag', 'Content-Type': 'text/plain'}))
+        # The providers return the ETag as "etag"
+        return (resp.status, [(k.lower(), v) for k, v in resp.headers.items()],
+                resp.app_iter)
+
+    def _get_range(self, range_header):
+        block_restore = restore.BlockRestore(
+            self.provider, u'o', '/v1/AUTH_a/c/o', self.app, self.logger, 4)
+        status, headers, body = block_restore.get_range(range_header)
+        return status, dict(headers), ''.join(body)
+
+    @mock.patch('s3_sync.restore.eventlet.spawn_n')
+    def test_get_range(self, mock_spawn):
+        status, headers, body = self._get_range('bytes=3-5')
+        self.assertEqual('206 Partial Content', status)
+        self.assertEqual('345', body)
+        self.assertEqual('3', headers['Content-Length'])
+        self.assertEqual('bytes 3-5/10', headers['Content-Range'])
+        self.assertEqual('etag', headers['etag'])
+        # The blocks that the range spans are stored, along with the remote
+        # headers and the number of leading blocks that are present
+        info = json.loads(self.app.objects.pop(self.info))
+        self.assertEqual(2, info['restored_blocks'])
+        self.assertEqual(['etag', 'text/plain'], [
+            v for k, v in info['headers']
+            if k in ('etag', 'content-type')])
+        self.assertEqual({self.blocks + '/00000000': '0123',
+                          self.blocks + '/00000001': '4567'},
+                         self.app.objects)
+        self.app.objects[self.info] = json.dumps(info)
+        # The blocks are kept in the hidden account, out of the listings of
+        # the user's account
+        self.assertEqual(
+            set(['/v1/AUTH_a/c', '/v1/.cloud_sync_AUTH_a/c+blocks']),
+            self.app.containers)
+
+        # The stored blocks are served locally, without remote requests
+        self.provider.shunt_object.reset_mock()
+        status, headers, body = self._get_range('bytes=1-7')
+        self.assertEqual('1234567', body)
+        self.assertEqual('bytes 1-7/10', headers['Content-Range'])
+        self.assertEqual('etag', headers['etag'])
+        self.assertFalse(self.provider.shunt_object.called)
+        self.assertFalse(mock_spawn.called)
+
+        self.provider.shunt_object.reset_mock()
+        self.app.calls = []
+        self.assertEqual('789', self._get_range('bytes=-3')[2])
+        self.assertEqual(
+            [('GET', 'bytes=8-9')],
+            [(call[1][0].method, call[1][0].headers.get('Range'))
+             for call in self.provider.shunt_object.mock_calls])
+        # Only the blocks past the stored count are checked, without listing
+        # the blocks
+        self.assertEqual([
+            ('GET', self.info),
+            ('GET', self.blocks + '/00000001'),
+            ('GET', self.blocks + '/00000002'),
+            ('PUT', self.blocks + '/00000002'),
+            ('HEAD', self.blocks + '/00000002'),
+            ('PUT', self.info)], self.app.calls)
+        # Once all of the blocks are present, the object is restored
+        restore_args = mock_spawn.call_args[0]
+        restore_args[0](*restore_args[1:])
+        self.assertEqual({'/v1/AUTH_a/c/o': self.data}, self.app.objects)
+
+    def test_unsupported_ranges(self):
+        block_restore = restore.BlockRestore(
+            self.provider, u'o', '/v1/AUTH_a/c/o', self.app, self.logger, 4)
+        for range_header in ('bytes=1-2,4-5', 'bytes=20-', 'invalid'):
+            self.assertIsNone(block_restore.get_range(range_header))
+
+        self.provider.shunt_object.side_effect = None
+        self.provider.shunt_object.return_value = ('404 Not Found', [], [''])
+        self.assertIsNone(block_restore.get_range('bytes=1-2'))
+        self.assertEqual({}, self.app.objects)
+
+    def test_remote_failure(self):
+        block_restore = restore.BlockRestore(
+            self.provider, u'o', '/v1/AUTH_a/c/o', self.app, self.logger, 4)
+        status, headers, body = block_restore.get_range('bytes=1-2')
+        self.assertIn(self.info, self.app.objects)
+        self.provider.shunt_object.side_effect = None
+        self.provider.shunt_object.return_value = (
+            '503 Service Unavailable', [], [''])
+        # The response is cut short
+        with self.assertRaises(RuntimeError):
+            ''.join(body)
+        self.logger.exception.assert_called_once_with(
+            'Failed to get the blocks of /v1/AUTH_a/c/o')
+        # The remote headers are fetched again on the next request
+        self.assertEqual({}, self.app.objects)
+
+
+class TestRestoreQueue(unittest.TestCase):
+    def setUp(self):
+        self.app = FakeApp()
+        self.logger = mock.Mock()
+        self.queue = restore.RestoreQueue(
+            self.app, self.logger, 2, queue_size=2)
+
+    @mock.patch('s3_sync.restore.eventlet.spawn')
+    def test_submit(self, mock_spawn):
+        profile = {'account': 'AUTH_a', 'container': 'c',
+                   'aws_bucket': 'bucket'}
+        self.assertTrue(self.queue.submit(profile, False, u'o', '/v1/a/c/o'))
+        self.assertEqual(2, mock_spawn.call_count)
+        # Pending restores are not queued again
+        self.assertTrue(self.queue.submit(profile, False, u'o', '/v1/a/c/o'))
+        self.assertTrue(self.queue.submit(profile, False, u'p', '/v1/a/c/p'))
+        self.assertFalse(self.queue.submit(profile, False, u'q', '/v1/a/c/q'))
+        self.logger.increment.assert_called_once_with(
+            'restore.AUTH_a.bucket.dropped')
+        self.assertEqual(2, self.queue.queue.qsize())
+        self.assertEqual(set(['/v1/a/c/o', '/v1/a/c/p']), self.queue.pending)
+        self.assertEqual(2, mock_spawn.call_count)
+
+    @mock.patch('s3_sync.restore.restore_object')
+    @mock.patch('s3_sync.restore.create_provider')
+    def test_restore(self, mock_create_provider, mock_restore_object):
+        profile = {'account': 'AUTH_a', 'container': 'c',
+                   'aws_bucket': 'bucket'}
+        self.queue.pending.add('/v1/a/c/o')
+        self.queue._restore(profile, True, u'o', '/v1/a/c/o', 'trans-id')
+        mock_create_provider.assert_called_once_with(
+            profile, max_conns=1, per_account=True)
+        mock_restore_object.assert_called_once_with(
+            mock_create_provider.return_value, u'o', '/v1/a/c/o', self.app,
+            self.logger, 'trans-id')
+        self.assertEqual(set(), self.queue.pending)
+        self.logger.increment.assert_called_once_with(
+            'restore.AUTH_a.bucket.restored')
+        self.logger.timing_since.assert_called_once_with(
+            'restore.AUTH_a.bucket.restored.timing', mock.ANY)
+
+        # Objects that are already present are not restored again
+        mock_restore_object.reset_mock()
+        with mock.patch.object(swob.Request, 'get_response') as mock_resp:
+            mock_resp.return_value = swob.Response(status=200)
+            self.queue._restore(profile, True, u'o', '/v1/a/c/o', '')
+        self.assertFalse(mock_restore_object.called)
+
+        mock_restore_object.side_effect = RuntimeError('oops')
+        self.queue._restore(profile, True, u'o', '/v1/a/c/o', '')
+        self.logger.exception.assert_called_once_with(
+            'Failed to restore /v1/a/c/o')
+        self.assertEqual(
+            [mock.call('restore.AUTH_a.bucket.restored'),
+             mock.call('restore.AUTH_a.bucket.present'),
+             mock.call('restore.AUTH_a.bucket.failed')],
+            self.logger.increment.mock_calls)
@@ -14,6 +14,7 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import eventlet
 import json
 import logging
 import lxml
@@ -65,6 +66,26 @@ class FakeSwift(object):
         return body
 
 
+class FakeMemcache(object):
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        value = self.store.get(key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value, time=0):
+        self.store[key] = json.dumps(value)
+
+    def incr(self, key, delta=1, time=0):
+        value = self.get(key) or 0
+        self.set(key, value + delta)
+        return value + delta
+
+    def delete(self, key):
+        self.store.pop(key, None)
+
+
 class TestShunt(unittest.TestCase):
     def setUp(self):
         self.logger = logging.getLogger()
@@ -444,6 +465,10 @@ class TestShunt(unittest.TestCase):
     def test_object_shunt(self, mock_s3_manifest, mock_swift_manifest):
 
         self.app.shunted_app.logger = self.logger
+        for method in ('increment', 'timing_since', 'update_stats'):
+            patcher = mock.patch.object(self.logger, method, create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
 
         def _test_no_shunt(path, status):
             req = swob.Request.blank(path, environ={
@@ -604,6 +629,328 @@ class TestShunt(unittest.TestCase):
             mock_call.reset_mock()
             self.swift.calls = []
 
+    @mock.patch('s3_sync.restore.RestoreQueue.submit')
+    @mock.patch.object(sync_s3.SyncS3, 'get_manifest')
+    def test_background_restore(self, mock_get_manifest, mock_submit):
+        with tempfile.NamedTemporaryFile() as fp:
+            json.dump(self.conf, fp)
+            fp.flush()
+            app = shunt.filter_factory(
+                {'conf_file': fp.name, 'restore_workers': '4'})(self.swift)
+        self.assertEqual(4, app.shunted_app.restore_queue.worker_count)
+
+        env = {'__test__.response_dict': {'GET': {'status': '404 Not Found'}},
+               'swift.trans_id': 'trans-id'}
+        req = swob.Request.blank('/v1/AUTH_tee/tee/foo', environ=env)
+        status, headers, body_iter = req.call_application(app)
+        self.assertEqual('200 OK', status)
+        self.assertEqual('remote s3', ''.join(body_iter))
+        # The client is served from the remote store and the restore is queued
+        self.assertEqual(
+            [('HEAD', '/v1/AUTH_tee'), ('GET', '/v1/AUTH_tee/tee/foo')],
+            [(e['REQUEST_METHOD'], e['PATH_INFO']) for e in self.swift.calls])
+        self.assertFalse(mock_get_manifest.called)
+        profile = mock_submit.call_args[0][0]
+        self.assertEqual('tee', profile['container'])
+        mock_submit.assert_called_once_with(
+            profile, False, u'foo', '/v1/AUTH_tee/tee/foo', 'trans-id')
+
+        # The path of the restore is quoted, as it is parsed as a URL
+        mock_submit.reset_mock()
+        req = swob.Request.blank('/v1/AUTH_tee/tee/%E2%98%83%3F%2523%25',
+                                 environ=env)
+        status, headers, body_iter = req.call_application(app)
+        self.assertEqual('200 OK', status)
+        mock_submit.assert_called_once_with(
+            profile, False, u'\u2603?%23%',
+            '/v1/AUTH_tee/tee/%E2%98%83%3F%2523%25', 'trans-id')
+        self.assertEqual(
+            '/v1/AUTH_tee/tee/\xe2\x98\x83?%23%',
+            swob.Request.blank(mock_submit.call_args[0][3]).path_info)
+
+        # Incomplete responses are not restored
+        mock_submit.reset_mock()
+        req = swob.Request.blank('/v1/AUTH_tee/tee/foo', environ=env,
+                                 headers={'Range': 'bytes=1-2'})
+        req.call_application(app)
+        self.mock_shunt_s3.return_value = ('404 Not Found', [], [''])
+        req = swob.Request.blank('/v1/AUTH_tee/tee/foo', environ=env)
+        req.call_application(app)
+        self.assertFalse(mock_submit.called)
+
+    @mock.patch('s3_sync.shunt.iter_restore_prefix')
+    @mock.patch('s3_sync.shunt.create_provider')
+    def test_prefix_restore(self, mock_create_provider, mock_restore):
+        progress = [
+            {'scanned': 10, 'restored': 5, 'present': 5, 'failed': 0,
+             'finished': False},
+            {'scanned': 12, 'restored': 7, 'present': 5, 'failed': 0,
+             'finished': True}]
+        mock_restore.return_value = iter(progress)
+        req = swob.Request.blank(
+            '/v1/AUTH_a/s3?restore&prefix=p/&workers=50', method='POST')
+        status, headers, body_iter = req.call_application(self.app)
+        self.assertEqual('200 OK', status)
+        self.assertEqual(progress,
+                         [json.loads(line) for line in body_iter])
+        # The number of workers is capped
+        mock_create_provider.assert_called_once_with(
+            mock.ANY, max_conns=10, per_account=False)
+        mock_restore.assert_called_once_with(
+            mock_create_provider.return_value, 'AUTH_a', 's3', 'p/',
+            self.swift, mock.ANY, 10)
+        # The request does not reach Swift
+        self.assertEqual(['HEAD'],
+                         [e['REQUEST_METHOD'] for e in self.swift.calls])
+
+        req = swob.Request.blank(
+            '/v1/AUTH_a/s3?restore&workers=0', method='POST')
+        self.assertEqual(400, req.get_response(self.app).status_int)
+
+        mock_restore.return_value = mock.Mock(
+            next=mock.Mock(side_effect=RuntimeError('Failed to list')))
+        req = swob.Request.blank('/v1/AUTH_a/s3?restore', method='POST')
+        self.assertEqual(502, req.get_response(self.app).status_int)
+
+        # The user must be allowed to POST to the container
+        mock_restore.reset_mock()
+        req = swob.Request.blank(
+            '/v1/AUTH_a/s3?restore', method='POST',
+            environ={'swift.authorize': lambda req: swob.HTTPForbidden()})
+        self.assertEqual(403, req.get_response(self.app).status_int)
+        self.assertFalse(mock_restore.called)
+
+    @mock.patch.object(sync_s3.SyncS3, 'presign_object')
+    @mock.patch.object(sync_s3.SyncS3, 'head_object')
+    def test_redirect_large_objects(self, mock_head, mock_presign):
+        self.conf['containers'][1].update(
+            redirect_threshold=100, redirect_expires=60)
+        # Restored objects are never redirected
+        self.conf['containers'][4]['redirect_threshold'] = 100
+        with tempfile.NamedTemporaryFile() as fp:
+            json.dump(self.conf, fp)
+            fp.flush()
+            app = shunt.filter_factory({'conf_file': fp.name})(self.swift)
+        mock_head.return_value = ProviderResponse(
+            True, 200, {'Content-Length': '100'}, [''])
+        mock_presign.return_value = 'https://s3.example.com/presigned'
+
+        def _get(path, method='GET', headers=None):
+            req = swob.Request.blank(
+                path, method=method, headers=headers,
+                environ={'__test__.status': '404 Not Found',
+                         '__test__.headers': [('X-Trans-Id', 'local')]})
+            status, headers, body_iter = req.call_application(app)
+            return status, headers, ''.join(body_iter)
+
+        self.assertEqual(
+            ('307 Temporary Redirect',
+             [('Location', 'https://s3.example.com/presigned'),
+              ('Content-Length', '0'), ('X-Trans-Id', 'local')], ''),
+            _get('/v1/AUTH_a/s3/o'))
+        mock_head.assert_called_once_with('o')
+        mock_presign.assert_called_once_with('o', 60)
+        self.assertFalse(self.mock_shunt_s3.called)
+
+        # Small objects, HEADs, and restored objects are proxied
+        self.assertEqual('200 OK', _get('/v1/AUTH_a/s3/o', 'HEAD')[0])
+        self.assertEqual('200 OK', _get('/v1/AUTH_tee/tee/o', 'GET', {
+            'Range': 'bytes=0-10'})[0])
+        self.assertEqual(1, mock_head.call_count)
+        mock_head.return_value.headers['Content-Length'] = '99'
+        self.assertEqual(('200 OK', 'remote s3'),
+                         _get('/v1/AUTH_a/s3/o')[::2])
+        self.assertEqual(1, mock_presign.call_count)
+
+        # On errors, the object is proxied as well
+        mock_head.return_value.headers['Content-Length'] = '1000'
+        mock_presign.side_effect = RuntimeError('oops')
+        self.assertEqual('200 OK', _get('/v1/AUTH_a/s3/o')[0])
+        mock_head.return_value = ProviderResponse(False, 404, {}, [''])
+        self.assertEqual('200 OK', _get('/v1/AUTH_a/s3/o')[0])
+        self.assertEqual(2, mock_presign.call_count)
+
+    @mock.patch.object(sync_s3.SyncS3, 'get_manifest')
+    def test_metrics(self, mock_get_manifest):
+        logger = self.app.shunted_app.logger
+        patchers = [
+            mock.patch.object(logger, method)
+            for method in ('increment', 'timing_since', 'update_stats')]
+        mock_increment, mock_timing, mock_update = [
+            patcher.start() for patcher in patchers]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+
+        def _request(path, status, method='GET', body=None):
+            req = swob.Request.blank(path, method=method, environ={
+                '__test__.status': status,
+                '__test__.body': body or ['pass']})
+            status, headers, body_iter = req.call_application(self.app)
+            return ''.join(body_iter)
+
+        _request('/v1/AUTH_a/s3/o', '200 OK')
+        self.assertEqual('remote s3', _request('/v1/AUTH_a/s3/o',
+                                               '404 Not Found'))
+        _request('/v1/AUTH_a/s3/o', '404 Not Found', 'HEAD')
+        self.assertEqual(
+            [mock.call('object.GET.AUTH_a.dest-bucket.local'),
+             mock.call('object.GET.AUTH_a.dest-bucket.remote_200'),
+             mock.call('object.HEAD.AUTH_a.dest-bucket.remote_200')],
+            mock_increment.mock_calls)
+        self.assertEqual(
+            ['object.GET.AUTH_a.dest-bucket.local.timing',
+             'object.GET.AUTH_a.dest-bucket.remote_200.timing',
+             'object.HEAD.AUTH_a.dest-bucket.remote_200.timing'],
+            [call[1][0] for call in mock_timing.mock_calls])
+        mock_update.assert_called_once_with(
+            'object.GET.AUTH_a.dest-bucket.bytes', len('remote s3'))
+
+        # Restores are counted once the response is streamed
+        mock_increment.reset_mock()
+        mock_update.reset_mock()
+        self.mock_shunt_s3.return_value = (
+            '200 OK', [('etag', 'deadbeef')], StringIO.StringIO('remote s3'))
+        _request('/v1/AUTH_tee/tee/o', '404 Not Found')
+        self.assertEqual(
+            [mock.call('object.GET.AUTH_tee.dest-bucket.remote_200'),
+             mock.call('restore.AUTH_tee.dest-bucket.restored')],
+            mock_increment.mock_calls)
+        self.assertEqual(
+            [mock.call('object.GET.AUTH_tee.dest-bucket.bytes', 9),
+             mock.call('restore.AUTH_tee.dest-bucket.bytes', 9)],
+            mock_update.mock_calls)
+
+        mock_increment.reset_mock()
+        self.mock_list_s3.return_value = ProviderResponse(
+            True, 200, {}, [])
+        _request('/v1/AUTH_a/s3', '200 OK', body=['[]'])
+        _request('/v1/AUTH_a/s3/o', '201 Created', 'PUT')
+        self.assertEqual(
+            [mock.call('container.GET.AUTH_a.dest-bucket.spliced')],
+            mock_increment.mock_calls)
+
+        # The dots in the labels do not add levels to the metric names
+        self.assertEqual(
+            'object.GET.AUTH_a.bucket_example_com.remote_404',
+            utils.get_metric_name('object.GET', {
+                'account': 'AUTH_a', 'aws_bucket': 'bucket.example.com'},
+                'remote_404'))
+
+    def test_access_tracking(self):
+        with tempfile.NamedTemporaryFile() as fp:
+            json.dump(self.conf, fp)
+            fp.flush()
+            app = shunt.filter_factory({
+                'conf_file': fp.name, 'access_sample_rate': '0.1',
+                'access_flush_interval': '30'})(self.swift)
+        tracker = app.shunted_app.access_tracker
+        self.assertEqual(0.1, tracker.sample_rate)
+        self.assertEqual(30, tracker.flush_interval)
+
+        with mock.patch.object(tracker, 'record') as mock_record:
+            for method, status in [('GET', '200 OK'), ('GET', '206 OK'),
+                                   ('HEAD', '200 OK'), ('GET', '304 OK'),
+                                   ('GET', '404 Not Found')]:
+                req = swob.Request.blank(
+                    '/v1/AUTH_a/s3/o', method=method,
+                    environ={'__test__.status': status})
+                req.call_application(app)
+        # Only the reads of local objects are recorded
+        self.assertEqual(
+            [mock.call(mock.ANY, 'v1', 'AUTH_a', 's3', 'o')] * 2,
+            mock_record.mock_calls)
+        self.assertEqual('s3', mock_record.call_args[0][0]['container'])
+
+    @mock.patch('s3_sync.shunt.BlockRestore')
+    def test_block_restore(self, mock_block_restore):
+        self.conf['containers'][4]['restore_block_size'] = 1024
+        with tempfile.NamedTemporaryFile() as fp:
+            json.dump(self.conf, fp)
+            fp.flush()
+            app = shunt.filter_factory({'conf_file': fp.name})(self.swift)
+        mock_block_restore.return_value.get_range.return_value = (
+            '206 Partial Content', [('Content-Range', 'bytes 1-2/10')],
+            ['23'])
+
+        def _get(headers):
+            req = swob.Request.blank(
+                '/v1/AUTH_tee/tee/o%3Fp', headers=headers,
+                environ={'__test__.status': '404 Not Found',
+                         'swift.trans_id': 'trans-id'})
+            status, headers, body_iter = req.call_application(app)
+            return status, ''.join(body_iter)
+
+        self.assertEqual(('206 Partial Content', '23'),
+                         _get({'Range': 'bytes=1-2'}))
+        mock_block_restore.assert_called_once_with(
+            mock.ANY, u'o?p', '/v1/AUTH_tee/tee/o%3Fp', self.swift, mock.ANY,
+            1024, 'trans-id')
+        mock_block_restore.return_value.get_range.assert_called_once_with(
+            'bytes=1-2')
+        self.assertFalse(self.mock_shunt_s3.called)
+
+        # Unless the blocks can be used, the object is proxied
+        mock_block_restore.return_value.get_range.return_value = None
+        self.assertEqual(('200 OK', 'remote s3'),
+                         _get({'Range': 'bytes=1-2,4-5'}))
+        # Conditional GETs do not use the blocks
+        mock_block_restore.reset_mock()
+        _get({'Range': 'bytes=1-2', 'If-Match': 'deadbeef'})
+        self.assertFalse(mock_block_restore.called)
+
+    def test_hedged_requests(self):
+        self.conf['containers'][1]['archive_first'] = True
+        self.conf['containers'][2]['hedge_delay'] = 10
+        remote_started = []
+
+        def _slow_swift(env, start_response):
+            # The remote request is issued while the local one is in progress
+            if env['REQUEST_METHOD'] == 'GET':
+                eventlet.sleep(0.01)
+                remote_started.append(self.mock_shunt_s3.called)
+            # The local request does not affect the remote one
+            env['swift.source'] = 'local'
+            return self.swift(env, start_response)
+
+        with tempfile.NamedTemporaryFile() as fp:
+            json.dump(self.conf, fp)
+            fp.flush()
+            app = shunt.filter_factory({'conf_file': fp.name})(_slow_swift)
+        remote_body = mock.MagicMock()
+        remote_body.__iter__.return_value = iter(['remote s3'])
+        self.mock_shunt_s3.return_value = ('200 OK', [], remote_body)
+
+        def _get(path, status):
+            req = swob.Request.blank(path, environ={'__test__.status': status})
+            status, headers, body_iter = req.call_application(app)
+            return status, ''.join(body_iter)
+
+        self.assertEqual(('200 OK', 'remote s3'),
+                         _get('/v1/AUTH_a/s3/%E2%98%83%3F', '404 Not Found'))
+        self.assertEqual([True], remote_started)
+        self.assertEqual(1, self.mock_shunt_s3.call_count)
+        remote_req, remote_obj = self.mock_shunt_s3.call_args[0]
+        self.assertEqual('/v1/AUTH_a/s3/\xe2\x98\x83?', remote_req.path_info)
+        self.assertNotIn('swift.source', remote_req.environ)
+        self.assertEqual(u'\u2603?', remote_obj)
+        self.assertIsInstance(remote_obj, unicode)
+        remote_body.close.reset_mock()
+
+        # The local response takes precedence; the remote one is discarded
+        self.assertEqual(('200 OK', 'pass'),
+                         _get('/v1/AUTH_a/s3/o', '200 OK'))
+        self.assertEqual([True, True], remote_started)
+        remote_body.close.assert_called_once_with()
+
+        # The remote request is not issued if the local request completes
+        # before the delay
+        self.mock_shunt_s3.reset_mock()
+        self.assertEqual(('200 OK', 'pass'),
+                         _get('/v1/AUTH_a/s3prop/o', '200 OK'))
+        eventlet.sleep(0)
+        self.assertEqual([True, True, False], remote_started)
+        self.assertFalse(self.mock_shunt_s3.called)
+
     @mock.patch.object(sync_s3.SyncS3, 'get_manifest')
     @mock.patch.object(sync_s3.SyncS3, 'shunt_object')
     def test_missing_slo_manifest(
@@ -674,11 +1021,12 @@ class TestShunt(unittest.TestCase):
                      '__test__.body': '[]',
                      'swift.trans_id': 'id'})
         status, headers, body_iter = req.call_application(self.app)
+        body = ''.join(body_iter)
         self.assertEqual(self.mock_shunt_swift.mock_calls, [])
         self.mock_list_s3.assert_has_calls([
             mock.call('', 10000, '', ''),
-            mock.call('unicod\xc3\xa9', 10000, '', '')])
-        names = body_iter.split('\n')
+            mock.call('unicod\xc3\xa9', 9998, '', '')])
+        names = body.split('\n')
         self.assertEqual(['abc', u'unicod\xe9'.encode('utf-8')], names)
 
     def test_list_container_shunt_s3_xml(self):
@@ -703,11 +1051,12 @@ class TestShunt(unittest.TestCase):
                      '__test__.body': '[]',
                      'swift.trans_id': 'id'})
         status, headers, body_iter = req.call_application(self.app)
+        body = ''.join(body_iter)
         self.assertEqual(self.mock_shunt_swift.mock_calls, [])
         self.mock_list_s3.assert_has_calls([
             mock.call('', 10000, '', ''),
-            mock.call(u'unicod\xc3\xa9'.encode('utf-8'), 10000, '', '')])
-        root = lxml.etree.fromstring(body_iter)
+            mock.call(u'unicod\xc3\xa9'.encode('utf-8'), 9998, '', '')])
+        root = lxml.etree.fromstring(body)
         context = lxml.etree.iterwalk(root, events=("start", "end"))
         element_index = 0
         cur_elem_properties = {}
@@ -754,11 +1103,12 @@ class TestShunt(unittest.TestCase):
                      'swift.trans_id': 'id'},
             headers={'Accept': 'application/xml'})
         status, headers, body_iter = req.call_application(self.app)
+        body = ''.join(body_iter)
         self.assertEqual(self.mock_shunt_swift.mock_calls, [])
         self.mock_list_s3.assert_has_calls([
             mock.call('', 10000, '', ''),
-            mock.call(u'unicod\xc3\xa9'.encode('utf-8'), 10000, '', '')])
-        root = lxml.etree.fromstring(body_iter)
+            mock.call(u'unicod\xc3\xa9'.encode('utf-8'), 9998, '', '')])
+        root = lxml.etree.fromstring(body)
         context = lxml.etree.iterwalk(root, events=("start", "end"))
         element_index = 0
         cur_elem_properties = {}
@@ -804,11 +1154,12 @@ class TestShunt(unittest.TestCase):
                      '__test__.body': '[]',
                      'swift.trans_id': 'id'})
         status, headers, body_iter = req.call_application(self.app)
+        body = ''.join(body_iter)
         self.assertEqual(self.mock_shunt_swift.mock_calls, [])
         self.mock_list_s3.assert_has_calls([
             mock.call('', 10000, '', ''),
-            mock.call(u'unicod\xc3\xa9'.encode('utf-8'), 10000, '', '')])
-        results = json.loads(body_iter)
+            mock.call(u'unicod\xc3\xa9'.encode('utf-8'), 9998, '', '')])
+        results = json.loads(body)
         for i, entry in enumerate(results):
             for k in entry.keys():
                 if k == 'content_location':
@@ -840,11 +1191,12 @@ class TestShunt(unittest.TestCase):
                      'swift.trans_id': 'id'},
             headers={'Accept': 'application/json'})
         status, headers, body_iter = req.call_application(self.app)
+        body = ''.join(body_iter)
         self.assertEqual(self.mock_shunt_swift.mock_calls, [])
         self.mock_list_s3.assert_has_calls([
             mock.call('', 10000, '', ''),
-            mock.call(u'unicod\xc3\xa9'.encode('utf-8'), 10000, '', '')])
-        results = json.loads(body_iter)
+            mock.call(u'unicod\xc3\xa9'.encode('utf-8'), 9998, '', '')])
+        results = json.loads(body)
         for i, entry in enumerate(results):
             for k in elements[i].keys():
                 if k == 'content_location':
@@ -863,6 +1215,7 @@ class TestShunt(unittest.TestCase):
                      '__test__.body': '[]',
                      'swift.trans_id': 'id'})
         status, headers, body_iter = req.call_application(self.app)
+        self.assertEqual('', ''.join(body_iter))
         create_mock.assert_called_once_with({
             'account': 'AUTH_b',
             'container': 's3',
@@ -881,6 +1234,7 @@ class TestShunt(unittest.TestCase):
                      '__test__.body': '[]',
                      'swift.trans_id': 'id'})
         status, headers, body_iter = req.call_application(self.app)
+        self.assertEqual('', ''.join(body_iter))
         create_mock.assert_called_once_with({
             'account': 'AUTH_b',
             'container': 's4',
@@ -913,11 +1267,12 @@ class TestShunt(unittest.TestCase):
                      '__test__.body': '[]',
                      'swift.trans_id': 'id'})
         status, headers, body_iter = req.call_application(self.app)
+        body = ''.join(body_iter)
         self.assertEqual(self.mock_shunt_swift.mock_calls, [])
         self.mock_list_swift.assert_has_calls([
             mock.call('', 10000, '', ''),
-            mock.call(u'unicod\xe9'.encode('utf-8'), 10000, '', '')])
-        names = body_iter.split('\n')
+            mock.call(u'unicod\xe9'.encode('utf-8'), 9998, '', '')])
+        names = body.split('\n')
         self.assertEqual(['abc', u'unicod\xe9'.encode('utf-8')], names)
 
     def test_list_container_shunt_with_duplicates(self):
@@ -960,13 +1315,285 @@ class TestShunt(unittest.TestCase):
                      '__test__.body': json.dumps(local_data),
                      'swift.trans_id': 'id'})
         status, headers, body_iter = req.call_application(self.app)
+        body = ''.join(body_iter)
         self.assertEqual(self.mock_shunt_swift.mock_calls, [])
         self.mock_list_swift.assert_called_once_with('', 4, '', '/')
-        names = body_iter.split('\n')
+        names = body.split('\n')
         self.assertEqual(names, [
             'a', 'a/', u'unicod\xe9'.encode('utf-8'), 'z/',
         ])
 
+    def test_list_container_streaming(self):
+        def _entry(name):
+            return {'name': name, 'hash': 'ffff', 'bytes': 1,
+                    'last_modified': 'date', 'content_type': 'type',
+                    'content_location': 'http://some-swift'}
+
+        self.mock_list_swift.side_effect = [
+            ProviderResponse(True, 200, {}, [_entry('a'), _entry('c')]),
+            ProviderResponse(True, 200, {}, [_entry('d')])]
+        local_body = json.dumps([
+            {'name': name, 'hash': 'ffff', 'bytes': 1,
+             'last_modified': 'date', 'content_type': 'type'}
+            for name in ('b', 'e')])
+        # The local listing arrives in several chunks
+        local_chunks = [local_body[i:i + 10]
+                        for i in range(0, len(local_body), 10)]
+        req = swob.Request.blank(
+            '/v1/AUTH_a/sw\xc3\xa9ft?limit=4',
+            environ={'__test__.status': '200 OK',
+                     '__test__.headers': [
+                         ('Content-Length', str(len(local_body))),
+                         ('X-Container-Object-Count', '2')],
+                     '__test__.body': local_chunks,
+                     'swift.trans_id': 'id'})
+        status, headers, body_iter = req.call_application(self.app)
+        self.assertEqual('200 OK', status)
+        self.assertEqual([('X-Container-Object-Count', '2'),
+                          ('Content-Type', 'text/plain')],
+                         headers)
+        # The remote pages are only requested as the listing is streamed
+        self.assertFalse(self.mock_list_swift.called)
+        self.assertEqual(['a', 'b', 'c', 'd'], ''.join(body_iter).split('\n'))
+        # The next page only asks for the entries that are still missing
+        self.assertEqual([mock.call('', 4, '', ''), mock.call('c', 1, '', '')],
+                         self.mock_list_swift.mock_calls)
+
+    def test_list_container_malformed_local_listing(self):
+        req = swob.Request.blank(
+            '/v1/AUTH_a/sw\xc3\xa9ft',
+            environ={'__test__.status': '200 OK',
+                     '__test__.body': ['[{"name": "a"}, {"na'],
+                     'swift.trans_id': 'id'})
+        start_response = mock.Mock()
+        # The request fails before the response is started
+        with self.assertRaises(ValueError):
+            self.app(req.environ, start_response)
+        self.assertFalse(start_response.called)
+        self.assertFalse(self.mock_list_swift.called)
+
+    @mock.patch('s3_sync.shunt.create_provider')
+    def test_list_account_streaming(self, create_mock):
+        conf = {'migrations': [{
+            'account': 'AUTH_migrate',
+            'aws_bucket': '/*',
+            'aws_identity': 'migration',
+            'aws_secret': 'migration_key',
+            'protocol': 'swift'}]}
+        with tempfile.NamedTemporaryFile() as fp:
+            json.dump(conf, fp)
+            fp.flush()
+            app = shunt.filter_factory({'conf_file': fp.name})(self.swift)
+        create_mock.return_value.list_buckets.side_effect = [
+            ProviderResponse(True, 200, {}, [
+                {'name': 'a', 'count': 1, 'bytes': 10,
+                 'content_location': 'remote'}]),
+            ProviderResponse(True, 200, {}, [])]
+        local_body = json.dumps([{'name': 'b', 'count': 2, 'bytes': 20}])
+        req = swob.Request.blank(
+            '/v1/AUTH_migrate?format=json',
+            environ={'__test__.status': '200 OK',
+                     '__test__.headers': [
+                         ('Content-Length', str(len(local_body)))],
+                     '__test__.body': [local_body[:5], local_body[5:]],
+                     'swift.trans_id': 'id'})
+        status, headers, body_iter = req.call_application(app)
+        self.assertEqual([('Content-Type', 'application/json')], headers)
+        self.assertEqual(
+            [{'name': 'a', 'count': 1, 'bytes': 10,
+              'content_location': ['remote']},
+             {'name': 'b', 'count': 2, 'bytes': 20}],
+            json.loads(''.join(body_iter)))
+        self.assertEqual(
+            [mock.call('', 10000, '', False),
+             mock.call('a', 9999, '', False)],
+            create_mock.return_value.list_buckets.mock_calls)
+
+    def test_list_container_cache(self):
+        with tempfile.NamedTemporaryFile() as fp:
+            json.dump(self.conf, fp)
+            fp.flush()
+            app = shunt.filter_factory(
+                {'conf_file': fp.name, 'listing_cache_ttl': '60'})(self.swift)
+        memcache = FakeMemcache()
+
+        def _list_objects(marker, limit, prefix, delimiter):
+            entries = [{'name': 'a', 'hash': 'ffff', 'bytes': 1,
+                        'last_modified': 'date', 'content_type': 'type',
+                        'content_location': 'http://some-swift'}]
+            return ProviderResponse(True, 200, {}, [] if marker else entries)
+
+        self.mock_list_swift.side_effect = _list_objects
+
+        def _list(limit=None):
+            query = 'format=json'
+            if limit:
+                query += '&limit=%d' % limit
+            req = swob.Request.blank(
+                '/v1/AUTH_a/sw\xc3\xa9ft?' + query,
+                environ={'__test__.status': '200 OK',
+                         '__test__.body': ['[]'],
+                         'swift.cache': memcache,
+                         'swift.trans_id': 'id'})
+            status, headers, body_iter = req.call_application(app)
+            self.assertEqual('200 OK', status)
+            return json.loads(''.join(body_iter))
+
+        logger = app.shunted_app.logger
+        with mock.patch.object(logger, 'increment') as mock_increment:
+            listing = _list()
+            self.assertEqual(listing, _list())
+            self.assertEqual(['a'], [entry['name'] for entry in listing])
+            self.assertEqual(['http://some-swift'],
+                             listing[0]['content_location'])
+            # Both pages of the listing are served from the cache
+            self.assertEqual(2, self.mock_list_swift.call_count)
+            self.assertEqual(
+                [mock.call('', 1000, '', ''), mock.call('a', 1000, '', '')],
+                self.mock_list_swift.mock_calls)
+            # Including for the listings with a similar limit
+            self.assertEqual(listing, _list(limit=500))
+            self.assertEqual(2, self.mock_list_swift.call_count)
+            # The pages of much smaller listings are cached separately
+            self.assertEqual(listing, _list(limit=1))
+            self.assertEqual(3, self.mock_list_swift.call_count)
+            self.mock_list_swift.assert_called_with('', 10, '', '')
+            self.assertEqual([mock.call('listing_cache.miss')] * 2 +
+                             [mock.call('listing_cache.hit')] * 4 +
+                             [mock.call('listing_cache.miss')],
+                             [call for call in mock_increment.mock_calls
+                              if call[1][0].startswith('listing_cache.')])
+
+            # Writes through the shunt invalidate the cached pages
+            req = swob.Request.blank(
+                '/v1/AUTH_a/sw\xc3\xa9ft/a', method='POST',
+                environ={'swift.cache': memcache})
+            req.get_response(app)
+            self.assertEqual(listing, _list())
+            self.assertEqual(5, self.mock_list_swift.call_count)
+            self.assertEqual(
+                [mock.call('listing_cache.miss')] * 2,
+                [call for call in mock_increment.mock_calls
+                 if call[1][0].startswith('listing_cache.')][-2:])
+
+        # Nothing is cached without a TTL
+        for _ in range(2):
+            req = swob.Request.blank(
+                '/v1/AUTH_a/sw\xc3\xa9ft',
+                environ={'__test__.status': '200 OK',
+                         '__test__.body': ['[]'],
+                         'swift.cache': memcache,
+                         'swift.trans_id': 'id'})
+            ''.join(req.call_application(self.app)[2])
+        self.assertEqual(9, self.mock_list_swift.call_count)
+
+    @mock.patch('s3_sync.sync_swift.SyncSwift.get_manifest')
+    def test_object_cache(self, mock_get_manifest):
+        with tempfile.NamedTemporaryFile() as fp:
+            json.dump(self.conf, fp)
+            fp.flush()
+            app = shunt.filter_factory(
+                {'conf_file': fp.name, 'object_cache_ttl': '10',
+                 'negative_cache_ttl': '5'})(self.swift)
+        memcache = FakeMemcache()
+        mock_get_manifest.return_value = None
+
+        def _request(path, method, headers=None, status='404 Not Found'):
+            req = swob.Request.blank(
+                path, method=method, headers=headers,
+                environ={'__test__.status': status,
+                         '__test__.headers': [('X-Trans-Id', 'local')],
+                         'swift.cache': memcache})
+            status, headers, body_iter = req.call_application(app)
+            return status, headers, ''.join(body_iter)
+
+        # Remote HEAD results are cached for unconditional HEADs
+        status, headers, _ = _request('/v1/AUTH_a/sw\xc3\xa9ft/o', 'HEAD')
+        self.assertEqual('200 OK', status)
+        self.assertEqual(1, self.mock_shunt_swift.call_count)
+        self.assertEqual((status, headers, ''),
+                         _request('/v1/AUTH_a/sw\xc3\xa9ft/o', 'HEAD'))
+        self.assertEqual(1, self.mock_shunt_swift.call_count)
+        _request('/v1/AUTH_a/sw\xc3\xa9ft/o', 'HEAD', {'If-Match': 'etag'})
+        self.assertEqual(2, self.mock_shunt_swift.call_count)
+        _request('/v1/AUTH_a/sw\xc3\xa9ft/o', 'GET')
+        self.assertEqual(3, self.mock_shunt_swift.call_count)
+        # The requests for the manifests or symlinks themselves are not
+        # answered from the cache, nor cached
+        for query in ('multipart-manifest=get', 'symlink=get'):
+            _request('/v1/AUTH_a/sw\xc3\xa9ft/o?' + query, 'HEAD')
+        self.assertEqual(5, self.mock_shunt_swift.call_count)
+        found = self.mock_shunt_swift.return_value
+        self.mock_shunt_swift.return_value = (
+            '404 Not Found', [('Content-Length', '0')], [''])
+        _request('/v1/AUTH_a/sw\xc3\xa9ft/o?symlink=get', 'HEAD')
+        self.assertEqual(6, self.mock_shunt_swift.call_count)
+        self.mock_shunt_swift.return_value = found
+        self.assertEqual('200 OK', _request(
+            '/v1/AUTH_a/sw\xc3\xa9ft/o', 'HEAD')[0])
+        self.assertEqual(6, self.mock_shunt_swift.call_count)
+
+        # Failed writes do not invalidate the cached entry
+        _request('/v1/AUTH_a/sw\xc3\xa9ft/o', 'PUT', status='503 Unavailable')
+        _request('/v1/AUTH_a/sw\xc3\xa9ft/o', 'HEAD')
+        self.assertEqual(6, self.mock_shunt_swift.call_count)
+        # Successful writes through the shunt invalidate the cached entry
+        _request('/v1/AUTH_a/sw\xc3\xa9ft/o', 'PUT', status='201 Created')
+        _request('/v1/AUTH_a/sw\xc3\xa9ft/o', 'HEAD')
+        self.assertEqual(7, self.mock_shunt_swift.call_count)
+
+        # Remote 404s are cached for all requests
+        self.mock_shunt_swift.return_value = (
+            '404 Not Found', [('Content-Length', '0')], [''])
+        self.assertEqual(
+            ('404 Not Found',
+             [('Content-Length', '0'), ('X-Trans-Id', 'local')], ''),
+            _request('/v1/AUTH_a/sw\xc3\xa9ft/missing', 'GET'))
+        self.assertEqual(2, mock_get_manifest.call_count)
+        self.assertEqual(8, self.mock_shunt_swift.call_count)
+        for method in ('GET', 'HEAD'):
+            self.assertEqual(
+                ('404 Not Found', [('X-Trans-Id', 'local')], 'pass'),
+                _request('/v1/AUTH_a/sw\xc3\xa9ft/missing', method))
+        self.assertEqual(2, mock_get_manifest.call_count)
+        self.assertEqual(8, self.mock_shunt_swift.call_count)
+
+    def test_object_cache_concurrent_write(self):
+        with tempfile.NamedTemporaryFile() as fp:
+            json.dump(self.conf, fp)
+            fp.flush()
+            app = shunt.filter_factory(
+                {'conf_file': fp.name, 'object_cache_ttl': '10'})(self.swift)
+        memcache = FakeMemcache()
+
+        def _head():
+            req = swob.Request.blank(
+                '/v1/AUTH_a/sw\xc3\xa9ft/o', method='HEAD',
+                environ={'__test__.status': '404 Not Found',
+                         'swift.cache': memcache})
+            return req.get_response(app).status_int
+
+        # A read is handled while the write is in progress, and is answered
+        # with the old remote metadata.
+        def _racing_app(env, start_response):
+            if env['REQUEST_METHOD'] == 'PUT':
+                self.assertEqual(200, _head())
+            return self.swift(env, start_response)
+
+        app.shunted_app.app = _racing_app
+        self.assertEqual(200, _head())
+        self.assertEqual(1, self.mock_shunt_swift.call_count)
+        req = swob.Request.blank(
+            '/v1/AUTH_a/sw\xc3\xa9ft/o', method='PUT',
+            environ={'__test__.status': '201 Created',
+                     'swift.cache': memcache})
+        self.assertEqual(201, req.get_response(app).status_int)
+        self.assertEqual(1, self.mock_shunt_swift.call_count)
+
+        # The entry is invalidated once the write succeeds
+        self.assertEqual(200, _head())
+        self.assertEqual(2, self.mock_shunt_swift.call_count)
+
     def test_shunt_migration_put_object_missing_container(self):
         responses = {'PUT': {
             '/v1/AUTH_migrate/destination/object': [
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from s3_sync import stats
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = stats.Metrics('test')
+
+    def test_prometheus_format(self):
+        self.metrics.increment('rows', container='foo', result='uploaded')
+        self.metrics.increment('rows', 2, container='foo', result='uploaded')
+        self.metrics.increment('rows', container='b"ar', result='error')
+        self.metrics.set_gauge('backlog_rows', 10, container='foo')
+        self.metrics.observe('op_seconds', 0.02, op='remote_put')
+        self.metrics.observe('op_seconds', 400, op='remote_put')
+
+        lines = self.metrics.format_prometheus().splitlines()
+        self.assertEqual([
+            'test_rows_total{container="b\\"ar",result="error"} 1',
+            'test_rows_total{container="foo",result="uploaded"} 3',
+            'test_backlog_rows{container="foo"} 10',
+        ], lines[:3])
+        buckets = lines[3:-2]
+        self.assertEqual(len(stats.LATENCY_BUCKETS) + 1, len(buckets))
+        self.assertEqual(
+            'test_op_seconds_bucket{op="remote_put",le="0.01"} 0',
+            buckets[1])
+        self.assertEqual(
+            'test_op_seconds_bucket{op="remote_put",le="0.025"} 1',
+            buckets[2])
+        self.assertEqual(
+            'test_op_seconds_bucket{op="remote_put",le="300.0"} 1',
+            buckets[-2])
+        self.assertEqual(
+            'test_op_seconds_bucket{op="remote_put",le="+Inf"} 2',
+            buckets[-1])
+        self.assertEqual(['test_op_seconds_count{op="remote_put"} 2',
+                          'test_op_seconds_sum{op="remote_put"} 400.020000'],
+                         lines[-2:])
+
+    def test_timer(self):
+        with self.metrics.timer('remote_head'):
+            pass
+
+        def _is_expected(error):
+            return 'missing' in str(error)
+
+        for message in ('missing', 'failed'):
+            with self.assertRaises(RuntimeError):
+                with self.metrics.timer('remote_head', _is_expected):
+                    raise RuntimeError(message)
+
+        self.assertEqual(3, self.metrics.histograms[
+            ('op_seconds', (('op', 'remote_head'),))][-2])
+        self.assertEqual({('op_errors', (('op', 'remote_head'),)): 1},
+                         self.metrics.counters)
+
+    @mock.patch('s3_sync.stats.StatsdClient')
+    def test_statsd(self, mock_statsd):
+        self.metrics.configure({'log_statsd_host': 'localhost',
+                                'log_statsd_metric_prefix': 'node1'})
+        mock_statsd.assert_called_once_with(
+            'localhost', 8125, base_prefix='node1', tail_prefix='test',
+            default_sample_rate=1.0)
+        self.metrics.increment('rows', container='c.1', result='uploaded')
+        self.metrics.observe('op_seconds', 0.5, op='remote_put')
+        self.metrics.set_gauge('backlog_rows', 1, container='c.1')
+        self.assertEqual([
+            mock.call.update_stats('rows.c_1.uploaded', 1),
+            mock.call.timing('op_seconds.remote_put', 500.0),
+            mock.call._send('backlog_rows.c_1', 1, 'g', 1),
+        ], mock_statsd.return_value.mock_calls)
+
+    @mock.patch('swift.common.utils.StatsdClient._open_socket')
+    def test_statsd_label_values(self, mock_socket):
+        self.metrics.configure({'log_statsd_host': 'localhost'})
+        for container in (u'\u062a:c', '\xd8\xaa:c'):
+            self.metrics.increment('rows', container=container,
+                                   result='a|b@c d')
+        self.assertEqual(
+            [mock.call('test.rows.\xd8\xaa_c.a_b_c_d:1|c',
+                       ('localhost', 8125))] * 2,
+            mock_socket.return_value.sendto.mock_calls)
+        self.assertEqual(
+            {('rows', (('container', '\xd8\xaa:c'),
+                       ('result', 'a|b@c d'))): 2},
+            self.metrics.counters)
+        self.assertEqual(
+            'test_rows_total{container="\xd8\xaa:c",result="a|b@c d"} 2\n',
+            self.metrics.format_prometheus())
+
+    @mock.patch('s3_sync.stats.StatsdClient')
+    def test_statsd_errors(self, mock_statsd):
+        self.metrics.configure({'log_statsd_host': 'localhost'})
+        mock_statsd.return_value.update_stats.side_effect = IOError('failed')
+        with mock.patch.object(self.metrics, 'logger') as mock_logger:
+            self.metrics.increment('rows', container='c')
+        mock_logger.exception.assert_called_once_with(
+            'Failed to send the rows metric to statsd')
+        self.assertEqual({('rows', (('container', 'c'),)): 1},
+                         self.metrics.counters)
+
+    def test_write(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(temp_dir))
+        metrics_file = os.path.join(temp_dir, 'metrics.prom')
+
+        # Nothing is written without a metrics file
+        self.metrics.maybe_write()
+        self.metrics.configure({'metrics_interval': 60}, metrics_file)
+        self.metrics.increment('rows', container=u'ت', result='error')
+        with mock.patch('time.time', return_value=1000):
+            self.metrics.maybe_write()
+        self.assertEqual([os.path.basename(metrics_file)],
+                         os.listdir(temp_dir))
+        with open(metrics_file) as f:
+            self.assertEqual(
+                'test_rows_total{container="\xd8\xaa",result="error"} 1\n',
+                f.read())
+
+        self.metrics.increment('rows', container=u'ت', result='error')
+        with mock.patch('time.time', return_value=1059):
+            self.metrics.maybe_write()
+        with open(metrics_file) as f:
+            self.assertIn('} 1\n', f.read())
+        with mock.patch('time.time', return_value=1060):
+            self.metrics.maybe_write()
+        with open(metrics_file) as f:
+            self.assertIn('} 2\n', f.read())
@@ -20,9 +20,13 @@ import time
 import unittest
 
 from container_crawler import RetryError
-from s3_sync.sync_container import SyncContainer
+from s3_sync import provider_factory
+from s3_sync.base_sync import ClientPoolRegistry, ProviderResponse
+from s3_sync.stats import Metrics
+from s3_sync.sync_container import SyncContainer, UploadLanes
 from s3_sync.sync_s3 import SyncS3
 from s3_sync.sync_swift import SyncSwift
+from swift.common.internal_client import UnexpectedResponse
 from swift.common.utils import decode_timestamps, Timestamp
 
 
@@ -61,6 +65,22 @@ class TestSyncContainer(unittest.TestCase):
 
     @mock.patch('s3_sync.sync_s3.boto3.session.Session')
     def setUp(self, mock_boto3):
+        # Do not share client pools between the tests
+        client_pools_patcher = mock.patch(
+            's3_sync.provider_factory.SHARED_CLIENT_POOLS',
+            ClientPoolRegistry())
+        client_pools_patcher.start()
+        self.addCleanup(client_pools_patcher.stop)
+        upload_lanes_patcher = mock.patch.object(
+            SyncContainer, 'SHARED_UPLOAD_LANES', {})
+        upload_lanes_patcher.start()
+        self.addCleanup(upload_lanes_patcher.stop)
+        self.metrics = Metrics('test')
+        metrics_patcher = mock.patch(
+            's3_sync.sync_container.SYNC_METRICS', self.metrics)
+        metrics_patcher.start()
+        self.addCleanup(metrics_patcher.stop)
+
         self.mock_boto3_session = mock.Mock()
         self.mock_boto3_client = mock.Mock()
 
@@ -308,6 +328,8 @@ class TestSyncContainer(unittest.TestCase):
                          dict(defaults.items() + [('protocol', 's3')])]
 
         for settings in test_settings:
+            # The first provider for a destination sets the pool size
+            provider_factory.SHARED_CLIENT_POOLS.pools.clear()
             sync = SyncContainer(self.scratch_space, settings, max_conns=1)
             self.assertIsInstance(sync.provider, SyncS3)
             self.assertEqual(sync.provider.settings, settings)
@@ -363,6 +385,130 @@ class TestSyncContainer(unittest.TestCase):
             sync.provider.upload_object.assert_called_once_with(
                 'foo', 99, None)
 
+    @mock.patch('s3_sync.sync_s3.boto3.session.Session')
+    def test_access_window(self, session_mock):
+        settings = {
+            'aws_bucket': self.aws_bucket,
+            'aws_identity': 'identity',
+            'aws_secret': 'credential',
+            'account': 'account',
+            'container': 'container',
+            'retain_local': False,
+            'access_window': 3600}
+        now = float(int(time.time()))
+        swift_client = mock.Mock()
+        swift_client.iter_objects.return_value = [
+            {'name': 'proxy1-10'}, {'name': 'proxy2-20'}]
+        swift_client.get_object.side_effect = [
+            (200, {}, [json.dumps({u'\u00e9': [3, now - 60],
+                                   'read': [1, now - 7200]})]),
+            (200, {}, [json.dumps({u'\u00e9': [1, now - 120],
+                                   'read': [1, now - 3000]})])]
+        sync = SyncContainer(self.scratch_space, settings)
+        sync.provider = mock.Mock()
+        sync.provider.upload_object.return_value = True
+
+        def _row(row_id, name):
+            return {'deleted': 0, 'ROWID': row_id, 'name': name,
+                    'created_at': Timestamp(now - 86400).internal,
+                    'storage_policy_index': 0}
+
+        # Objects read within the window are not archived until the window
+        # passes since the last read (from any proxy)
+        with mock.patch('s3_sync.sync_container.time.time', return_value=now):
+            for row_id, name in [(1, '\xc3\xa9'), (2, 'read')]:
+                with self.assertRaises(RetryError):
+                    sync.handle(_row(row_id, name), swift_client)
+            sync.handle(_row(3, 'cold'), swift_client)
+        self.assertEqual({1: now + 3540, 2: now + 600}, sync.deferred_rows)
+        swift_client.iter_objects.assert_called_once_with(
+            '.cloud_sync_account', 'container+access')
+        self.assertEqual(
+            [mock.call('.cloud_sync_account', 'container+access', name, {},
+                       acceptable_statuses=(2, 404))
+             for name in ('proxy1-10', 'proxy2-20')],
+            swift_client.get_object.mock_calls)
+        sync.provider.upload_object.assert_called_once_with(
+            'cold', 0, swift_client)
+        swift_client.delete_object.assert_called_once_with(
+            'account', 'container', 'cold', headers=mock.ANY)
+
+        # Containers that retain the local copies are not affected
+        swift_client.reset_mock()
+        sync = SyncContainer(self.scratch_space, dict(
+            settings, retain_local=True))
+        sync.provider = mock.Mock()
+        sync.handle(_row(4, 'read'), swift_client)
+        self.assertFalse(swift_client.iter_objects.called)
+
+    @mock.patch('__builtin__.open')
+    @mock.patch('s3_sync.sync_container.os.path.exists')
+    @mock.patch('s3_sync.sync_s3.boto3.session.Session')
+    def test_copy_after_schedule(self, session_mock, mock_exists, mock_open):
+        settings = {
+            'aws_bucket': self.aws_bucket,
+            'aws_identity': 'identity',
+            'aws_secret': 'credential',
+            'account': 'account',
+            'container': 'container',
+            'copy_after': 3600}
+        now = float(int(time.time()))
+        sync = SyncContainer(self.scratch_space, settings)
+        sync.provider = mock.Mock()
+        for row_id, created_at in [(3, now - 60), (4, now - 3660),
+                                   (5, now - 30)]:
+            row = {'deleted': 0, 'ROWID': row_id, 'name': 'obj%d' % row_id,
+                   'created_at': Timestamp(created_at).internal,
+                   'storage_policy_index': 0}
+            try:
+                sync.handle(row, None)
+            except RetryError:
+                pass
+        sync.provider.upload_object.assert_called_once_with('obj4', 0, None)
+        self.assertEqual({3: now + 3540, 5: now + 3570}, sync.deferred_rows)
+
+        # Deferred rows are skipped without any work until they are eligible
+        sync._handle_row = mock.Mock()
+        with mock.patch.object(sync, '_count_row') as count_mock:
+            with self.assertRaises(RetryError):
+                sync.handle({'deleted': 0, 'ROWID': 3}, None)
+            self.assertFalse(count_mock.called)
+        self.assertFalse(sync._handle_row.called)
+
+        fake_conf_file = self.MockMetaConf({})
+        mock_open.return_value = fake_conf_file
+        mock_exists.return_value = True
+        sync.save_last_row(2, 'db-id')
+        status = fake_conf_file.fake_status['db-id']
+        self.assertEqual(2, status['last_row'])
+        self.assertEqual([[now + 3540, 3], [now + 3570, 5]],
+                         status['deferred'])
+
+        # The schedule is restored with the last row
+        sync = SyncContainer(self.scratch_space, settings)
+        sync.provider = mock.Mock()
+        self.assertEqual(2, sync.get_last_row('db-id'))
+        self.assertEqual([3, 5], sorted(sync.deferred_rows.keys()))
+
+        with mock.patch('s3_sync.sync_container.time') as time_mock:
+            time_mock.time.return_value = now + 3600
+            sync.handle({'deleted': 0, 'ROWID': 5, 'name': 'obj5',
+                         'created_at': Timestamp(now - 30).internal,
+                         'storage_policy_index': 0}, None)
+        sync.provider.upload_object.assert_called_once_with('obj5', 0, None)
+        self.assertEqual([3], sync.deferred_rows.keys())
+
+        # Rows up to the saved row are dropped from the schedule
+        sync.save_last_row(5, 'db-id')
+        self.assertNotIn('deferred', fake_conf_file.fake_status['db-id'])
+
+    @mock.patch('s3_sync.sync_s3.boto3.session.Session')
+    def test_deferred_rows_limit(self, session_mock):
+        self.sync_container.MAX_DEFERRED_ROWS = 2
+        for row_id, eligible_at in [(1, 30), (2, 10), (3, 20)]:
+            self.sync_container._defer_row(row_id, eligible_at)
+        self.assertEqual({2: 10, 3: 20}, self.sync_container.deferred_rows)
+
     @mock.patch('s3_sync.sync_s3.boto3.session.Session')
     def test_retain_copy(self, session_mock):
         settings = {
@@ -403,7 +549,8 @@ class TestSyncContainer(unittest.TestCase):
 
         sync = SyncContainer(self.scratch_space, settings)
         sync.provider = mock.Mock()
-        row = {'deleted': 1, 'name': 'tombstone'}
+        row = {'deleted': 1, 'name': 'tombstone',
+               'created_at': str(time.time())}
         sync.handle(row, None)
 
         # Make sure we do nothing with this row
@@ -421,9 +568,395 @@ class TestSyncContainer(unittest.TestCase):
 
         sync = SyncContainer(self.scratch_space, settings)
         sync.provider = mock.Mock()
-        row = {'deleted': 1, 'name': 'tombstone'}
+        row = {'deleted': 1, 'name': 'tombstone',
+               'created_at': str(time.time())}
         sync.handle(row, None)
 
         # Make sure that we do not make any additional calls
         self.assertEqual([mock.call.delete_object(row['name'])],
                          sync.provider.mock_calls)
+
+    @mock.patch('s3_sync.sync_s3.boto3.session.Session')
+    def test_coalesce_rows(self, session_mock):
+        sync = SyncContainer(self.scratch_space, {
+            'aws_bucket': self.aws_bucket,
+            'aws_identity': 'identity',
+            'aws_secret': 'credential',
+            'account': 'account',
+            'container': 'container'})
+        sync.provider = mock.Mock()
+        swift_client = mock.Mock()
+        now = time.time()
+        versions = [Timestamp(now - 30 + i) for i in range(3)]
+
+        def make_row(ts, name='hot', deleted=0):
+            return {'deleted': deleted, 'name': name,
+                    'created_at': ts.internal, 'storage_policy_index': 0}
+
+        # The first row for an object is always uploaded
+        sync.handle(make_row(versions[0]), swift_client)
+        self.assertEqual(1, sync.provider.upload_object.call_count)
+        self.assertFalse(swift_client.get_object_metadata.called)
+
+        # The same version is not uploaded again
+        sync.handle(make_row(versions[0]), swift_client)
+        self.assertEqual(1, sync.provider.upload_object.call_count)
+        self.assertFalse(swift_client.get_object_metadata.called)
+
+        # A version that has been overwritten since is skipped
+        swift_client.get_object_metadata.return_value = {
+            'x-timestamp': versions[2].internal}
+        sync.handle(make_row(versions[1]), swift_client)
+        self.assertEqual(1, sync.provider.upload_object.call_count)
+        swift_client.get_object_metadata.assert_called_once_with(
+            'account', 'container', 'hot',
+            headers={'X-Backend-Storage-Policy-Index': 0, 'X-Newest': True})
+
+        # The newest version is uploaded
+        sync.handle(make_row(versions[2]), swift_client)
+        self.assertEqual(2, sync.provider.upload_object.call_count)
+
+        # A version that has since been removed is skipped, but the delete
+        # is propagated
+        swift_client.get_object_metadata.side_effect = UnexpectedResponse(
+            '404 Not Found', None)
+        sync.handle(make_row(Timestamp(now - 20)), swift_client)
+        self.assertEqual(2, sync.provider.upload_object.call_count)
+        sync.handle(make_row(Timestamp(now - 10), deleted=1), swift_client)
+        sync.provider.delete_object.assert_called_once_with('hot')
+        self.assertEqual(Timestamp(now - 10), sync.recent_keys['hot'])
+
+        # Objects that have not been seen are not checked
+        swift_client.reset_mock()
+        sync.handle(make_row(versions[0], name='cold'), swift_client)
+        self.assertEqual(3, sync.provider.upload_object.call_count)
+        self.assertFalse(swift_client.get_object_metadata.called)
+
+    def test_upload_lanes(self):
+        lanes = UploadLanes([{'name': 'large', 'workers': 1},
+                             {'name': 'small', 'max_size': 10},
+                             {'name': 'medium', 'max_size': 100}])
+        self.assertEqual(['small', 'medium', 'large'],
+                         [lane.name for lane in lanes.lanes])
+        self.assertEqual('small', lanes.get_lane(0).name)
+        self.assertEqual('small', lanes.get_lane(10).name)
+        self.assertEqual('medium', lanes.get_lane(11).name)
+        self.assertEqual('large', lanes.get_lane(101).name)
+        # Lanes without a limit always admit uploads
+        for _ in range(3):
+            self.assertTrue(lanes.get_lane(0).acquire())
+        self.assertTrue(lanes.get_lane(101).acquire())
+        self.assertFalse(lanes.get_lane(101).acquire())
+        lanes.get_lane(101).release()
+        self.assertTrue(lanes.get_lane(101).acquire())
+
+    @mock.patch('s3_sync.sync_s3.boto3.session.Session')
+    def test_full_upload_lane(self, session_mock):
+        settings = {
+            'aws_bucket': self.aws_bucket,
+            'aws_identity': 'identity',
+            'aws_secret': 'credential',
+            'account': 'account',
+            'container': 'container',
+            'upload_lanes': [{'name': 'small', 'max_size': 1024},
+                             {'name': 'large', 'workers': 1}]}
+        sync = SyncContainer(self.scratch_space, settings)
+        # Containers synced to the same destination share the lanes
+        other = SyncContainer(self.scratch_space, dict(
+            settings, container='other'))
+        self.assertIs(sync.upload_lanes, other.upload_lanes)
+        sync.provider = mock.Mock()
+
+        def make_row(name, size):
+            return {'deleted': 0, 'name': name, 'size': size,
+                    'created_at': str(time.time() - 5),
+                    'storage_policy_index': 0}
+
+        # A large upload is in progress
+        large_lane = sync.upload_lanes.get_lane(2048)
+        self.assertTrue(large_lane.acquire())
+        # The lane is checked before the object is HEADed to see whether
+        # the row was superseded
+        sync._remember_key('large', Timestamp(time.time() - 60))
+        swift_client = mock.Mock()
+        with self.assertRaises(RetryError):
+            sync.handle(make_row('large', 2048), swift_client)
+        self.assertFalse(sync.provider.upload_object.called)
+        self.assertFalse(swift_client.get_object_metadata.called)
+        sync.recent_keys.clear()
+
+        # Small objects are still uploaded
+        sync.handle(make_row('small', 10), None)
+        sync.provider.upload_object.assert_called_once_with('small', 0, None)
+
+        large_lane.release()
+        sync.handle(make_row('large', 2048), None)
+        sync.provider.upload_object.assert_called_with('large', 0, None)
+        # The lane is released after the upload
+        self.assertTrue(large_lane.acquire())
+
+    @mock.patch('s3_sync.sync_s3.boto3.session.Session')
+    def test_sync_metrics(self, session_mock):
+        sync = SyncContainer(self.scratch_space, {
+            'aws_bucket': self.aws_bucket,
+            'aws_identity': 'identity',
+            'aws_secret': 'credential',
+            'account': 'account',
+            'container': 'container',
+            'copy_after': 60})
+        sync.provider = mock.Mock()
+        now = time.time()
+
+        def make_row(row_id, age, deleted=0):
+            return {'ROWID': row_id, 'deleted': deleted,
+                    'name': 'obj%d' % row_id, 'size': 100,
+                    'created_at': Timestamp(now - age).internal,
+                    'storage_policy_index': 0}
+
+        sync.handle(make_row(1, 300), None)
+        sync.provider.upload_object.side_effect = RuntimeError('failed')
+        with self.assertRaises(RuntimeError):
+            sync.handle(make_row(2, 200), None)
+        sync.handle(make_row(3, 100, deleted=1), None)
+        with self.assertRaises(RetryError):
+            sync.handle(make_row(4, 10), None)
+
+        def _labels(**labels):
+            labels.update(account='account', container='container')
+            return tuple(sorted(labels.items()))
+
+        self.assertEqual({
+            ('rows', _labels(result='uploaded')): 1,
+            ('rows', _labels(result='error')): 1,
+            ('rows', _labels(result='deleted')): 1,
+            ('rows', _labels(result='retried')): 1,
+            ('bytes', _labels()): 100,
+        }, self.metrics.counters)
+
+        with mock.patch('time.time', return_value=now):
+            sync._update_lag_metrics(1)
+        self.assertEqual({
+            ('last_row', _labels()): 1,
+            ('backlog_rows', _labels()): 3,
+            ('oldest_unsynced_age_seconds', _labels()): 200,
+        }, dict((key, round(value)) for key, value
+                in self.metrics.gauges.items()))
+
+        # Rows that are synced later are no longer counted as behind
+        sync.provider.upload_object.side_effect = None
+        sync.handle(make_row(2, 200), None)
+        with mock.patch('time.time', return_value=now):
+            sync._update_lag_metrics(3)
+        self.assertEqual(10, round(self.metrics.gauges[
+            ('oldest_unsynced_age_seconds', _labels())]))
+        self.assertEqual(1, self.metrics.gauges[('backlog_rows', _labels())])
+
+    @mock.patch('swift.common.utils.StatsdClient._open_socket')
+    @mock.patch('s3_sync.sync_s3.boto3.session.Session')
+    def test_sync_metrics_statsd_non_ascii(self, session_mock, mock_socket):
+        self.metrics.configure({'log_statsd_host': 'localhost'})
+        sync = SyncContainer(self.scratch_space, {
+            'aws_bucket': self.aws_bucket,
+            'aws_identity': 'identity',
+            'aws_secret': 'credential',
+            'account': u'AUTH_\u062a',
+            'container': u'c\u062a.1'})
+        sync.provider = mock.Mock()
+        sync.handle({'ROWID': 1, 'deleted': 0, 'name': 'obj', 'size': 100,
+                     'created_at': Timestamp(time.time()).internal,
+                     'storage_policy_index': 0}, None)
+        sync.provider.upload_object.assert_called_once_with('obj', 0, None)
+        self.assertEqual(
+            [mock.call('test.rows.AUTH_\xd8\xaa.c\xd8\xaa_1.uploaded:1|c',
+                       ('localhost', 8125)),
+             mock.call('test.bytes.AUTH_\xd8\xaa.c\xd8\xaa_1:100|c',
+                       ('localhost', 8125))],
+            mock_socket.return_value.sendto.mock_calls)
+
+    @mock.patch('s3_sync.sync_container.os.mkdir')
+    @mock.patch('s3_sync.sync_container.os.path.exists')
+    @mock.patch('s3_sync.sync_container.open', create=True)
+    def test_bulk_seed(self, mock_open, mock_exists, mock_mkdir):
+        sync = SyncContainer(self.scratch_space, {
+            'aws_bucket': self.aws_bucket,
+            'aws_identity': 'identity',
+            'aws_secret': 'credential',
+            'account': 'account',
+            'container': 'container',
+            'bulk_seed': True})
+        sync.provider = mock.Mock()
+        swift_client = mock.Mock()
+        mock_exists.return_value = False
+        self.assertEqual(0, sync.get_last_row('db-id'))
+        self.assertTrue(sync.seed_pending)
+
+        now = time.time()
+        old = time.strftime('%Y-%m-%dT%H:%M:%S.000000',
+                            time.gmtime(now - 7200))
+        new = time.strftime('%Y-%m-%dT%H:%M:%S.000000', time.gmtime(now))
+        posted = time.strftime('%Y-%m-%dT%H:%M:%S.000000',
+                               time.gmtime(now - 5400))
+        swift_client.iter_objects.return_value = iter([
+            {'name': u'a', 'hash': 'etag', 'last_modified': old},
+            {'name': u'b', 'hash': 'etag', 'last_modified': old},
+            {'name': u'c', 'hash': 'etag', 'last_modified': old},
+            {'name': u'd', 'hash': 'etag', 'last_modified': new},
+            # The metadata was changed after the object was copied
+            {'name': u'e', 'hash': 'etag', 'last_modified': posted},
+            {'name': u'\u062a', 'hash': 'etag', 'last_modified': old}])
+        sync.provider.list_objects.side_effect = [
+            ProviderResponse(True, 200, {}, [
+                {'name': u'a', 'hash': 'etag', 'last_modified': old,
+                 'content_location': 'remote'},
+                {'name': u'b', 'hash': 'other', 'last_modified': old,
+                 'content_location': 'remote'},
+                {'name': u'e', 'hash': 'etag', 'last_modified': old,
+                 'content_location': 'remote'},
+                {'name': u'z', 'hash': 'etag', 'last_modified': old,
+                 'content_location': 'remote'},
+            ]),
+            ProviderResponse(True, 200, {}, [])]
+
+        def make_row(name, age, row_id):
+            return {'ROWID': row_id, 'deleted': 0, 'name': name,
+                    'created_at': Timestamp(now - age).internal,
+                    'storage_policy_index': 1}
+
+        status = self.MockMetaConf({})
+        mock_open.return_value = status
+        with mock.patch('time.time', return_value=now):
+            sync.handle(make_row('a', 7200, 1), swift_client)
+        self.assertFalse(sync.seed_pending)
+        self.assertEqual(now - 3600, sync.seed_point)
+        self.assertEqual(
+            [mock.call('b', 1, swift_client), mock.call('c', 1, swift_client),
+             mock.call('e', 1, swift_client),
+             mock.call('\xd8\xaa', 1, swift_client)],
+            sync.provider.upload_object.mock_calls)
+        swift_client.iter_objects.assert_called_once_with(
+            'account', 'container', marker='')
+        # The seed is recorded right away
+        self.assertEqual(
+            {'db-id': {'last_row': 0, 'aws_bucket': self.aws_bucket,
+                       'seed_point': now - 3600}},
+            status.fake_status)
+
+        # Rows older than the seed point are skipped and the newer ones are
+        # synced as usual
+        sync.provider.reset_mock()
+        sync.handle(make_row('b', 7200, 2), swift_client)
+        self.assertEqual([], sync.provider.mock_calls)
+        sync.handle(make_row('d', 60, 3), swift_client)
+        sync.provider.upload_object.assert_called_once_with(
+            'd', 1, swift_client)
+
+        # The seed point is loaded from the status
+        mock_exists.return_value = True
+        sync = SyncContainer(self.scratch_space, {
+            'aws_bucket': self.aws_bucket,
+            'aws_identity': 'identity',
+            'aws_secret': 'credential',
+            'account': 'account',
+            'container': 'container',
+            'bulk_seed': True})
+        self.assertEqual(0, sync.get_last_row('db-id'))
+        self.assertFalse(sync.seed_pending)
+        self.assertEqual(now - 3600, sync.seed_point)
+
+    @mock.patch('s3_sync.sync_container.SEED_PAGE_SIZE', 2)
+    @mock.patch('s3_sync.sync_container.os.mkdir')
+    @mock.patch('s3_sync.sync_container.os.path.exists')
+    @mock.patch('s3_sync.sync_container.open', create=True)
+    def test_bulk_seed_pages(self, mock_open, mock_exists, mock_mkdir):
+        settings = {
+            'aws_bucket': self.aws_bucket,
+            'aws_identity': 'identity',
+            'aws_secret': 'credential',
+            'account': 'account',
+            'container': 'container',
+            'bulk_seed': True}
+        sync = SyncContainer(self.scratch_space, settings)
+        sync.provider = mock.Mock()
+        sync.provider.list_objects.return_value = ProviderResponse(
+            True, 200, {}, [])
+        swift_client = mock.Mock()
+        mock_exists.return_value = False
+        self.assertEqual(0, sync.get_last_row('db-id'))
+
+        now = time.time()
+        old = time.strftime('%Y-%m-%dT%H:%M:%S.000000',
+                            time.gmtime(now - 7200))
+        names = [u'a', u'b', u'\u062a']
+
+        def iter_objects(account, container, marker=''):
+            return iter([{'name': name, 'hash': 'etag', 'last_modified': old}
+                         for name in names if name > marker.decode('utf-8')])
+
+        swift_client.iter_objects.side_effect = iter_objects
+        row = {'ROWID': 1, 'deleted': 0, 'name': 'a',
+               'created_at': Timestamp(now - 7200).internal,
+               'storage_policy_index': 1}
+        status = self.MockMetaConf({})
+        mock_open.return_value = status
+
+        # Every call compares a page of objects and records the progress
+        with mock.patch('time.time', return_value=now):
+            with self.assertRaises(RetryError):
+                sync.handle(row, swift_client)
+        self.assertEqual(
+            [mock.call('a', 1, swift_client), mock.call('b', 1, swift_client)],
+            sync.provider.upload_object.mock_calls)
+        self.assertTrue(sync.seed_pending)
+        self.assertIsNone(sync.seed_point)
+        self.assertEqual(
+            {'db-id': {'last_row': 0, 'aws_bucket': self.aws_bucket,
+                       'seed_progress': [now - 3600, u'b']}},
+            status.fake_status)
+
+        # The seed resumes from the recorded progress
+        mock_exists.return_value = True
+        sync = SyncContainer(self.scratch_space, settings)
+        sync.provider = mock.Mock()
+        sync.provider.list_objects.return_value = ProviderResponse(
+            True, 200, {}, [])
+        self.assertEqual(0, sync.get_last_row('db-id'))
+        self.assertTrue(sync.seed_pending)
+        self.assertEqual('seeded', sync._handle_row(row, swift_client))
+        self.assertEqual([mock.call('\xd8\xaa', 1, swift_client)],
+                         sync.provider.upload_object.mock_calls)
+        sync.provider.list_objects.assert_called_once_with(
+            'b', mock.ANY, '')
+        self.assertEqual(now - 3600, sync.seed_point)
+        self.assertFalse(sync.seed_pending)
+        self.assertNotIn('seed_progress', status.fake_status['db-id'])
+
+    def test_bulk_seed_failure(self):
+        sync = SyncContainer(self.scratch_space, {
+            'aws_bucket': self.aws_bucket,
+            'aws_identity': 'identity',
+            'aws_secret': 'credential',
+            'account': 'account',
+            'container': 'container',
+            'bulk_seed': True})
+        sync.provider = mock.Mock()
+        sync.provider.list_objects.return_value = ProviderResponse(
+            False, 500, {}, 'error')
+        sync.seed_pending = True
+        row = {'deleted': 0, 'name': 'foo', 'storage_policy_index': 0,
+               'created_at': Timestamp(time.time()).internal}
+        with self.assertRaises(RuntimeError):
+            sync.handle(row, mock.Mock())
+        self.assertTrue(sync.seed_pending)
+        self.assertIsNone(sync.seed_point)
+        self.assertFalse(sync.provider.upload_object.called)
+
+        # Only one of the workers seeds the container
+        sync._seeding = True
+        with self.assertRaises(RetryError):
+            sync.handle(row, mock.Mock())
+
+    def test_recent_keys_limit(self):
+        self.sync_container.MAX_RECENT_KEYS = 2
+        for name in ['a', 'b', 'a', 'c']:
+            self.sync_container._remember_key(name, Timestamp(1))
+        self.assertEqual(['a', 'c'], self.sync_container.recent_keys.keys())
@@ -25,6 +25,8 @@ import datetime
 import hashlib
 import json
 import mock
+from s3_sync import base_sync
+from s3_sync.stats import Metrics
 from s3_sync.sync_s3 import SyncS3
 from s3_sync import utils
 from swift.common import swob
@@ -282,7 +284,8 @@ class TestSyncS3(unittest.TestCase):
         mock_file_wrapper.assert_called_with(mock_ic,
                                              self.sync_s3.account,
                                              self.sync_s3.container,
-                                             key, swift_req_headers)
+                                             key, swift_req_headers,
+                                             limiters=[])
 
         self.mock_boto3_client.put_object.assert_called_with(
             Bucket=self.aws_bucket,
@@ -293,6 +296,34 @@ class TestSyncS3(unittest.TestCase):
             ServerSideEncryption='AES256',
             ContentType='test/blob')
 
+    @mock.patch('s3_sync.sync_s3.FileWrapper')
+    def test_upload_metrics(self, mock_file_wrapper):
+        metrics = Metrics('test')
+        wrapper = mock.Mock()
+        wrapper.__len__ = lambda s: 0
+        wrapper.get_s3_headers.return_value = {}
+        mock_file_wrapper.return_value = wrapper
+        self.mock_boto3_client.head_object.side_effect = ClientError(
+            {'Error': {'Code': 'NotFound'},
+             'ResponseMetadata': {'HTTPStatusCode': 404}}, 'HEAD')
+        self.mock_boto3_client.put_object.side_effect = ClientError(
+            {'Error': {'Code': 'InternalError'},
+             'ResponseMetadata': {'HTTPStatusCode': 500}}, 'PUT')
+        mock_ic = mock.Mock()
+        mock_ic.get_object_metadata.return_value = {
+            'content-type': 'test/blob'}
+
+        with mock.patch('s3_sync.base_sync.SYNC_METRICS', metrics), \
+                self.assertRaises(ClientError):
+            self.sync_s3.upload_object('key', 0, mock_ic)
+
+        self.assertEqual(
+            ['internal_get', 'internal_head', 'remote_head', 'remote_put'],
+            sorted(labels[0][1] for _, labels in metrics.histograms))
+        # The 404 for the HEAD is not an error
+        self.assertEqual({('op_errors', (('op', 'remote_put'),)): 1},
+                         metrics.counters)
+
     @mock.patch('s3_sync.sync_s3.FileWrapper')
     def test_upload_object_without_encryption(self, mock_file_wrapper):
         key = 'key'
@@ -320,7 +351,8 @@ class TestSyncS3(unittest.TestCase):
         mock_file_wrapper.assert_called_with(mock_ic,
                                              self.sync_s3.account,
                                              self.sync_s3.container,
-                                             key, swift_req_headers)
+                                             key, swift_req_headers,
+                                             limiters=[])
 
         self.mock_boto3_client.put_object.assert_called_with(
             Bucket=self.aws_bucket,
@@ -357,7 +389,8 @@ class TestSyncS3(unittest.TestCase):
         mock_file_wrapper.assert_called_with(mock_ic,
                                              self.sync_s3.account,
                                              self.sync_s3.container,
-                                             key, swift_req_headers)
+                                             key, swift_req_headers,
+                                             limiters=[])
 
         self.mock_boto3_client.put_object.assert_called_with(
             Bucket=self.aws_bucket,
@@ -367,6 +400,59 @@ class TestSyncS3(unittest.TestCase):
             ContentLength=0,
             ContentType='test/blob')
 
+    @mock.patch('s3_sync.sync_s3.boto3.session.Session')
+    def test_shared_client_pool(self, mock_session):
+        registry = base_sync.ClientPoolRegistry()
+        settings = {'aws_bucket': 'bucket',
+                    'aws_identity': 'id',
+                    'aws_secret': 'key',
+                    'account': 'account',
+                    'encryption': False}
+
+        def _provider(**kwargs):
+            provider_settings = dict(settings, container='container')
+            provider_settings.update(kwargs)
+            return SyncS3(provider_settings, max_conns=5,
+                          client_pools=registry)
+
+        providers = [_provider(container=c) for c in ('foo', 'bar')]
+        self.assertIs(providers[0].client_pool, providers[1].client_pool)
+        self.assertEqual(providers[0].client_pool_key,
+                         providers[1].client_pool_key)
+        self.assertEqual(1, mock_session.call_count)
+        # Each of the mappings adds its connections to the shared pool
+        self.assertEqual(10, providers[0].client_pool.free_count())
+        self.assertEqual(10, providers[0].client_pool.pool_size)
+        # The encryption setting does not depend on the client factory
+        self.assertFalse(providers[1].encryption)
+
+        with providers[0].client_pool.get_client():
+            self.assertEqual(9, providers[1].client_pool.free_count())
+        # The shared clients are not closed with a provider
+        providers[0].close()
+        self.assertEqual(10, providers[1].client_pool.free_count())
+
+        # The containers of a per-account mapping are a single mapping
+        per_account = [
+            SyncS3(dict(settings, aws_bucket='account', container=c),
+                   max_conns=5, per_account=True, client_pools=registry)
+            for c in ('foo', 'bar')]
+        self.assertIs(per_account[0].client_pool, per_account[1].client_pool)
+        self.assertEqual(5, per_account[0].client_pool.free_count())
+
+        for kwargs in ({'aws_bucket': 'other'}, {'aws_secret': 'other'},
+                       {'aws_session_token': 'token'}):
+            provider = _provider(**kwargs)
+            self.assertIsNot(providers[0].client_pool, provider.client_pool)
+            self.assertNotEqual(providers[0].client_pool_key,
+                                provider.client_pool_key)
+
+        capped = _provider(aws_bucket='capped', destination_max_conns=2)
+        self.assertEqual(2, capped.client_pool.free_count())
+        # The pool with a set size does not grow with the mappings
+        _provider(aws_bucket='capped', container='other')
+        self.assertEqual(2, capped.client_pool.free_count())
+
     @mock.patch('s3_sync.sync_s3.boto3.session.Session')
     def test_encryption_option(self, mock_session):
         sync_s3 = SyncS3({'aws_bucket': 'bucket',
@@ -402,7 +488,8 @@ class TestSyncS3(unittest.TestCase):
         mock_file_wrapper.assert_called_with(mock_ic,
                                              self.sync_s3.account,
                                              self.sync_s3.container,
-                                             key, swift_req_headers)
+                                             key, swift_req_headers,
+                                             limiters=[])
 
         self.mock_boto3_client.put_object.assert_called_with(
             Bucket=self.aws_bucket,
@@ -524,7 +611,8 @@ class TestSyncS3(unittest.TestCase):
         mock_file_wrapper.assert_called_with(mock_ic,
                                              self.sync_s3.account,
                                              self.sync_s3.container,
-                                             key, swift_req_headers)
+                                             key, swift_req_headers,
+                                             limiters=[])
 
         self.mock_boto3_client.put_object.assert_called_with(
             Bucket=self.aws_bucket,
@@ -1468,6 +1556,15 @@ class TestSyncS3(unittest.TestCase):
             self.assertEqual(
                 self.max_conns, self.sync_s3.client_pool.free_count())
 
+    def test_presign_object(self):
+        self.mock_boto3_client.generate_presigned_url.return_value = 'url'
+        self.assertEqual('url', self.sync_s3.presign_object('key', 60))
+        self.mock_boto3_client.generate_presigned_url.assert_called_once_with(
+            'get_object',
+            Params={'Bucket': self.aws_bucket,
+                    'Key': self.sync_s3.get_s3_name('key')},
+            ExpiresIn=60)
+
     def test_shunt_object_includes_some_client_headers(self):
         key = 'key'
         body = 'some content'
@@ -66,6 +66,23 @@ class TestSyncSwift(unittest.TestCase):
         }
         self.sync_swift = SyncSwift(self.mapping, max_conns=self.max_conns)
 
+    @mock.patch('s3_sync.sync_swift.time.time', return_value=1000)
+    @mock.patch('s3_sync.sync_swift.swiftclient.client.Connection')
+    def test_presign_object(self, mock_swift, mock_time):
+        with self.assertRaises(ValueError):
+            self.sync_swift.presign_object('key', 60)
+
+        self.mapping['remote_temp_url_key'] = u'secret'
+        sync_swift = SyncSwift(self.mapping, max_conns=self.max_conns)
+        mock_swift.return_value.url = 'https://swift.url/v1/AUTH_remote'
+        url = sync_swift.presign_object(u'k\u00e9y o', 60)
+        path = '/v1/AUTH_remote/container/k\xc3\xa9y o'
+        expected = swiftclient.utils.generate_temp_url(
+            path, 1060, 'secret', 'GET', absolute=True)
+        self.assertEqual(
+            'https://swift.url/v1/AUTH_remote/container/k%C3%A9y%20o?' +
+            expected.split('?', 1)[1], url)
+
     @mock.patch('s3_sync.sync_swift.swiftclient.client.Connection')
     def test_put_object(self, mock_swift):
         key = 'key'
@@ -176,7 +193,8 @@ class TestSyncSwift(unittest.TestCase):
         mock_file_wrapper.assert_called_with(mock_ic,
                                              self.sync_swift.account,
                                              self.sync_swift.container,
-                                             key, swift_req_headers)
+                                             key, swift_req_headers,
+                                             limiters=[])
 
         swift_client.put_object.assert_called_with(
             self.aws_bucket, key, wrapper,
@@ -212,7 +230,8 @@ class TestSyncSwift(unittest.TestCase):
         mock_file_wrapper.assert_called_with(mock_ic,
                                              self.sync_swift.account,
                                              self.sync_swift.container,
-                                             key, swift_req_headers)
+                                             key, swift_req_headers,
+                                             limiters=[])
 
         swift_client.put_object.assert_called_with(
             self.aws_bucket, key, wrapper, headers={},
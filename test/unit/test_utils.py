@@ -16,7 +16,9 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import datetime
 from itertools import repeat
+import json
 import mock
 import os
 import StringIO
@@ -214,6 +216,162 @@ class TestUtilsFunctions(unittest.TestCase):
             'x-object-transient-sysmeta-' + utils.MIGRATOR_HEADER,
             utils.get_sys_migrator_header('object'))
 
+    def test_parse_list_time(self):
+        def _strptime_us(value):
+            dt = datetime.datetime.strptime(value, utils.SWIFT_TIME_FMT)
+            return utils.datetime_to_us(dt)
+
+        tests = ['1970-01-01T00:00:00.000000',
+                 '1999-12-31T11:59:59.99999',
+                 '2000-01-01T00:00:00.00001',
+                 '2000-02-29T23:59:59.5',
+                 '2018-09-25T21:33:29.123456',
+                 u'2038-01-19T03:14:08.000001']
+        for value in tests:
+            self.assertEqual(_strptime_us(value),
+                             utils.parse_list_time(value))
+        self.assertEqual(1500000000123456, utils.parse_list_time(
+            datetime.datetime.utcfromtimestamp(1500000000.123456).strftime(
+                utils.SWIFT_TIME_FMT)))
+
+        for value in ['2000-01-01 00:00:00.000000',
+                      '2000-01-01T00:00:00',
+                      '2000-01-01T00:00:00.1234567',
+                      '2000-13-01T00:00:00.000000',
+                      'garbage']:
+            with self.assertRaises(ValueError):
+                utils.parse_list_time(value)
+
+    def test_diff_listings(self):
+        def _entry(name, ts, etag='etag'):
+            return {'name': name, 'hash': etag,
+                    'last_modified': datetime.datetime.utcfromtimestamp(
+                        ts).strftime(utils.SWIFT_TIME_FMT)}
+
+        Actions = utils.ListingDiffActions
+        tests = [
+            # local, remote, marker, expected
+            ([], [], '', []),
+            ([_entry('a', 1e9)], [], '', [(Actions.RECONCILE, 'a')]),
+            ([], [_entry('a', 1e9)], '', [(Actions.MIGRATE, 'a')]),
+            ([_entry('a', 1e9)], [_entry('a', 1e9)], '',
+             [(Actions.SKIP, 'a')]),
+            ([_entry('a', 1e9)], [_entry('a', 1e9, 'other')], '',
+             [(Actions.CHECK_ETAG, 'a')]),
+            ([_entry('a', 1e9)], [_entry('a', 1e9 + 1)], '',
+             [(Actions.MIGRATE, 'a')]),
+            ([_entry('a', 1e9 + 1)], [_entry('a', 1e9)], '',
+             [(Actions.SKIP, 'a')]),
+            ([_entry('a', 1e9), _entry('c', 1e9), _entry('e', 1e9)],
+             [_entry('b', 1e9), _entry('c', 1e9), _entry('d', 1e9)], '',
+             [(Actions.RECONCILE, 'a'), (Actions.MIGRATE, 'b'),
+              (Actions.SKIP, 'c'), (Actions.MIGRATE, 'd')]),
+            # The local entries past the last remote key are left alone, as
+            # they will be handled on the next listing page
+            ([_entry('x', 1e9), _entry('z', 1e9)], [_entry('y', 1e9)], '',
+             [(Actions.RECONCILE, 'x'), (Actions.MIGRATE, 'y')]),
+            # ...unless the remote listing is empty
+            ([_entry('x', 1e9), _entry('z', 1e9)], [], 'w',
+             [(Actions.RECONCILE, 'x'), (Actions.RECONCILE, 'z')]),
+        ]
+        for local, remote, marker, expected in tests:
+            result = [
+                (action, entry['name']) for action, entry in
+                utils.diff_listings(iter(local + [None]),
+                                    iter(remote + [None]), marker)]
+            self.assertEqual(expected, result)
+
+    def test_diff_listings_older_than(self):
+        def _entry(name, ts):
+            return {'name': name, 'hash': 'etag',
+                    'last_modified': datetime.datetime.utcfromtimestamp(
+                        ts).strftime(utils.SWIFT_TIME_FMT)}
+
+        now = 1500000000
+        local = [_entry('b', now - 100), None]
+        remote = [_entry('a', now - 31), _entry('b', now - 10),
+                  _entry('c', now - 30), _entry('d', now), None]
+        result = [(action, entry['name']) for action, entry in
+                  utils.diff_listings(iter(local), iter(remote), '',
+                                      older_than=30, now=now)]
+        self.assertEqual([(utils.ListingDiffActions.MIGRATE, 'a'),
+                          (utils.ListingDiffActions.SKIP, 'b'),
+                          (utils.ListingDiffActions.SKIP, 'c'),
+                          (utils.ListingDiffActions.SKIP, 'd')], result)
+
+    def test_iter_json_listing(self):
+        listing = [{'name': u'unicod\xe9', 'bytes': 1},
+                   {'subdir': u'a/'},
+                   {'name': u'[quoted], "name"}', 'bytes': 10}]
+        body = ' ' + json.dumps(listing, ensure_ascii=False).encode(
+            'utf-8') + '\n'
+        # The entries are the same regardless of where the chunks end
+        for chunk_size in (1, 2, 7, len(body)):
+            chunks = [body[i:i + chunk_size]
+                      for i in range(0, len(body), chunk_size)]
+            self.assertEqual(listing, list(utils.iter_json_listing(chunks)))
+        self.assertEqual([], list(utils.iter_json_listing(['[', ']'])))
+
+        for body in (['[{"name": "a"}, {"na'], [], ['{"name": "a"}']):
+            with self.assertRaises(ValueError):
+                list(utils.iter_json_listing(body))
+
+    def test_iter_splice_listing(self):
+        def _remote_iter(names):
+            for name in names:
+                yield {'name': name, 'content_location': ['remote']}, name
+            yield None, None
+
+        local = [{'name': 'b'}, {'name': 'd'}]
+        limit = utils.ListingLimit(3)
+        spliced = utils.iter_splice_listing(
+            iter(local), _remote_iter(['a', 'b', 'c', 'e']), limit)
+        self.assertEqual(10, utils.ListingLimit(10).remaining())
+        self.assertEqual('a', next(spliced)['name'])
+        self.assertEqual(2, limit.remaining())
+        entries = list(spliced)
+        self.assertEqual(['b', 'c'], [entry['name'] for entry in entries])
+        # Duplicates are marked as present in both places
+        self.assertEqual(['remote', 'swift'], entries[0]['content_location'])
+        self.assertTrue(limit.reached())
+        self.assertEqual(
+            ['a', 'b', 'c', 'd', 'e'],
+            [entry['name'] for entry in utils.splice_listing(
+                iter(local), _remote_iter(['a', 'b', 'c', 'e']), 10)])
+
+    def test_iter_listing_response(self):
+        listing = [{'name': 'abc', 'hash': 'ffff', 'bytes': 42,
+                    'content_type': 'type', 'last_modified': 'date'},
+                   {'subdir': u'unicod\xe9/'}]
+        for list_format in ('application/json', 'application/xml',
+                            'text/plain'):
+            for entries in ([], listing):
+                chunks = list(utils.iter_listing_response(
+                    iter(entries), list_format, 'cont'))
+                self.assertEqual(1 if entries else len(chunks), len(chunks))
+                body = ''.join(chunks)
+                if list_format == 'application/json':
+                    self.assertEqual(json.dumps(entries), body)
+                elif list_format == 'text/plain':
+                    self.assertEqual(
+                        '\n'.join(['abc', 'unicod\xc3\xa9/'][:len(entries)]),
+                        body)
+                else:
+                    self.assertEqual(utils.format_xml_listing(
+                        entries, 'container', 'cont', 'object',
+                        ['name', 'content_type', 'hash', 'bytes',
+                         'last_modified', 'subdir']), body)
+
+        # Long listings are returned in several chunks
+        with mock.patch('s3_sync.utils.LISTING_CHUNK_SIZE', 100):
+            chunks = list(utils.iter_container_listing_response(
+                ({'name': 'container%d' % i} for i in range(100)),
+                'application/json', 'acct'))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(
+            [{'name': 'container%d' % i} for i in range(100)],
+            json.loads(''.join(chunks)))
+
 
 class FakeSwift(object):
     def __init__(self, status=200, size=1024, content_length='UNSPECIFIED',
@@ -560,6 +718,23 @@ class TestFileWrapper(unittest.TestCase):
         self.assertTrue(wrapper._swift_stream.raised_stop_iter)
         self.assertEqual(content, recvd_content)
 
+    def test_bandwidth_limiters(self):
+        limiter = mock.Mock()
+        wrapper = utils.FileWrapper(
+            self.mock_swift, 'account', 'container', 'key',
+            limiters=[limiter])
+        chunk_size = self.mock_swift.fake_stream.chunk_size
+        self.assertEqual('A', wrapper.read(1))
+        # Buffered data is only accounted for once
+        self.assertEqual('A' * (chunk_size - 1), wrapper.next())
+        limiter.consume.assert_called_once_with(chunk_size)
+        limiter.reset_mock()
+
+        wrapper.seek(0)
+        self.assertEqual('A' * 1024, wrapper.read())
+        self.assertEqual(1024, sum(args[0] for args, _
+                                   in limiter.consume.call_args_list))
+
 
 class TestSLOFileWrapper(unittest.TestCase):
     def setUp(self):